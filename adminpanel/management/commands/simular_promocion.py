@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from adminpanel.models import Promocion
+from adminpanel.simulador import simular
+
+
+class Command(BaseCommand):
+    help = "Simula el efecto en ingresos de agregar o quitar una promoción sobre el historial de pedidos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('promocion_id', type=int)
+        parser.add_argument('--modo', choices=['agregar', 'quitar'], default=None,
+                            help="Por defecto: 'quitar' si la promo está activa, 'agregar' si no.")
+        parser.add_argument('--meses', type=int, default=3)
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Procesos del pool (1 = sin pool).")
+
+    def handle(self, *args, **opts):
+        try:
+            promocion = Promocion.objects.get(pk=opts['promocion_id'])
+        except Promocion.DoesNotExist:
+            raise CommandError(f"No existe la promoción {opts['promocion_id']}.")
+
+        modo = opts['modo'] or ('quitar' if promocion.activa else 'agregar')
+        resultado = simular(promocion, modo=modo, meses=opts['meses'], workers=opts['workers'])
+
+        self.stdout.write(
+            f"Promoción '{promocion.titulo}' ({modo}), últimos {resultado['meses']} meses "
+            f"desde {resultado['desde']}: {resultado['filas']} líneas en {resultado['segundos']:.2f}s"
+        )
+        self.stdout.write("\nPor categoría:")
+        for fila in resultado['por_categoria']:
+            self.stdout.write(
+                f"  {fila['categoria']:<10} actual ${fila['ingreso_actual']:>12} "
+                f"simulado ${fila['ingreso_simulado']:>12} delta ${fila['delta']:>10}"
+            )
+        self.stdout.write("\nPor producto:")
+        for fila in resultado['por_producto']:
+            self.stdout.write(
+                f"  {fila['nombre'][:30]:<30} x{fila['unidades']:<6} "
+                f"actual ${fila['ingreso_actual']:>10} simulado ${fila['ingreso_simulado']:>10} "
+                f"delta ${fila['delta']:>9}"
+            )
+        self.stdout.write(f"\nDelta total: ${resultado['delta']}")
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0012_precioefectivo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pedido',
+            name='estado',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('pagado', 'Pagado'), ('enviado', 'Enviado'), ('entregado', 'Entregado'), ('rechazado', 'Rechazado'), ('expirado', 'Expirado')], default='pagado', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='ReservaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField()),
+                ('expira', models.DateTimeField(db_index=True)),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='adminpanel.pedido')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='adminpanel.producto')),
+            ],
+        ),
+    ]
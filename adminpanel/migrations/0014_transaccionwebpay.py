@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0013_reservastock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransaccionWebpay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64, unique=True)),
+                ('estado', models.CharField(choices=[('procesando', 'Procesando'), ('aprobado', 'Aprobado'), ('rechazado', 'Rechazado')], default='procesando', max_length=20)),
+                ('respuesta', models.JSONField(blank=True, null=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transacciones_webpay', to='adminpanel.pedido')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0015_pedido_huella_carrito'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['tipo_entrega', '-fecha', '-id'], name='pedido_entrega_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['categoria', 'id'], name='producto_categoria_id'),
+        ),
+        # Listado de clientes (adminpanel.views.clientes): auth_user no es un
+        # modelo propio, así que el índice va en SQL.
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS cliente_staff_alta ON auth_user (is_staff, date_joined, id)',
+            reverse_sql='DROP INDEX IF EXISTS cliente_staff_alta',
+        ),
+    ]
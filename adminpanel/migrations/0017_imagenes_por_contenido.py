@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:45
+
+import tienda.almacenamiento
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0016_indices_paginacion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='producto',
+            name='imagen',
+            field=models.ImageField(blank=True, null=True, storage=tienda.almacenamiento.de_imagenes, upload_to='productos/'),
+        ),
+        migrations.AlterField(
+            model_name='promocion',
+            name='imagen',
+            field=models.ImageField(blank=True, help_text='Imagen opcional para la tarjeta de promoción.', null=True, storage=tienda.almacenamiento.de_imagenes, upload_to='promos/'),
+        ),
+    ]
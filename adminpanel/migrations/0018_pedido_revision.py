@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0017_imagenes_por_contenido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='revision',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
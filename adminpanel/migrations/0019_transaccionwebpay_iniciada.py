@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0018_pedido_revision'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaccionwebpay',
+            name='estado',
+            field=models.CharField(choices=[('iniciada', 'Iniciada'), ('procesando', 'Procesando'), ('aprobado', 'Aprobado'), ('rechazado', 'Rechazado')], default='procesando', max_length=20),
+        ),
+    ]
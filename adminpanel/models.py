@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from tienda.almacenamiento import de_imagenes
+
 
 class Producto(models.Model):
     CATEGORIAS = [
@@ -19,6 +21,7 @@ class Producto(models.Model):
     )
     imagen = models.ImageField(
         upload_to='productos/',
+        storage=de_imagenes,
         null=True,
         blank=True
     )
@@ -28,6 +31,12 @@ class Producto(models.Model):
         help_text="Mostrar en inicio"
     )
 
+    class Meta:
+        indexes = [
+            # Listado por categoría del panel, paginado por id (tienda.paginacion)
+            models.Index(fields=['categoria', 'id'], name='producto_categoria_id'),
+        ]
+
     def __str__(self):
         return self.nombre
 
@@ -73,6 +82,7 @@ class Promocion(models.Model):
 
     imagen = models.ImageField(
         upload_to='promos/',
+        storage=de_imagenes,
         blank=True,
         null=True,
         help_text="Imagen opcional para la tarjeta de promoción."
@@ -153,12 +163,44 @@ class Promocion(models.Model):
     def __str__(self):
         return self.titulo
 
+
+class PrecioEfectivo(models.Model):
+    """
+    Precio efectivo precalculado de un producto para un día: la mejor
+    promo vigente y el precio unitario resultante.
+    Lo mantiene tienda.precios_efectivos (señales + comando refrescar_precios).
+    """
+    producto = models.ForeignKey(
+        Producto,
+        related_name='precios_efectivos',
+        on_delete=models.CASCADE
+    )
+    fecha = models.DateField()
+    promocion = models.ForeignKey(
+        Promocion,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True
+    )
+    precio_unitario = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'producto'], name='precio_efectivo_fecha_producto'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id} @ {self.fecha}: {self.precio_unitario}"
+
+
 class Pedido(models.Model):
     ESTADOS = [
         ('pendiente', 'Pendiente'),
         ('pagado', 'Pagado'),
         ('enviado', 'Enviado'),
         ('entregado', 'Entregado'),
+        ('rechazado', 'Rechazado'),
+        ('expirado', 'Expirado'),
     ]
     TIPOS_ENTREGA = [
         ('retiro', 'Retiro en tienda'),
@@ -184,6 +226,21 @@ class Pedido(models.Model):
         blank=True,
         null=True
     )
+    # Huella del carrito (tienda.cotizaciones.huella_carrito) con que se
+    # abrió el pago; permite reutilizar el pedido pendiente si se repite
+    # webpay_iniciar con el mismo carrito.
+    huella_carrito = models.CharField(max_length=40, blank=True, default='')
+    # Motivo por el que el pedido necesita que el personal lo revise (p. ej.
+    # se pagó sin stock suficiente); vacío si no hay nada que revisar.
+    revision = models.CharField(max_length=255, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['usuario', 'estado', 'huella_carrito'], name='pedido_usuario_estado_huella'),
+            models.Index(fields=['estado', 'fecha'], name='pedido_estado_fecha'),
+            # pedidos_view: retiro / despacho del más nuevo al más antiguo
+            models.Index(fields=['tipo_entrega', '-fecha', '-id'], name='pedido_entrega_fecha'),
+        ]
 
     def __str__(self):
         return f"Pedido {self.id} - {self.usuario.username}"
@@ -203,6 +260,57 @@ class DetallePedido(models.Model):
         return self.cantidad * self.precio_unitario
 
 
+class ReservaStock(models.Model):
+    """
+    Unidades apartadas para un pedido mientras el cliente paga en Webpay.
+    El stock ya está descontado en Producto; si el pago no se completa
+    antes de `expira`, el comando expirar_pedidos lo devuelve.
+    """
+    pedido = models.ForeignKey(
+        Pedido,
+        related_name='reservas',
+        on_delete=models.CASCADE
+    )
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
+    cantidad = models.PositiveIntegerField()
+    expira = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Pedido {self.pedido_id}: {self.cantidad} x {self.producto_id}"
+
+
+class TransaccionWebpay(models.Model):
+    """
+    Resultado del retorno de Webpay por token_ws. Si el navegador repite
+    el retorno (recarga, reintento), se responde desde aquí sin volver a
+    llamar a Transbank ni cerrar el pedido otra vez.
+
+    El token se registra como 'iniciada' apenas Transbank lo entrega en
+    webpay_iniciar: un pedido con token ya no se reutiliza para otro pago
+    (tienda.pedidos.abrir_pedido).
+    """
+    ESTADOS = [
+        ('iniciada', 'Iniciada'),
+        ('procesando', 'Procesando'),
+        ('aprobado', 'Aprobado'),
+        ('rechazado', 'Rechazado'),
+    ]
+
+    token = models.CharField(max_length=64, unique=True)
+    pedido = models.ForeignKey(
+        Pedido,
+        related_name='transacciones_webpay',
+        on_delete=models.CASCADE
+    )
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='procesando')
+    respuesta = models.JSONField(null=True, blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Pedido {self.pedido_id}: {self.estado}"
+
+
 class Pastel(models.Model):
     id_pasteles = models.AutoField(primary_key=True)
     nombre = models.CharField(max_length=20)
@@ -0,0 +1,274 @@
+"""
+Simulador "¿qué hubiera pasado?" para promociones.
+
+Vuelve a cotizar el historial de DetallePedido con las reglas de
+tienda.precios en dos escenarios: las promociones tal como están hoy,
+y las mismas agregando o quitando una promoción candidata. Reporta la
+diferencia de ingresos por producto y por categoría.
+
+Supuestos del replay:
+  - el precio base de cada línea es el precio actual del producto
+  - una promo aplica a un pedido si su ventana activo_desde/activo_hasta
+    cubre la fecha local del pedido (el flag `activa` es el de hoy)
+  - 'hasta agotar stock' se evalúa con el stock actual
+
+Las filas se leen en streaming con .iterator() y los bloques se
+reparten en un pool de procesos, con pocos bloques en vuelo a la vez. Los workers no usan el ORM: reciben
+productos y promos como tuplas simples.
+"""
+import os
+import time
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from tienda import precios
+from .models import Producto, Promocion, Pedido, DetallePedido
+
+
+ESTADOS_VENDIDOS = ('pagado', 'enviado', 'entregado')
+
+PromoPlana = namedtuple('PromoPlana', [
+    'id', 'tipo', 'porcentaje', 'porcentaje_segunda_unidad', 'etiqueta', 'titulo',
+    'producto_id', 'categoria_objetivo', 'enlace_categoria',
+    'desde', 'hasta', 'agotada',
+])
+
+# Estado de cada worker (se carga una vez con el initializer del pool)
+_productos = None
+_candidatas = None
+
+
+def _plana(promo, stock_por_producto, promo_id=None):
+    return PromoPlana(
+        id=promo_id if promo_id is not None else promo.id,
+        tipo=promo.tipo,
+        porcentaje=promo.porcentaje,
+        porcentaje_segunda_unidad=promo.porcentaje_segunda_unidad,
+        etiqueta=promo.etiqueta,
+        titulo=promo.titulo,
+        producto_id=promo.producto_id,
+        categoria_objetivo=promo.categoria_objetivo,
+        enlace_categoria=promo.enlace_categoria,
+        desde=promo.activo_desde.toordinal() if promo.activo_desde else None,
+        hasta=promo.activo_hasta.toordinal() if promo.activo_hasta else None,
+        agotada=bool(
+            promo.hasta_agotar_stock
+            and promo.producto_id
+            and stock_por_producto.get(promo.producto_id, 0) <= 0
+        ),
+    )
+
+
+def _candidatas_por_producto(productos, promos):
+    """producto_id -> promos que podrían aplicarle (sin mirar fechas), por id."""
+    candidatas = {}
+    for producto_id, (_precio, categoria) in productos.items():
+        candidatas[producto_id] = [
+            promo for promo in promos
+            if not promo.agotada and (
+                promo.producto_id == producto_id
+                or promo.categoria_objetivo in (categoria, 'all')
+                or promo.enlace_categoria == categoria
+            )
+        ]
+    return candidatas
+
+
+def _elegir(candidatas, dia):
+    for promo in candidatas:
+        if promo.desde is not None and dia < promo.desde:
+            continue
+        if promo.hasta is not None and dia > promo.hasta:
+            continue
+        return promo
+    return None
+
+
+def _iniciar_worker(productos, candidatas_actual, candidatas_simulado):
+    global _productos, _candidatas
+    _productos = productos
+    _candidatas = (candidatas_actual, candidatas_simulado)
+
+
+def _replay_bloque(filas):
+    """
+    Cotiza un bloque de filas (dia_ordinal, producto_id, cantidad) en ambos
+    escenarios. Devuelve producto_id -> [unidades, ingreso_actual, ingreso_simulado].
+    """
+    actual, simulado = _candidatas
+    acumulado = defaultdict(lambda: [0, 0, 0])
+
+    # Las líneas repetidas (mismo día, producto y cantidad) se cotizan una vez
+    for (dia, producto_id, cantidad), veces in Counter(filas).items():
+        datos = _productos.get(producto_id)
+        if datos is None:
+            continue
+        precio = datos[0]
+
+        promo_a = _elegir(actual[producto_id], dia)
+        promo_b = _elegir(simulado[producto_id], dia)
+        linea_a = precios.cotizar_linea(producto_id, precio, cantidad, promo_a)
+        if promo_b is promo_a:
+            linea_b = linea_a
+        else:
+            linea_b = precios.cotizar_linea(producto_id, precio, cantidad, promo_b)
+
+        fila = acumulado[producto_id]
+        fila[0] += cantidad * veces
+        fila[1] += linea_a['subtotal'] * veces
+        fila[2] += linea_b['subtotal'] * veces
+
+    return dict(acumulado)
+
+
+def _bloques(iterable, tamano):
+    bloque = []
+    for fila in iterable:
+        bloque.append(fila)
+        if len(bloque) >= tamano:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def simular(promocion, modo='agregar', meses=3, workers=None, tamano_bloque=50000):
+    """
+    Simula el efecto de agregar (`modo='agregar'`) o quitar (`modo='quitar'`)
+    `promocion` sobre los últimos `meses` de ventas.
+
+    `promocion` puede ser una instancia sin guardar (por ejemplo, el
+    resultado de PromocionForm.save(commit=False)).
+    """
+    inicio = time.perf_counter()
+    desde = timezone.localdate() - timedelta(days=30 * meses)
+
+    filas_productos = Producto.objects.values_list('id', 'precio', 'categoria', 'stock')
+    productos = {}
+    stock = {}
+    for producto_id, precio, categoria, stock_actual in filas_productos:
+        productos[producto_id] = (precio, categoria)
+        stock[producto_id] = stock_actual
+
+    actuales = [
+        _plana(promo, stock)
+        for promo in Promocion.objects.filter(activa=True).order_by('id')
+        if promo.pk != promocion.pk
+    ]
+
+    if modo == 'quitar':
+        promos_actual = list(actuales)
+        if promocion.pk and promocion.activa:
+            promos_actual.append(_plana(promocion, stock))
+            promos_actual.sort(key=lambda promo: promo.id)
+        promos_simulado = actuales
+    else:
+        promos_actual = actuales
+        # Una promo nueva queda al final en la prioridad (id más alto)
+        promo_id = promocion.pk or (max((p.id for p in actuales), default=0) + 1)
+        promos_simulado = sorted(actuales + [_plana(promocion, stock, promo_id)], key=lambda p: p.id)
+
+    candidatas_actual = _candidatas_por_producto(productos, promos_actual)
+    candidatas_simulado = _candidatas_por_producto(productos, promos_simulado)
+
+    # Fecha local de cada pedido: se calcula en Python una vez por pedido,
+    # no por línea (las funciones de fecha de SQLite son lentas).
+    inicio_periodo = timezone.make_aware(datetime.combine(desde, datetime.min.time()))
+    pedidos = Pedido.objects.filter(estado__in=ESTADOS_VENDIDOS, fecha__gte=inicio_periodo)
+    dia_pedido = {
+        pedido_id: timezone.localtime(fecha).date().toordinal()
+        for pedido_id, fecha in pedidos.values_list('id', 'fecha').iterator(chunk_size=tamano_bloque)
+    }
+
+    filas = (
+        DetallePedido.objects
+        .filter(pedido__estado__in=ESTADOS_VENDIDOS, pedido__fecha__gte=inicio_periodo)
+        .values_list('pedido_id', 'producto_id', 'cantidad')
+        .iterator(chunk_size=tamano_bloque)
+    )
+    filas = (
+        (dia_pedido[pedido_id], producto_id, cantidad)
+        for pedido_id, producto_id, cantidad in filas
+        if pedido_id in dia_pedido
+    )
+
+    totales = defaultdict(lambda: [0, 0, 0])
+    n_filas = 0
+
+    def _acumular(parcial):
+        for producto_id, (unidades, ingreso_a, ingreso_b) in parcial.items():
+            fila = totales[producto_id]
+            fila[0] += unidades
+            fila[1] += ingreso_a
+            fila[2] += ingreso_b
+
+    if workers == 1:
+        _iniciar_worker(productos, candidatas_actual, candidatas_simulado)
+        for bloque in _bloques(filas, tamano_bloque):
+            n_filas += len(bloque)
+            _acumular(_replay_bloque(bloque))
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_iniciar_worker,
+            initargs=(productos, candidatas_actual, candidatas_simulado),
+        ) as pool:
+            # Como mucho 2 bloques por worker en vuelo: la lectura del
+            # iterator espera a que se libere uno, así la memoria no crece
+            # con el historial.
+            en_vuelo = set()
+            for bloque in _bloques(filas, tamano_bloque):
+                n_filas += len(bloque)
+                if len(en_vuelo) >= workers * 2:
+                    listos, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                    for futuro in listos:
+                        _acumular(futuro.result())
+                en_vuelo.add(pool.submit(_replay_bloque, bloque))
+            for futuro in en_vuelo:
+                _acumular(futuro.result())
+
+    nombres = dict(Producto.objects.filter(id__in=totales).values_list('id', 'nombre'))
+    por_producto = []
+    por_categoria = defaultdict(lambda: {'unidades': 0, 'ingreso_actual': 0, 'ingreso_simulado': 0})
+
+    for producto_id, (unidades, ingreso_a, ingreso_b) in totales.items():
+        categoria = productos[producto_id][1]
+        por_producto.append({
+            'producto_id': producto_id,
+            'nombre': nombres.get(producto_id, ''),
+            'categoria': categoria,
+            'unidades': unidades,
+            'ingreso_actual': ingreso_a,
+            'ingreso_simulado': ingreso_b,
+            'delta': ingreso_b - ingreso_a,
+        })
+        cat = por_categoria[categoria]
+        cat['unidades'] += unidades
+        cat['ingreso_actual'] += ingreso_a
+        cat['ingreso_simulado'] += ingreso_b
+
+    por_producto.sort(key=lambda fila: fila['delta'])
+    categorias = [
+        dict(categoria=categoria, delta=datos['ingreso_simulado'] - datos['ingreso_actual'], **datos)
+        for categoria, datos in sorted(por_categoria.items())
+    ]
+
+    ingreso_actual = sum(fila['ingreso_actual'] for fila in por_producto)
+    ingreso_simulado = sum(fila['ingreso_simulado'] for fila in por_producto)
+
+    return {
+        'modo': modo,
+        'meses': meses,
+        'desde': desde,
+        'filas': n_filas,
+        'por_producto': por_producto,
+        'por_categoria': categorias,
+        'ingreso_actual': ingreso_actual,
+        'ingreso_simulado': ingreso_simulado,
+        'delta': ingreso_simulado - ingreso_actual,
+        'segundos': time.perf_counter() - inicio,
+    }
@@ -17,4 +17,6 @@ urlpatterns = [
     path('productos/editar/<int:pk>/', views.editar_producto, name='editar_producto'),
     path('promociones/editar/<int:pk>/', views.editar_promocion, name='editar_promocion'),
     path('promociones/eliminar/<int:pk>/', views.eliminar_promocion, name='eliminar_promocion'),
+    path('promociones/simular/<int:pk>/', views.simular_promocion, name='simular_promocion'),
+    path('metricas/', views.metricas, name='metricas'),
 ]
\ No newline at end of file
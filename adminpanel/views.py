@@ -3,10 +3,12 @@ import json
 from django.shortcuts import render, redirect, get_object_or_404
 from .models import Producto, Promocion, Pedido, DetallePedido
 from .forms import ProductoForm, PromocionForm
+from .simulador import simular
+from tienda import cotizaciones, paginacion, webpay
 from django.contrib import messages
 from django.db.models import Sum, Count, F, Q
 from django.utils.dateparse import parse_date
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.template.loader import get_template
 from xhtml2pdf import pisa
 from django.contrib.auth.models import User
@@ -18,6 +20,13 @@ from datetime import timedelta
 import json
 from datetime import timedelta
 
+# Filas por página en los listados (paginación por cursor, tienda.paginacion)
+POR_PAGINA = 50
+
+# Historial máximo que la vista del simulador recorre dentro del request;
+# para períodos más largos está `manage.py simular_promocion --workers N`
+SIMULACION_MESES_MAX = 12
+
 
 @staff_member_required
 def panel_home(request):
@@ -48,7 +57,7 @@ def dashboard(request):
     )
 
     ventas_labels = [item['fecha__date'].strftime("%d-%m") for item in ventas_qs]
-    ventas_data = [float(item['total_dia']) for item in ventas_qs]
+    ventas_data = [item['total_dia'] for item in ventas_qs]
 
     # Top productos últimos 30 días
     top_productos_qs = (
@@ -245,7 +254,7 @@ def descargar_reporte_excel(request):
 
 @staff_member_required
 def pedidos_view(request):
-    todos_pedidos = Pedido.objects.select_related('usuario').prefetch_related('detalles__producto').all().order_by('-fecha')
+    todos_pedidos = Pedido.objects.select_related('usuario').prefetch_related('detalles__producto')
 
     fecha_desde = request.GET.get('fecha_desde')
     fecha_hasta = request.GET.get('fecha_hasta')
@@ -259,8 +268,15 @@ def pedidos_view(request):
         if fecha_h:
              todos_pedidos = todos_pedidos.filter(fecha__date__lte=fecha_h)
 
-    pedidos_retiro = todos_pedidos.filter(tipo_entrega='retiro')
-    pedidos_despacho = todos_pedidos.filter(tipo_entrega='despacho')
+    # Cada pestaña se pagina por separado (retiro_desde, despacho_desde, ...)
+    pedidos_retiro = paginacion.paginar(
+        request, todos_pedidos.filter(tipo_entrega='retiro'), ('-fecha', '-id'), POR_PAGINA,
+        prefijo='retiro_', extra={'tab': 'retiro'},
+    )
+    pedidos_despacho = paginacion.paginar(
+        request, todos_pedidos.filter(tipo_entrega='despacho'), ('-fecha', '-id'), POR_PAGINA,
+        prefijo='despacho_', extra={'tab': 'despacho'},
+    )
 
     context = {
         "pedidos_retiro": pedidos_retiro,
@@ -276,7 +292,7 @@ def pedidos_view(request):
 def clientes(request):
     clientes_qs = User.objects.filter(is_staff=False).select_related('perfil').annotate(
         total_pedidos=Count('pedido') 
-    ).order_by('-date_joined')
+    )
 
     query = request.GET.get('q', '').strip()
     if query:
@@ -288,7 +304,7 @@ def clientes(request):
         )
 
     return render(request, 'adminpanel/clientes.html', {
-        'clientes': clientes_qs,
+        'clientes': paginacion.paginar(request, clientes_qs, ('-date_joined', '-id'), POR_PAGINA),
         'query': query
     })
 
@@ -305,12 +321,22 @@ def productos(request):
     else:
         form = ProductoForm()
 
-    productos_bd = Producto.objects.all()
     categorias = ['vitrina', 'tortas', 'postres'] 
+    active_tab = request.GET.get('tab', categorias[0])
+
+    # Una página por categoría (pestaña), con parámetros propios
+    secciones = [
+        (categoria, paginacion.paginar(
+            request, Producto.objects.filter(categoria=categoria), ('id',), POR_PAGINA,
+            prefijo=f'{categoria}_', extra={'tab': categoria},
+        ))
+        for categoria in categorias
+    ]
 
     ctx = {
-        'productos': productos_bd,
+        'secciones': secciones,
         'categorias': categorias,
+        'active_tab': active_tab,
         'form': form
     }
     return render(request, 'adminpanel/productos.html', ctx)
@@ -353,7 +379,7 @@ def promociones(request):
     else:
         form = PromocionForm()
 
-    promociones_bd = Promocion.objects.all()
+    promociones_bd = paginacion.paginar(request, Promocion.objects.all(), ('id',), POR_PAGINA)
 
     ctx = {
         'promociones': promociones_bd,
@@ -381,4 +407,38 @@ def eliminar_promocion(request, pk):
     if request.method == 'POST':
         promocion.delete()
         messages.success(request, 'Promoción eliminada.')
-    return redirect('adminpanel:promociones') 
\ No newline at end of file
+    return redirect('adminpanel:promociones')
+
+
+@staff_member_required
+def simular_promocion(request, pk):
+    """Efecto en ingresos de agregar/quitar la promoción sobre los últimos N meses."""
+    promocion = get_object_or_404(Promocion, pk=pk)
+
+    try:
+        meses = min(max(1, int(request.GET.get('meses', 3))), SIMULACION_MESES_MAX)
+    except ValueError:
+        meses = 3
+    modo = request.GET.get('modo')
+    if modo not in ('agregar', 'quitar'):
+        modo = 'quitar' if promocion.activa else 'agregar'
+
+    # En el mismo proceso: un pool de procesos no tiene cabida en un request
+    resultado = simular(promocion, modo=modo, meses=meses, workers=1)
+
+    return render(request, 'adminpanel/promocion_simular.html', {
+        'promocion': promocion,
+        'resultado': resultado,
+        'meses': meses,
+        'meses_max': SIMULACION_MESES_MAX,
+        'modo': modo,
+    })
+
+
+@staff_member_required
+def metricas(request):
+    """Contadores internos en JSON (para scraping / monitoreo)."""
+    return JsonResponse({
+        'cotizaciones': cotizaciones.estadisticas(),
+        'webpay': {'circuito_abierto': webpay.get_cliente().circuito.abierto},
+    })
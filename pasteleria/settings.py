@@ -17,6 +17,13 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    # Imágenes de Producto y Promocion, un archivo por contenido (tienda.almacenamiento)
+    'imagenes': {'BACKEND': 'tienda.almacenamiento.AlmacenamientoPorContenido'},
+}
+
 SECRET_KEY = 'django-insecure-1)^0jrk3+-=y3^htm4-lda*e3q7(ze9(askuf(t)!o$^4^iga5'
 DEBUG = True
 ALLOWED_HOSTS = []
@@ -34,6 +41,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'tienda.middleware.cookie_carrito',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -55,6 +63,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'tienda.context_processors.carrito',
             ],
         },
     },
@@ -85,6 +94,28 @@ DATABASES = {
     }
 }
 
+# ===============================
+#   CACHÉ Y SESIONES
+# ===============================
+# LocMemCache es el reemplazo local; en producción se puede apuntar a
+# redis/memcached con CACHE_BACKEND y CACHE_LOCATION.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'pasteleria'),
+    },
+    # Fragmentos HTML del catálogo (tienda.catalogo); se invalidan por versión
+    'catalogo': {
+        'BACKEND': os.environ.get('CATALOGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CATALOGO_CACHE_LOCATION', 'pasteleria-catalogo'),
+    },
+}
+
+# cached_db lee las sesiones desde la caché y solo escribe en la BD al
+# modificarlas; 'django.contrib.sessions.backends.cache' evita la BD por
+# completo (requiere una caché compartida si hay varios procesos).
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -111,3 +142,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 WEBPAY_PLUS_COMMERCE_CODE = "597055555532"   
 WEBPAY_PLUS_API_KEY = "579B532A7440BB0C9079DED94D31EA1615BACEB56610332264630D42D0A36B1C" 
 WEBPAY_PLUS_ENVIRONMENT = "INTEGRATION"
+
+# Host de la API (vacío = el de Transbank según el ambiente). Para pruebas
+# locales: manage.py webpay_falso y WEBPAY_PLUS_HOST=http://127.0.0.1:8765
+WEBPAY_PLUS_HOST = os.environ.get('WEBPAY_PLUS_HOST', '')
+WEBPAY_TIMEOUT_CONEXION = 3.05
+WEBPAY_TIMEOUT_LECTURA = 15
+WEBPAY_CIRCUITO_FALLOS = 5
+WEBPAY_CIRCUITO_ESPERA = 30
+# Pagar por las vistas async (tienda.views_async); requiere servir con ASGI
+# y aiohttp instalado (no es dependencia del flujo sync)
+WEBPAY_ASYNC = os.environ.get('WEBPAY_ASYNC', '') == '1'
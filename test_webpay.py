@@ -1,21 +1,51 @@
-from transbank.webpay.webpay_plus.transaction import Transaction
-from transbank.common.options import WebpayOptions
-
-options = WebpayOptions(
-    commerce_code="597055555532",
-    api_key="579B532A489C3DEB43A96A9E0A1604A7",
-    integration_type="INTEGRATION"
-)
-
-tx = Transaction(options)
-
-try:
-    response = tx.create(
-        buy_order="test123",
-        session_id="testsession",
-        amount=1000,
-        return_url="http://localhost:8000/webpay/retorno/"
-    )
-    print(response)
-except Exception as e:
-    print("ERROR:", e)
\ No newline at end of file
+"""
+Prueba rápida del cliente Webpay (tienda.webpay) contra el servidor falso
+(tienda.webpay_falso), sin depender del ambiente de integración.
+
+    python test_webpay.py                  # levanta el Webpay falso local
+    python test_webpay.py https://webpay3gint.transbank.cl   # integración real
+"""
+import sys
+
+from tienda.webpay import ClienteWebpay
+from tienda.webpay_falso import ServidorWebpayFalso
+
+COMMERCE_CODE = "597055555532"
+API_KEY = "579B532A7440BB0C9079DED94D31EA1615BACEB56610332264630D42D0A36B1C"
+
+def main(argv):
+    servidor = None
+    if len(argv) > 1:
+        host = argv[1]
+    else:
+        servidor = ServidorWebpayFalso()
+        host = servidor.iniciar()
+
+    tx = ClienteWebpay(COMMERCE_CODE, API_KEY, host, timeout=(3.05, 10))
+
+    try:
+        response = tx.create(
+            buy_order="test123",
+            session_id="testsession",
+            amount=1000,
+            return_url="http://localhost:8000/webpay/retorno/"
+        )
+        print("create:", response)
+
+        if servidor is not None:
+            token = response["token"]
+            print("commit:", tx.commit(token))
+            print("status:", tx.status(token))
+            try:
+                tx.commit(token)
+            except Exception as e:
+                print("commit repetido (esperado):", e.message)
+    except Exception as e:
+        print("ERROR:", e)
+    finally:
+        if servidor is not None:
+            servidor.detener()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
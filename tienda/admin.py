@@ -1,2 +1,17 @@
 from django.contrib import admin
 
+from .models import CorreoPendiente, ImagenPendiente
+
+
+@admin.register(CorreoPendiente)
+class CorreoPendienteAdmin(admin.ModelAdmin):
+    list_display = ('asunto', 'estado', 'intentos', 'proximo_intento', 'creado', 'enviado')
+    list_filter = ('estado',)
+    search_fields = ('asunto',)
+
+
+@admin.register(ImagenPendiente)
+class ImagenPendienteAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'estado', 'anchos', 'intentos', 'creada', 'procesada')
+    list_filter = ('estado',)
+    search_fields = ('nombre',)
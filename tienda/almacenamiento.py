@@ -0,0 +1,72 @@
+"""
+Almacenamiento por contenido para las imágenes de Producto y Promocion.
+
+Cada archivo subido se guarda una sola vez, con el SHA-256 de su contenido
+como nombre:
+
+    blobs/3f/3f9a...c2.jpg
+
+Subir de nuevo la misma imagen (o usarla en otro producto o promoción)
+no escribe nada: el campo queda apuntando al blob que ya existía. Por eso
+un blob no se borra al reemplazar o eliminar la imagen de un registro;
+`manage.py limpiar_blobs` borra los que ya ningún campo referencia (e
+importa al almacén las imágenes subidas antes de usarlo).
+
+Los nombres que ya están dentro de blobs/ se guardan tal cual: así se
+escriben junto al blob sus versiones reducidas (tienda.imagenes).
+
+Se configura como STORAGES['imagenes'] y los ImageField lo usan con
+storage=de_imagenes.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, storages
+
+
+class AlmacenamientoPorContenido(FileSystemStorage):
+    def __init__(self, prefijo='blobs', **kwargs):
+        # Dos subidas simultáneas del mismo archivo escriben los mismos bytes
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+        self.prefijo = prefijo
+
+    def es_blob(self, nombre):
+        return nombre.startswith(self.prefijo + '/')
+
+    def digesto(self, nombre):
+        """Digesto del blob al que pertenece `nombre` (el blob o una de sus derivadas)."""
+        return posixpath.basename(nombre).split('.', 1)[0]
+
+    def nombre_blob(self, digesto, extension):
+        return f'{self.prefijo}/{digesto[:2]}/{digesto}{extension.lower()}'
+
+    def calcular_digesto(self, content):
+        sha = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for trozo in content.chunks():
+            sha.update(trozo)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return sha.hexdigest()
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not self.es_blob(name):
+            if not hasattr(content, 'chunks'):
+                content = File(content, name)
+            name = self.nombre_blob(self.calcular_digesto(content), posixpath.splitext(name)[1])
+            if self.exists(name):
+                # Se renueva la fecha para que limpiar_blobs no lo tome por
+                # huérfano antes de que se guarde el registro que lo usa
+                os.utime(self.path(name))
+                return name
+        return super().save(name, content, max_length)
+
+
+def de_imagenes():
+    return storages['imagenes']
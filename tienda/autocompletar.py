@@ -0,0 +1,114 @@
+"""
+Índice en memoria para autocompletar la búsqueda (api_buscar_sugerencias).
+
+Un trie por proceso con los nombres de producto en minúsculas y sin tildes.
+Cada nombre se inserta desde el inicio de cada palabra ("Pie de limón"
+responde a "pie", "de l" y "limo"), y cada nodo guarda ya ordenados los
+TIENDA_AUTOCOMPLETAR_MAX productos más vendidos bajo ese prefijo, así que
+una consulta solo recorre tantos nodos como letras tiene el prefijo.
+
+Se reconstruye cuando:
+  - se guarda o elimina un Producto (ver tienda/signals.py); la versión se
+    publica en la caché de Django, como en tienda.promociones
+  - pasan TIENDA_AUTOCOMPLETAR_TTL segundos, para refrescar la popularidad
+    (unidades vendidas en pedidos pagados)
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Sum
+
+from adminpanel.models import Producto
+from .busqueda import terminos
+
+
+CLAVE_VERSION = 'tienda:autocompletar:version'
+
+_lock = threading.Lock()
+_indice = None
+
+
+class _Nodo:
+    __slots__ = ('hijos', 'mejores')
+
+    def __init__(self):
+        self.hijos = {}
+        self.mejores = []
+
+
+class IndiceAutocompletar:
+    def __init__(self, version, max_resultados):
+        self.version = version
+        self.construido = time.monotonic()
+        self.max_resultados = max_resultados
+        self.raiz = _Nodo()
+        self.productos = {}
+
+        vendidos = Sum('detallepedido__cantidad', filter=Q(detallepedido__pedido__estado='pagado'))
+        filas = (
+            Producto.objects.annotate(vendidos=vendidos)
+            .order_by('-vendidos', 'nombre', 'id')
+            .values_list('id', 'nombre', 'vendidos')
+        )
+        # Se insertan de más a menos vendidos: basta con llenar cada nodo
+        # hasta el tope para que quede ordenado.
+        for producto_id, nombre, vendidos in filas:
+            self.productos[producto_id] = {'id': producto_id, 'nombre': nombre, 'vendidos': vendidos or 0}
+            palabras = terminos(nombre)
+            for i in range(len(palabras)):
+                self._insertar(' '.join(palabras[i:]), producto_id)
+
+    def _insertar(self, texto, producto_id):
+        nodo = self.raiz
+        for letra in texto:
+            nodo = nodo.hijos.setdefault(letra, _Nodo())
+            mejores = nodo.mejores
+            if len(mejores) < self.max_resultados and producto_id not in mejores:
+                mejores.append(producto_id)
+
+    def sugerir(self, prefijo, limite=None):
+        texto = ' '.join(terminos(prefijo))
+        if not texto:
+            return []
+        if prefijo.endswith(' '):
+            # "pie de " no debe calzar con "pie dentro..."
+            texto += ' '
+        nodo = self.raiz
+        for letra in texto:
+            nodo = nodo.hijos.get(letra)
+            if nodo is None:
+                return []
+        return [self.productos[producto_id] for producto_id in nodo.mejores[:limite or self.max_resultados]]
+
+
+def get_indice():
+    """Índice vigente; se reconstruye si cambió la versión o venció el TTL."""
+    global _indice
+
+    version = cache.get(CLAVE_VERSION, 0)
+    ttl = getattr(settings, 'TIENDA_AUTOCOMPLETAR_TTL', 10 * 60)
+    indice = _indice
+
+    if indice is None or indice.version != version or time.monotonic() - indice.construido > ttl:
+        with _lock:
+            indice = _indice
+            if indice is None or indice.version != version or time.monotonic() - indice.construido > ttl:
+                indice = IndiceAutocompletar(version, getattr(settings, 'TIENDA_AUTOCOMPLETAR_MAX', 8))
+                _indice = indice
+    return indice
+
+
+def invalidar():
+    global _indice
+
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.set(CLAVE_VERSION, 1, None)
+    _indice = None
+
+
+def sugerir(prefijo, limite=None):
+    return get_indice().sugerir(prefijo, limite)
@@ -0,0 +1,172 @@
+"""
+Búsqueda de productos para la vista buscar.
+
+El índice cubre nombre, descripción y categoría de Producto y se mantiene
+al guardar o eliminar (tienda/signals.py). Con SQLite es una tabla FTS5
+(migración tienda 0003) con tokenizer unicode61 sin diacríticos: "pie de
+limon" encuentra "Pie de limón", cada término busca por prefijo ("choco"
+encuentra "chocolate") y los resultados se ordenan por bm25, con más peso
+para el nombre.
+
+El backend se elige con settings.TIENDA_BUSQUEDA_BACKEND (ruta a la clase);
+por defecto BusquedaFTS5 en SQLite y BusquedaORM en otras bases.
+`manage.py reindexar_busqueda` reconstruye el índice y `bench_busqueda`
+lo compara con la búsqueda anterior (nombre__icontains).
+"""
+import re
+import threading
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Q, Value, When
+from django.utils.module_loading import import_string
+
+from adminpanel.models import Producto
+
+
+TABLA_FTS = 'tienda_producto_fts'
+CAMPOS = ('nombre', 'descripcion', 'categoria')
+CATEGORIAS = dict(Producto.CATEGORIAS)
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes: 'Limón' -> 'limon'."""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def terminos(q):
+    return re.findall(r'\w+', normalizar(q))
+
+
+def _documento(producto):
+    categoria = producto.categoria or ''
+    return (
+        producto.id,
+        producto.nombre or '',
+        producto.descripcion or '',
+        f"{categoria} {CATEGORIAS.get(categoria, '')}",
+    )
+
+
+class BusquedaFTS5:
+    # Pesos de bm25 por columna (nombre, descripcion, categoria)
+    PESOS = (10.0, 2.0, 1.0)
+
+    def _insertar(self, cursor, productos):
+        cursor.executemany(
+            f'INSERT INTO {TABLA_FTS} (rowid, nombre, descripcion, categoria) VALUES (%s, %s, %s, %s)',
+            [_documento(producto) for producto in productos],
+        )
+
+    def indexar(self, productos):
+        productos = list(productos)
+        if not productos:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {TABLA_FTS} WHERE rowid = %s', [(p.id,) for p in productos])
+            self._insertar(cursor, productos)
+
+    def eliminar(self, producto_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {TABLA_FTS} WHERE rowid = %s', [(i,) for i in producto_ids])
+
+    def reconstruir(self, lote=2000):
+        total = 0
+        productos = Producto.objects.only('id', *CAMPOS).order_by('id')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLA_FTS}')
+            bloque = []
+            for producto in productos.iterator(chunk_size=lote):
+                bloque.append(producto)
+                if len(bloque) == lote:
+                    self._insertar(cursor, bloque)
+                    total += len(bloque)
+                    bloque = []
+            if bloque:
+                self._insertar(cursor, bloque)
+                total += len(bloque)
+            cursor.execute(f"INSERT INTO {TABLA_FTS} ({TABLA_FTS}) VALUES ('optimize')")
+        return total
+
+    def buscar(self, q, limite):
+        # Cada término entre comillas (sin operadores FTS) y con * para prefijo
+        consulta = ' '.join(f'"{termino}"*' for termino in terminos(q))
+        if not consulta:
+            return []
+        pesos = ', '.join(str(peso) for peso in self.PESOS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s '
+                f'ORDER BY bm25({TABLA_FTS}, {pesos}) LIMIT %s',
+                [consulta, limite],
+            )
+            return [fila[0] for fila in cursor.fetchall()]
+
+
+class BusquedaORM:
+    """
+    Respaldo sin índice para bases sin FTS5: todos los términos deben
+    aparecer (icontains) en algún campo; primero los que calzan en el nombre.
+    No pliega tildes (depende de la collation de la base).
+    """
+
+    def indexar(self, productos):
+        pass
+
+    def eliminar(self, producto_ids):
+        pass
+
+    def reconstruir(self, lote=2000):
+        return 0
+
+    def buscar(self, q, limite):
+        palabras = re.findall(r'\w+', q or '')
+        if not palabras:
+            return []
+        condicion = Q()
+        en_nombre = Q()
+        for palabra in palabras:
+            condicion &= Q(nombre__icontains=palabra) | Q(descripcion__icontains=palabra) | Q(categoria__icontains=palabra)
+            en_nombre &= Q(nombre__icontains=palabra)
+        return list(
+            Producto.objects.filter(condicion)
+            .annotate(orden=Case(When(en_nombre, then=Value(0)), default=Value(1)))
+            .order_by('orden', 'nombre')
+            .values_list('id', flat=True)[:limite]
+        )
+
+
+_lock = threading.Lock()
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                ruta = getattr(settings, 'TIENDA_BUSQUEDA_BACKEND', None)
+                if ruta is None:
+                    ruta = 'tienda.busqueda.BusquedaFTS5' if connection.vendor == 'sqlite' else 'tienda.busqueda.BusquedaORM'
+                _backend = import_string(ruta)()
+    return _backend
+
+
+def indexar(productos):
+    get_backend().indexar(productos)
+
+
+def eliminar(producto_ids):
+    get_backend().eliminar(producto_ids)
+
+
+def reconstruir():
+    return get_backend().reconstruir()
+
+
+def buscar(q, limite=None):
+    """Ids de productos que calzan con `q`, del más al menos relevante."""
+    limite = limite or getattr(settings, 'TIENDA_BUSQUEDA_MAX', 60)
+    return get_backend().buscar(q, limite)
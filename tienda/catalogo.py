@@ -0,0 +1,94 @@
+"""
+Caché de las páginas del catálogo (home, productos_index, productos_categoria).
+
+Las plantillas envuelven la parte del catálogo en {% cache %} (backend
+'catalogo' de settings.CACHES) con la clave del sello version(); el badge
+del carrito, los mensajes y el token CSRF quedan fuera del fragmento. Las
+vistas entregan los datos como SimpleLazyObject, así que si el fragmento
+está en caché no se consulta la base.
+
+El sello cambia solo: los signals de Producto y Promocion (tienda/signals.py)
+publican una nueva versión de precios_efectivos y de promociones al
+guardar o eliminar, y el día local entra en el sello por las promociones
+con activo_desde / activo_hasta.
+
+Con el mismo sello las vistas responden GET condicionales (decorador
+condicional): el ETag suma al sello lo que cambia entre visitantes (usuario,
+badge del carrito, cookie CSRF), así que un 304 se decide sin renderizar ni
+consultar la base. Last-Modified solo se envía cuando la página no depende
+del visitante (anónimo con el carrito vacío).
+"""
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from . import precios_efectivos, promociones
+from .context_processors import contar_carrito
+
+
+def version():
+    return '{}.{}.{}'.format(
+        precios_efectivos.version(),
+        cache.get(promociones.CLAVE_VERSION, 0),
+        timezone.localdate().isoformat(),
+    )
+
+
+def contexto(**cargadores):
+    """
+    Contexto para una plantilla del catálogo: cada cargador (función sin
+    argumentos) se evalúa una sola vez y solo si el fragmento no está en caché.
+    """
+    datos = {nombre: SimpleLazyObject(cargador) for nombre, cargador in cargadores.items()}
+    datos['catalogo_version'] = version()
+    datos['catalogo_segundos'] = getattr(settings, 'TIENDA_CATALOGO_CACHE_SEGUNDOS', 6 * 60 * 60)
+    return datos
+
+
+def modificado():
+    """Última publicación del catálogo, o el inicio del día si es posterior."""
+    inicio_dia = timezone.make_aware(
+        datetime.datetime.combine(timezone.localdate(), datetime.time.min)
+    )
+    return max(precios_efectivos.modificado(), inicio_dia)
+
+
+def _variante(request):
+    """Lo que cambia entre visitantes en una página del catálogo, o None si no se puede validar."""
+    # Los mensajes se muestran una sola vez: esa respuesta no puede ser 304
+    if len(messages.get_messages(request)):
+        return None
+    usuario = request.user.pk if request.user.is_authenticated else 0
+    return (usuario, contar_carrito(request),
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''))
+
+
+def _etag(request, *args, **kwargs):
+    variante = _variante(request)
+    if variante is None:
+        return None
+    return hashlib.md5(repr((version(), variante)).encode()).hexdigest()
+
+
+def _last_modified(request, *args, **kwargs):
+    variante = _variante(request)
+    if variante is None or variante[:2] != (0, 0):
+        return None
+    return modificado()
+
+
+def condicional(vista):
+    """
+    GET condicional para una vista del catálogo. Cache-Control no-cache
+    obliga al navegador a revalidar siempre (el badge del carrito cambia
+    sin que cambie el catálogo).
+    """
+    vista = condition(etag_func=_etag, last_modified_func=_last_modified)(vista)
+    return cache_control(private=True, no_cache=True)(vista)
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+
+# Copia firmada del contador para el badge: "<clave de sesión>:<unidades>"
+COOKIE_CARRITO = 'carrito_count'
+SAL_CARRITO = 'tienda.carrito'
+
+
+def contar_carrito(request):
+    """
+    Unidades en el carrito (el número del badge).
+
+    Se lee de la cookie firmada que deja tienda.middleware.cookie_carrito,
+    sin cargar la sesión. Solo vale para la sesión con que se firmó: tras
+    un login, logout o una sesión vencida se lee una vez de la sesión y la
+    cookie se renueva.
+    """
+    clave = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not clave:
+        return 0
+
+    firmado = request.get_signed_cookie(COOKIE_CARRITO, default=None, salt=SAL_CARRITO)
+    if firmado:
+        sesion, _, valor = firmado.rpartition(':')
+        if sesion == clave and valor.isdigit():
+            return int(valor)
+
+    session = getattr(request, 'session', None)
+    if session is None:
+        return 0
+
+    valor = session.get('carrito_count')
+    if valor is None:
+        # Sesiones creadas antes del contador
+        carrito = session.get('carrito', {})
+        valor = sum(
+            int(item['cantidad']) if isinstance(item, dict) else int(item)
+            for item in carrito.values()
+        )
+        if valor:
+            session['carrito_count'] = valor
+    request.carrito_count_nuevo = valor
+    return valor
+
+
+def carrito(request):
+    """
+    Expone `carrito_count` a todas las plantillas.
+
+    El valor sale del contador 'carrito_count' que mantienen las vistas del
+    carrito (ver contar_carrito); es perezoso, así que las páginas que no
+    muestran el badge no lo calculan.
+    """
+    return {'carrito_count': SimpleLazyObject(lambda: contar_carrito(request))}
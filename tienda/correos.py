@@ -0,0 +1,121 @@
+"""
+Bandeja de salida de correos (tienda.models.CorreoPendiente).
+
+Las vistas llaman a encolar(), que solo inserta una fila: la latencia y
+las caídas del SMTP ya no afectan al retorno de Webpay ni al registro.
+Si se encola dentro de una transacción, el correo se confirma junto con
+el resto de los cambios.
+
+El comando `enviar_correos` llama a enviar_pendientes(), que toma un lote
+de correos vencidos, los manda por una sola conexión SMTP reutilizada y
+reprograma los que fallan con backoff exponencial hasta `max_intentos`.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CorreoPendiente
+
+
+BACKOFF_BASE = 60          # segundos antes del primer reintento
+BACKOFF_MAXIMO = 60 * 60   # nunca esperar más de una hora
+RESERVA_LOTE = 5 * 60      # un lote tomado no lo toma otro worker por 5 min
+
+EMAIL_EMPRESA = "sweetblessingchile@gmail.com"
+
+
+def encolar(asunto, cuerpo, destinatarios, remitente=None):
+    return CorreoPendiente.objects.create(
+        asunto=asunto,
+        cuerpo=cuerpo,
+        destinatarios=list(destinatarios),
+        remitente=remitente or settings.DEFAULT_FROM_EMAIL,
+    )
+
+
+def espera_reintento(intentos):
+    """Segundos hasta el siguiente intento tras `intentos` fallos."""
+    return min(BACKOFF_BASE * 2 ** (intentos - 1), BACKOFF_MAXIMO)
+
+
+def _tomar_lote(limite, ahora):
+    """
+    Toma hasta `limite` correos vencidos y los aparta por RESERVA_LOTE
+    segundos, para que otro worker no los envíe a la vez. En bases con
+    SELECT ... FOR UPDATE SKIP LOCKED (PostgreSQL) varios workers pueden
+    trabajar en paralelo; en SQLite conviene uno solo.
+    """
+    with transaction.atomic():
+        lote = list(
+            CorreoPendiente.objects
+            .select_for_update(skip_locked=True)
+            .filter(estado='pendiente', proximo_intento__lte=ahora)
+            .order_by('proximo_intento', 'id')[:limite]
+        )
+        if lote:
+            CorreoPendiente.objects.filter(id__in=[c.id for c in lote]).update(
+                proximo_intento=ahora + timedelta(seconds=RESERVA_LOTE)
+            )
+    return lote
+
+
+def enviar_pendientes(limite=50, max_intentos=5, connection=None):
+    """
+    Envía un lote. Devuelve (enviados, fallidos); `fallidos` incluye los que
+    quedaron reprogramados para otro intento.
+    """
+    ahora = timezone.now()
+    lote = _tomar_lote(limite, ahora)
+    if not lote:
+        return 0, 0
+
+    enviados = []
+    fallidos = []
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        # Sin conexión no se puede enviar nada del lote
+        for correo in lote:
+            fallidos.append((correo, e))
+    else:
+        try:
+            for correo in lote:
+                mensaje = EmailMessage(
+                    correo.asunto,
+                    correo.cuerpo,
+                    correo.remitente or settings.DEFAULT_FROM_EMAIL,
+                    correo.destinatarios,
+                    connection=connection,
+                )
+                try:
+                    mensaje.send()
+                    enviados.append(correo.id)
+                except Exception as e:
+                    fallidos.append((correo, e))
+        finally:
+            connection.close()
+
+    ahora = timezone.now()
+    if enviados:
+        CorreoPendiente.objects.filter(id__in=enviados).update(
+            estado='enviado', enviado=ahora, ultimo_error=''
+        )
+
+    for correo, error in fallidos:
+        correo.intentos += 1
+        correo.ultimo_error = str(error)[:1000]
+        if correo.intentos >= max_intentos:
+            correo.estado = 'fallido'
+        else:
+            correo.proximo_intento = ahora + timedelta(seconds=espera_reintento(correo.intentos))
+    if fallidos:
+        CorreoPendiente.objects.bulk_update(
+            [correo for correo, _ in fallidos],
+            ['intentos', 'ultimo_error', 'estado', 'proximo_intento'],
+        )
+
+    return len(enviados), len(fallidos)
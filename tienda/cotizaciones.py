@@ -0,0 +1,88 @@
+"""
+Caché en memoria de cotizaciones del carrito.
+
+carrito_ver, checkout y webpay_iniciar cotizan el mismo carrito uno tras
+otro; la cotización se guarda con clave (huella del carrito, versión del
+catálogo con precios, día) y se reutiliza mientras nada cambie. LRU con tope
+de entradas (settings.TIENDA_COTIZACIONES_MAX, 1024 por defecto).
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import precios_efectivos
+
+
+class CacheCotizaciones:
+    """LRU simple protegido por lock, con contadores de aciertos/fallos."""
+
+    def __init__(self, max_entradas):
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def obtener(self, clave):
+        with self._lock:
+            valor = self._datos.get(clave)
+            if valor is None:
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._datos),
+                'max_entradas': self.max_entradas,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'desalojos': self.desalojos,
+                'tasa_aciertos': (self.aciertos / total) if total else 0.0,
+            }
+
+
+_cache = CacheCotizaciones(getattr(settings, 'TIENDA_COTIZACIONES_MAX', 1024))
+
+
+def huella_carrito(carrito):
+    """Hash estable del contenido del carrito (producto, cantidad)."""
+    contenido = sorted((int(pid), int(cantidad)) for pid, cantidad in carrito.items())
+    return hashlib.sha1(repr(contenido).encode()).hexdigest()
+
+
+def cotizar(carrito, calcular):
+    """
+    Devuelve la cotización de `carrito`, llamando a `calcular(carrito)`
+    solo si no está en caché para la versión actual del catálogo.
+    """
+    clave = (huella_carrito(carrito), precios_efectivos.version(), timezone.localdate())
+    cotizacion = _cache.obtener(clave)
+    if cotizacion is None:
+        cotizacion = calcular(carrito)
+        _cache.guardar(clave, cotizacion)
+    return cotizacion
+
+
+def estadisticas():
+    return _cache.estadisticas()
@@ -0,0 +1,202 @@
+"""
+Versiones reducidas (derivadas) de las imágenes de Producto y Promocion.
+
+Al subir una imagen, tienda/signals.py la encola (tienda.models.ImagenPendiente)
+y el comando `procesar_imagenes` genera con Pillow una versión WebP y una
+JPEG por cada ancho de TIENDA_IMAGEN_ANCHOS, junto al original:
+
+    productos/pie.jpeg -> productos/pie.w320.webp, productos/pie.w320.jpg, ...
+
+Nunca se amplía: el primer ancho que supera al original se genera al
+tamaño del original, con ese ancho real en el nombre y en el srcset, y los
+siguientes se omiten. El tag {% imagen %}
+(tienda/templatetags/imagenes.py) arma el <picture> con srcset de las
+derivadas registradas en ImagenPendiente.anchos y deja el original como
+respaldo, así que una imagen aún no procesada se sigue viendo.
+`generar_derivadas` procesa la media existente e informa los bytes ahorrados.
+"""
+import hashlib
+import io
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import precios_efectivos
+from .almacenamiento import de_imagenes
+from .models import ImagenPendiente
+
+
+# extensión -> (formato de Pillow, opciones de guardado, tipo MIME)
+FORMATOS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}, 'image/webp'),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}, 'image/jpeg'),
+}
+
+
+def anchos():
+    return tuple(sorted(getattr(settings, 'TIENDA_IMAGEN_ANCHOS', (320, 640, 1024))))
+
+
+def nombre_derivada(nombre, ancho, extension):
+    base, _ = posixpath.splitext(nombre)
+    return f'{base}.w{ancho}.{extension}'
+
+
+def _guardar(nombre, contenido, storage):
+    # El nombre de una derivada es fijo: se reemplaza, no se renombra
+    if storage.exists(nombre):
+        storage.delete(nombre)
+    guardado = storage.save(nombre, ContentFile(contenido))
+    if guardado != nombre:
+        # p. ej. el almacén por contenido con una imagen subida antes de
+        # usarlo (manage.py limpiar_blobs --importar)
+        storage.delete(guardado)
+        raise ValueError(f"El almacenamiento no guarda {nombre} con ese nombre")
+
+
+def generar(nombre, storage=None):
+    """
+    Genera las derivadas de `nombre` y borra las que sobren de una
+    generación anterior. Devuelve [(nombre_derivada, ancho, bytes)], con el
+    ancho real de cada una.
+    """
+    storage = storage or de_imagenes()
+    with storage.open(nombre, 'rb') as archivo:
+        original = Image.open(archivo)
+        original.load()
+    # Las fotos del celular vienen giradas con EXIF
+    original = ImageOps.exif_transpose(original)
+
+    generadas = []
+    for ancho in anchos():
+        # Un ancho mayor que el original se genera una vez, al tamaño del
+        # original (solo recomprimido), para que el srcset tenga la calidad
+        # completa; los siguientes se omiten.
+        real = min(ancho, original.width)
+        alto = max(1, round(original.height * real / original.width))
+        reducida = original.resize((real, alto), Image.Resampling.LANCZOS) if real < original.width else original
+        for extension, (formato, opciones, _) in FORMATOS.items():
+            imagen = reducida
+            if formato == 'JPEG' and imagen.mode != 'RGB':
+                imagen = imagen.convert('RGB')
+            elif imagen.mode not in ('RGB', 'RGBA'):
+                imagen = imagen.convert('RGBA' if 'A' in imagen.getbands() else 'RGB')
+            salida = io.BytesIO()
+            imagen.save(salida, formato, **opciones)
+            destino = nombre_derivada(nombre, real, extension)
+            _guardar(destino, salida.getvalue(), storage)
+            generadas.append((destino, real, salida.tell()))
+        if real == original.width:
+            break
+
+    vigentes = {destino for destino, _, _ in generadas}
+    for archivo in archivos_derivados(nombre, storage):
+        if archivo not in vigentes:
+            storage.delete(archivo)
+    return generadas
+
+
+def _clave_anchos(nombre):
+    return 'imagen:anchos:' + hashlib.md5(nombre.encode()).hexdigest()
+
+
+def anchos_generados(nombre):
+    """
+    Anchos de las derivadas ya generadas de `nombre` ([] si aún no hay).
+    Se leen de ImagenPendiente a través de la caché; mientras una imagen
+    no está lista se vuelve a consultar cada TIENDA_IMAGEN_REVISION_SEGUNDOS.
+    """
+    clave = _clave_anchos(nombre)
+    generados = cache.get(clave)
+    if generados is None:
+        generados = (
+            ImagenPendiente.objects.filter(nombre=nombre, estado='lista')
+            .values_list('anchos', flat=True).first()
+        ) or []
+        cache.set(clave, generados, None if generados else getattr(settings, 'TIENDA_IMAGEN_REVISION_SEGUNDOS', 60))
+    return generados
+
+
+def registrar(nombre, generadas):
+    """Marca `nombre` como lista con los anchos de `generadas` (lo que devuelve generar)."""
+    generados = sorted({ancho for _, ancho, _ in generadas})
+    ImagenPendiente.objects.update_or_create(
+        nombre=nombre,
+        defaults={'estado': 'lista', 'ultimo_error': '', 'procesada': timezone.now(), 'anchos': generados},
+    )
+    cache.set(_clave_anchos(nombre), generados, None)
+
+
+def derivadas(nombre, extension):
+    """[(ancho, nombre_derivada)] ya generadas de `nombre` en `extension`."""
+    return [(ancho, nombre_derivada(nombre, ancho, extension)) for ancho in anchos_generados(nombre)]
+
+
+def archivos_derivados(nombre, storage=None):
+    """
+    Derivadas de `nombre` que hay en el almacenamiento, estén registradas
+    o no (p. ej. para borrarlas junto con el original).
+    """
+    storage = storage or de_imagenes()
+    directorio, archivo = posixpath.split(nombre)
+    patron = re.compile(re.escape(posixpath.splitext(archivo)[0]) + r'\.w\d+\.(%s)$' % '|'.join(FORMATOS))
+    try:
+        archivos = storage.listdir(directorio)[1]
+    except FileNotFoundError:
+        return []
+    return [posixpath.join(directorio, a) for a in archivos if patron.match(a)]
+
+
+def encolar(nombre):
+    """
+    Pide las derivadas de `nombre`. Un nombre ya encolado (o procesado) no
+    se repite: guardar el producto sin cambiar la imagen no cuesta nada.
+    """
+    if nombre:
+        ImagenPendiente.objects.get_or_create(nombre=nombre)
+
+
+def procesar_pendientes(limite=20, max_intentos=3):
+    """
+    Procesa un lote de la cola. Devuelve (listas, fallidas); `fallidas`
+    incluye las que quedan para otro intento. Varios workers a la vez
+    solo repiten trabajo (las derivadas se sobrescriben).
+    """
+    lote = list(ImagenPendiente.objects.filter(estado='pendiente').order_by('id')[:limite])
+    listas = fallidas = 0
+    for pendiente in lote:
+        try:
+            generadas = generar(pendiente.nombre)
+        except Exception as e:
+            # Archivo borrado, o algo que Pillow no sabe abrir
+            pendiente.intentos += 1
+            pendiente.ultimo_error = str(e)[:1000]
+            if pendiente.intentos >= max_intentos:
+                pendiente.estado = 'fallida'
+            pendiente.save(update_fields=['intentos', 'ultimo_error', 'estado'])
+            fallidas += 1
+        else:
+            registrar(pendiente.nombre, generadas)
+            listas += 1
+    if listas:
+        # Las páginas del catálogo en caché (y sus ETag) aún tienen el <img> sin srcset
+        precios_efectivos.publicar_version()
+    return listas, fallidas
+
+
+def servida(nombre, ancho_pantalla):
+    """
+    Nombre del archivo que un navegador con WebP descargaría para mostrar
+    la imagen a `ancho_pantalla` píxeles: la derivada más chica que alcanza,
+    o el original si no hay ninguna.
+    """
+    disponibles = derivadas(nombre, 'webp')
+    for ancho, derivada in disponibles:
+        if ancho >= ancho_pantalla:
+            return derivada
+    return disponibles[-1][1] if disponibles else nombre
@@ -0,0 +1,102 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import setup_databases, teardown_databases
+
+from adminpanel.models import Producto
+from tienda import busqueda
+
+
+TIPOS = ['Torta', 'Pie', 'Kuchen', 'Cheesecake', 'Brownie', 'Alfajor', 'Queque', 'Tartaleta', 'Mousse', 'Galletas']
+SABORES = ['de limón', 'de frambuesa', 'de manjar', 'de chocolate', 'tres leches', 'de nuez',
+           'de piña', 'de maracuyá', 'de café', 'de lúcuma', 'de mora', 'de plátano']
+DETALLES = ['con merengue', 'sin azúcar', 'vegana', 'familiar', 'individual', 'con crema', 'bañada en chocolate']
+PALABRAS = ('masa hojaldre crujiente suave relleno casero horneado mantequilla almendras '
+            'vainilla canela bizcocho húmedo cubierta glaseado frutos rojos temporada').split()
+
+CONSULTAS = ['limon', 'pie de limon', 'choco', 'tres leches', 'maracuya', 'lucuma con merengue',
+             'vegana', 'hojaldre', 'xyz']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la búsqueda anterior (nombre__icontains, sin límite) con "
+        "tienda.busqueda sobre un catálogo sintético, en una base de prueba "
+        "temporal (no toca db.sqlite3)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=100000)
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--semilla', type=int, default=1)
+
+    def handle(self, *args, **opts):
+        config = setup_databases(verbosity=0, interactive=False)
+        try:
+            self._medir(opts)
+        finally:
+            teardown_databases(config, verbosity=0)
+
+    def _medir(self, opts):
+        rnd = random.Random(opts['semilla'])
+        categorias = [slug for slug, _ in Producto.CATEGORIAS]
+
+        inicio = time.perf_counter()
+        Producto.objects.bulk_create(
+            [
+                Producto(
+                    nombre=f"{rnd.choice(TIPOS)} {rnd.choice(SABORES)} {rnd.choice(DETALLES)}",
+                    descripcion=' '.join(rnd.choices(PALABRAS, k=12)),
+                    precio=rnd.randrange(1000, 40000, 10),
+                    categoria=rnd.choice(categorias),
+                    stock=rnd.randint(0, 50),
+                )
+                for _ in range(opts['productos'])
+            ],
+            batch_size=2000,
+        )
+        self.stdout.write(f"{opts['productos']} productos creados en {time.perf_counter() - inicio:.1f} s")
+
+        inicio = time.perf_counter()
+        with transaction.atomic():
+            busqueda.reconstruir()
+        self.stdout.write(
+            f"Índice {type(busqueda.get_backend()).__name__} construido en {time.perf_counter() - inicio:.1f} s\n"
+        )
+
+        limite = getattr(settings, 'TIENDA_BUSQUEDA_MAX', 60)
+        self.stdout.write(
+            f"{'consulta':<22} {'icontains ms':>13} {'hits':>7} {f'[:{limite}] ms':>10} {'índice ms':>10} {'hits':>5}"
+        )
+        for q in CONSULTAS:
+            antes, hits_antes = self._tiempo(
+                lambda: list(Producto.objects.filter(nombre__icontains=q)), opts['repeticiones']
+            )
+            recortado, _ = self._tiempo(
+                lambda: list(Producto.objects.filter(nombre__icontains=q)[:limite]), opts['repeticiones']
+            )
+            ahora, hits_ahora = self._tiempo(lambda: self._buscar(q), opts['repeticiones'])
+            self.stdout.write(
+                f"{q:<22} {antes * 1000:>13.2f} {hits_antes:>7} {recortado * 1000:>10.2f} "
+                f"{ahora * 1000:>10.2f} {hits_ahora:>5}"
+            )
+        self.stdout.write(
+            "\nicontains no pliega tildes ni busca en la descripción; el índice "
+            "devuelve los TIENDA_BUSQUEDA_MAX más relevantes."
+        )
+
+    def _buscar(self, q):
+        # Lo mismo que hace la vista buscar
+        ids = busqueda.buscar(q)
+        productos = Producto.objects.in_bulk(ids)
+        return [productos[i] for i in ids if i in productos]
+
+    def _tiempo(self, consulta, repeticiones):
+        resultado = consulta()
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            consulta()
+        return (time.perf_counter() - inicio) / repeticiones, len(resultado)
@@ -0,0 +1,74 @@
+import timeit
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from tienda import precios
+
+
+class PromoSintetica:
+    def __init__(self, tipo, porcentaje=None, porcentaje_segunda_unidad=None):
+        self.id = 1
+        self.tipo = tipo
+        self.porcentaje = porcentaje
+        self.porcentaje_segunda_unidad = porcentaje_segunda_unidad
+        self.etiqueta = tipo
+        self.titulo = tipo
+
+
+def _linea_decimal(precio, cantidad, promo):
+    """
+    Aritmética de la versión anterior (_aplicar_promocion_a_item en
+    tienda/views.py, con Decimal), sin las consultas; solo para comparar.
+    """
+    cantidad = int(cantidad)
+    precio_unitario = Decimal(str(precio))
+    subtotal_base = precio_unitario * cantidad
+    subtotal_desc = subtotal_base
+    tipo_norm = (promo.tipo or "").strip().lower()
+
+    if tipo_norm in ["2x1", "2 x 1", "two_for_one"] and cantidad >= 2:
+        subtotal_desc = precio_unitario * (cantidad // 2 + cantidad % 2)
+    elif tipo_norm in ["porcentaje", "percentage", "descuento_porcentaje"] and promo.porcentaje:
+        pct = Decimal(str(promo.porcentaje))
+        subtotal_desc = subtotal_base * (Decimal("1") - pct / Decimal("100"))
+    elif tipo_norm in ["segunda_unidad", "second_unit_pct", "descuento_segunda_unidad", "segunda unidad"] \
+            and promo.porcentaje_segunda_unidad and cantidad >= 2:
+        pct2 = Decimal(str(promo.porcentaje_segunda_unidad))
+        precio_par = precio_unitario + precio_unitario * (Decimal("1") - pct2 / Decimal("100"))
+        subtotal_desc = precio_par * (cantidad // 2) + precio_unitario * (cantidad % 2)
+
+    return {
+        "subtotal_base": subtotal_base,
+        "subtotal_desc": subtotal_desc,
+        "descuento": subtotal_base - subtotal_desc,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmark de la cotización de una línea: tienda.precios.cotizar_linea "
+        "(pesos enteros) contra la aritmética con Decimal que usaba el carrito antes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--llamadas', type=int, default=100000)
+        parser.add_argument('--repeticiones', type=int, default=5)
+
+    def handle(self, *args, **opts):
+        casos = [
+            ('sin promo', PromoSintetica('')),
+            ('2x1', PromoSintetica('2x1')),
+            ('porcentaje', PromoSintetica('porcentaje', porcentaje=15)),
+            ('segunda_unidad', PromoSintetica('segunda_unidad', porcentaje_segunda_unidad=50)),
+        ]
+        precio, cantidad = 12990, 3
+        self.stdout.write(f"{'caso':<16} {'Decimal (us)':>13} {'enteros (us)':>13}")
+        for nombre, promo in casos:
+            anterior = self._medir(lambda: _linea_decimal(precio, cantidad, promo), opts)
+            actual = self._medir(lambda: precios.cotizar_linea(1, precio, cantidad, promo), opts)
+            self.stdout.write(f"{nombre:<16} {anterior:>13.2f} {actual:>13.2f}")
+
+    def _medir(self, fn, opts):
+        mejor = min(timeit.repeat(fn, number=opts['llamadas'], repeat=opts['repeticiones']))
+        return mejor / opts['llamadas'] * 1e6
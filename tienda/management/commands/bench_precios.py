@@ -0,0 +1,89 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from tienda import precios, precios_lote
+
+
+class PromoSintetica:
+    def __init__(self, promo_id, tipo, porcentaje=None, porcentaje_segunda_unidad=None):
+        self.id = promo_id
+        self.tipo = tipo
+        self.porcentaje = porcentaje
+        self.porcentaje_segunda_unidad = porcentaje_segunda_unidad
+        self.etiqueta = tipo
+        self.titulo = tipo
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la cotización línea a línea (tienda.precios) con la "
+        "cotización vectorizada (tienda.precios_lote) sobre un catálogo sintético."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanos', nargs='+', type=int, default=[10, 1000, 100000])
+        parser.add_argument('--productos', type=int, default=500)
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--semilla', type=int, default=1)
+
+    def handle(self, *args, **opts):
+        rnd = random.Random(opts['semilla'])
+        n_productos = opts['productos']
+
+        ids = list(range(1, n_productos + 1))
+        precios_unit = [rnd.randrange(500, 40000, 10) for _ in ids]
+        promos = {}
+        for producto_id in ids:
+            r = rnd.random()
+            if r < 0.15:
+                promos[producto_id] = PromoSintetica(producto_id, '2x1')
+            elif r < 0.35:
+                promos[producto_id] = PromoSintetica(producto_id, 'porcentaje', porcentaje=rnd.randint(5, 50))
+            elif r < 0.45:
+                promos[producto_id] = PromoSintetica(
+                    producto_id, 'segunda_unidad', porcentaje_segunda_unidad=rnd.randint(10, 100)
+                )
+
+        tabla = precios_lote.TablaPrecios(
+            ids,
+            precios_unit,
+            [precios_lote.TIPO_CODIGO.get(promos[i].tipo, 0) if i in promos else 0 for i in ids],
+            [(promos[i].porcentaje or 0) if i in promos else 0 for i in ids],
+            [(promos[i].porcentaje_segunda_unidad or 0) if i in promos else 0 for i in ids],
+            [promos[i].id if i in promos else 0 for i in ids],
+        )
+        precio_por_id = dict(zip(ids, precios_unit))
+
+        self.stdout.write(f"{'líneas':>10} {'loop (ms)':>12} {'numpy (ms)':>12} {'speedup':>9}")
+        for tamano in opts['tamanos']:
+            lineas_ids = [rnd.choice(ids) for _ in range(tamano)]
+            cantidades = [rnd.randint(1, 12) for _ in range(tamano)]
+            arr_ids = np.array(lineas_ids, dtype=np.int64)
+            arr_cant = np.array(cantidades, dtype=np.int64)
+
+            lineas = [(pid, precio_por_id[pid], cant) for pid, cant in zip(lineas_ids, cantidades)]
+            esperado = precios.cotizar_carrito(lineas, promos)['total']
+            obtenido = int(precios_lote.cotizar_arreglos(tabla, arr_ids, arr_cant)['subtotal'].sum())
+            if esperado != obtenido:
+                self.stderr.write(f"Totales distintos para {tamano} líneas: {esperado} != {obtenido}")
+                return
+
+            t_loop = self._medir(lambda: precios.cotizar_carrito(lineas, promos), opts['repeticiones'])
+            t_lote = self._medir(
+                lambda: precios_lote.cotizar_arreglos(tabla, arr_ids, arr_cant), opts['repeticiones']
+            )
+            self.stdout.write(
+                f"{tamano:>10} {t_loop * 1000:>12.3f} {t_lote * 1000:>12.3f} {t_loop / t_lote:>8.1f}x"
+            )
+
+    def _medir(self, fn, repeticiones):
+        mejor = None
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            fn()
+            duracion = time.perf_counter() - inicio
+            mejor = duracion if mejor is None else min(mejor, duracion)
+        return mejor
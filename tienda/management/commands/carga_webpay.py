@@ -0,0 +1,160 @@
+import asyncio
+import os
+import re
+import shutil
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from django.urls import reverse
+
+from adminpanel.models import Pedido, Producto, TransaccionWebpay
+from tienda import webpay
+from tienda.webpay_falso import ServidorWebpayFalso
+
+
+TOKEN = re.compile(r'name="token_ws" value="([^"]+)"')
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga del pago Webpay contra el Webpay falso: pagos por "
+        "segundo con las vistas sync (un hilo por pago, como un servidor "
+        "WSGI con --hilos hilos) y con las async (un solo event loop, como "
+        "un worker ASGI). Usa una base de prueba temporal, no db.sqlite3."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pagos', type=int, default=100)
+        parser.add_argument('--hilos', type=int, default=8,
+                            help="Hilos del caso WSGI (pagos en curso a la vez).")
+        parser.add_argument('--concurrencia', type=int, default=100,
+                            help="Pagos en curso a la vez en el caso ASGI.")
+        parser.add_argument('--latencia', type=float, default=0.2,
+                            help="Segundos que tarda el Webpay falso en cada llamada.")
+        parser.add_argument('--productos', type=int, default=20)
+
+    def handle(self, *args, **opts):
+        directorio = tempfile.mkdtemp(prefix='carga_webpay_')
+        conexion = connections['default']
+        if conexion.vendor == 'sqlite':
+            # Base en archivo (la de memoria no admite escrituras desde varios
+            # hilos). Con BEGIN IMMEDIATE las transacciones que leen y luego
+            # escriben esperan el bloqueo (timeout) en vez de fallar con
+            # "database is locked".
+            conexion.settings_dict['TEST']['NAME'] = os.path.join(directorio, 'carga.sqlite3')
+            conexion.settings_dict['OPTIONS'].setdefault('timeout', 30)
+            conexion.settings_dict['OPTIONS'].setdefault('transaction_mode', 'IMMEDIATE')
+
+        servidor = ServidorWebpayFalso(latencia=opts['latencia'])
+        host = servidor.iniciar()
+
+        setup_test_environment()
+        config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(WEBPAY_PLUS_HOST=host):
+                webpay.reiniciar_cliente()
+                productos = Producto.objects.bulk_create([
+                    Producto(nombre=f'Producto carga {i}', precio=1000 + i, categoria='tortas', stock=10 ** 6)
+                    for i in range(opts['productos'])
+                ])
+                self._ids = [p.id for p in productos]
+
+                self.stdout.write(
+                    f"{opts['pagos']} pagos por caso, latencia Webpay {opts['latencia'] * 1000:.0f} ms "
+                    f"por llamada (create + commit)\n"
+                )
+                self.stdout.write(
+                    f"{'caso':<32} {'pagos/s':>9} {'total s':>8} {'p50 ms':>8} {'p95 ms':>8} {'ok':>5}"
+                )
+                self._informar(f"WSGI sync ({opts['hilos']} hilos)", *self._wsgi(opts))
+                self._informar(f"ASGI async (concurrencia {opts['concurrencia']})", *self._asgi(opts))
+                self.stdout.write(f"\nWebpay falso: {servidor.contadores}")
+        finally:
+            webpay.reiniciar_cliente()
+            teardown_databases(config, verbosity=0)
+            teardown_test_environment()
+            servidor.detener()
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    def _usuarios(self, prefijo, n):
+        User.objects.bulk_create([User(username=f'{prefijo}{i}', email=f'{prefijo}{i}@example.com')
+                                  for i in range(n)])
+        return list(User.objects.filter(username__startswith=prefijo).order_by('id'))
+
+    def _informar(self, caso, duracion, latencias, pedido_ids):
+        pagados = Pedido.objects.filter(id__in=pedido_ids, estado='pagado').count()
+        latencias = sorted(latencias)
+        p95 = latencias[int(len(latencias) * 0.95) - 1] if latencias else 0
+        self.stdout.write(
+            f"{caso:<32} {len(pedido_ids) / duracion:>9.1f} {duracion:>8.2f} "
+            f"{statistics.median(latencias) * 1000 if latencias else 0:>8.0f} {p95 * 1000:>8.0f} {pagados:>5}"
+        )
+
+    # --------------------------------------------------------------
+    #  WSGI: vistas sync, un hilo ocupado por cada pago en curso
+    # --------------------------------------------------------------
+    def _pago_sync(self, usuario, producto_id):
+        cliente = Client()
+        cliente.force_login(usuario)
+        cliente.post(reverse('tienda:api_carrito_agregar', args=[producto_id]), {'cantidad': 1})
+
+        inicio = time.perf_counter()
+        respuesta = cliente.post(reverse('tienda:webpay_iniciar'))
+        token = TOKEN.search(respuesta.content.decode()).group(1)
+        cliente.get(reverse('tienda:webpay_retorno'), {'token_ws': token})
+        return time.perf_counter() - inicio, token
+
+    def _wsgi(self, opts):
+        usuarios = self._usuarios('carga_wsgi_', opts['pagos'])
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(opts['hilos']) as hilos:
+            resultados = list(hilos.map(
+                self._pago_sync, usuarios,
+                [self._ids[i % len(self._ids)] for i in range(len(usuarios))],
+            ))
+        duracion = time.perf_counter() - inicio
+        return duracion, [r[0] for r in resultados], self._pedidos([r[1] for r in resultados])
+
+    # --------------------------------------------------------------
+    #  ASGI: vistas async, un event loop para todos los pagos
+    # --------------------------------------------------------------
+    async def _pago_async(self, usuario, producto_id, limite):
+        async with limite:
+            cliente = AsyncClient()
+            await cliente.aforce_login(usuario)
+            await cliente.post(reverse('tienda:api_carrito_agregar', args=[producto_id]), {'cantidad': 1})
+
+            inicio = time.perf_counter()
+            respuesta = await cliente.post(reverse('tienda:webpay_iniciar_async'))
+            token = TOKEN.search(respuesta.content.decode()).group(1)
+            await cliente.get(reverse('tienda:webpay_retorno_async'), {'token_ws': token})
+            return time.perf_counter() - inicio, token
+
+    async def _todos_async(self, usuarios, opts):
+        limite = asyncio.Semaphore(opts['concurrencia'])
+        try:
+            return await asyncio.gather(*[
+                self._pago_async(usuario, self._ids[i % len(self._ids)], limite)
+                for i, usuario in enumerate(usuarios)
+            ])
+        finally:
+            await webpay.get_cliente_async().cerrar()
+
+    def _asgi(self, opts):
+        usuarios = self._usuarios('carga_asgi_', opts['pagos'])
+        inicio = time.perf_counter()
+        resultados = asyncio.run(self._todos_async(usuarios, opts))
+        duracion = time.perf_counter() - inicio
+        return duracion, [r[0] for r in resultados], self._pedidos([r[1] for r in resultados])
+
+    def _pedidos(self, tokens):
+        return list(TransaccionWebpay.objects.filter(token__in=tokens).values_list('pedido_id', flat=True))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tienda import correos
+
+
+class Command(BaseCommand):
+    help = (
+        "Envía los correos encolados en CorreoPendiente por una sola conexión SMTP, "
+        "con reintentos y backoff. Con --continuo queda corriendo como worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=50,
+                            help="Correos por lote (una conexión SMTP por lote).")
+        parser.add_argument('--max-intentos', type=int, default=5,
+                            help="Intentos antes de marcar un correo como fallido.")
+        parser.add_argument('--continuo', action='store_true',
+                            help="No terminar: seguir revisando la bandeja.")
+        parser.add_argument('--pausa', type=float, default=5,
+                            help="Segundos de espera cuando la bandeja está vacía (modo continuo).")
+
+    def handle(self, *args, **opts):
+        total_enviados = total_fallidos = 0
+        while True:
+            enviados, fallidos = correos.enviar_pendientes(opts['lote'], opts['max_intentos'])
+            total_enviados += enviados
+            total_fallidos += fallidos
+            if enviados or fallidos:
+                self.stdout.write(f"Lote: {enviados} enviados, {fallidos} con error")
+
+            if enviados + fallidos < opts['lote']:
+                # La bandeja quedó vacía (o solo con reintentos a futuro)
+                if not opts['continuo']:
+                    break
+                time.sleep(opts['pausa'])
+
+        self.stdout.write(f"Enviados: {total_enviados}, con error: {total_fallidos}")
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tienda import pedidos
+
+
+class Command(BaseCommand):
+    help = (
+        "Expira en bloque los pedidos pendientes abandonados (reserva de stock vencida "
+        "o sin reserva y antiguos), devuelve su stock y purga los expirados viejos. "
+        "Pensado para cron cada pocos minutos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sin-reserva-horas', type=int, default=24,
+                            help="Expirar pendientes sin reserva creados hace más de estas horas.")
+        parser.add_argument('--purgar-dias', type=int, default=30,
+                            help="Borrar pedidos expirados con más de estos días (0 = no borrar).")
+
+    def handle(self, *args, **opts):
+        ahora = timezone.now()
+        n = pedidos.expirar_vencidos(
+            ahora, sin_reserva_antes=ahora - timedelta(hours=opts['sin_reserva_horas'])
+        )
+        self.stdout.write(f"Pedidos expirados: {n}")
+
+        if opts['purgar_dias']:
+            borrados = pedidos.purgar_expirados(ahora - timedelta(days=opts['purgar_dias']))
+            self.stdout.write(f"Filas borradas (pedidos expirados y sus dependencias): {borrados}")
@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from adminpanel.models import Producto, Promocion
+from tienda import imagenes, precios_efectivos, promociones
+from tienda.almacenamiento import de_imagenes
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera las versiones reducidas de las imágenes ya subidas de Producto "
+        "y Promocion, y muestra cuántos bytes se ahorran en cada página del catálogo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forzar', action='store_true',
+                            help="Regenerar también las imágenes que ya tienen derivadas.")
+        parser.add_argument('--solo-informe', action='store_true',
+                            help="No generar nada, solo mostrar el informe.")
+        parser.add_argument('--ancho', type=int, default=640,
+                            help="Píxeles con que se muestra una tarjeta, para el informe "
+                                 "(25vw en escritorio o 50vw en móvil, con pantallas 2x).")
+
+    def handle(self, *args, **opts):
+        if not opts['solo_informe']:
+            self._generar(opts['forzar'])
+        self._informe(opts['ancho'])
+
+    def _nombres(self):
+        nombres = set()
+        for modelo in (Producto, Promocion):
+            nombres.update(modelo.objects.exclude(imagen='').exclude(imagen=None).values_list('imagen', flat=True))
+        return sorted(nombres)
+
+    def _generar(self, forzar):
+        storage = de_imagenes()
+        listas = omitidas = fallidas = anteriores = 0
+        for nombre in self._nombres():
+            if not storage.es_blob(nombre):
+                # Subida antes del almacén por contenido: sus derivadas no se
+                # pueden guardar con nombre fijo hasta importarla
+                anteriores += 1
+                continue
+            if not forzar and imagenes.derivadas(nombre, 'webp'):
+                omitidas += 1
+                continue
+            try:
+                generadas = imagenes.generar(nombre)
+            except Exception as e:
+                fallidas += 1
+                self.stderr.write(f"{nombre}: {e}")
+                continue
+            imagenes.registrar(nombre, generadas)
+            listas += 1
+            self.stdout.write(f"{nombre}: {len(generadas)} derivadas")
+        if listas:
+            precios_efectivos.publicar_version()
+        self.stdout.write(f"Generadas: {listas}, ya estaban: {omitidas}, con error: {fallidas}\n")
+        if anteriores:
+            self.stderr.write(
+                f"Omitidas {anteriores} imágenes subidas antes del almacén por contenido: "
+                "ejecuta `manage.py limpiar_blobs --importar` y vuelve a correr este comando.\n"
+            )
+
+    def _paginas(self):
+        """Página -> nombres de las imágenes que muestra (como las vistas del catálogo)."""
+        activas = [promo.imagen.name for promo in promociones.get_indice().activas if promo.imagen]
+        paginas = {
+            'inicio': list(
+                Producto.objects.filter(destacado=True).exclude(imagen='').exclude(imagen=None)
+                .order_by('id').values_list('imagen', flat=True)[:6]
+            ) + activas,
+            'productos': activas,
+        }
+        por_pagina = getattr(settings, 'TIENDA_POR_PAGINA', 24)
+        for slug, _ in Producto.CATEGORIAS:
+            paginas[f'categoría {slug}'] = list(
+                Producto.objects.filter(categoria=slug).exclude(imagen='').exclude(imagen=None)
+                .order_by('id').values_list('imagen', flat=True)[:por_pagina]
+            ) + [promo.imagen.name for promo in promociones.get_indice().por_enlace(slug) if promo.imagen]
+        return paginas
+
+    def _tamano(self, nombre):
+        try:
+            return de_imagenes().size(nombre)
+        except OSError:
+            return 0
+
+    def _informe(self, ancho):
+        self.stdout.write(f"Bytes por página (tarjetas de {ancho} px, navegador con WebP):")
+        self.stdout.write(f"{'página':<22} {'imágenes':>8} {'original KB':>12} {'servido KB':>11} {'ahorro':>7}")
+        for pagina, nombres in self._paginas().items():
+            original = sum(self._tamano(nombre) for nombre in nombres)
+            servido = sum(self._tamano(imagenes.servida(nombre, ancho)) for nombre in nombres)
+            ahorro = 100 * (original - servido) / original if original else 0
+            self.stdout.write(
+                f"{pagina:<22} {len(nombres):>8} {original / 1024:>12.0f} {servido / 1024:>11.0f} {ahorro:>6.0f}%"
+            )
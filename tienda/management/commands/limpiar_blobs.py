@@ -0,0 +1,122 @@
+import posixpath
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.utils import timezone
+
+from tienda import imagenes, precios_efectivos
+from tienda.almacenamiento import AlmacenamientoPorContenido, de_imagenes
+from tienda.models import ImagenPendiente
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra los blobs del almacenamiento de imágenes (y sus versiones reducidas) "
+        "que ningún registro referencia. Con --importar antes pasa al almacén las "
+        "imágenes subidas con el almacenamiento anterior, una copia por contenido."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--importar', action='store_true',
+                            help="Mover al almacén las imágenes que aún están fuera de blobs/.")
+        parser.add_argument('--gracia', type=int, default=60,
+                            help="Minutos: los blobs más nuevos no se borran (la subida "
+                                 "puede no haber guardado aún su registro).")
+        parser.add_argument('--simular', action='store_true',
+                            help="Solo mostrar qué se haría.")
+
+    def handle(self, *args, **opts):
+        self.storage = de_imagenes()
+        self.simular = opts['simular']
+        if opts['importar']:
+            self._importar()
+        self._limpiar(opts['gracia'])
+
+    def _campos(self):
+        """(modelo, campo) de todos los FileField guardados en el almacén por contenido."""
+        return [
+            (modelo, campo)
+            for modelo in apps.get_models()
+            for campo in modelo._meta.concrete_fields
+            if isinstance(campo, models.FileField) and isinstance(campo.storage, AlmacenamientoPorContenido)
+        ]
+
+    def _nombres(self, modelo, campo):
+        return set(
+            modelo._base_manager.exclude(**{campo.name: ''}).exclude(**{f'{campo.name}__isnull': True})
+            .values_list(campo.name, flat=True)
+        )
+
+    def _tamano(self, nombre):
+        try:
+            return self.storage.size(nombre)
+        except OSError:
+            return 0
+
+    def _importar(self):
+        importados = {}
+        for modelo, campo in self._campos():
+            for nombre in sorted(self._nombres(modelo, campo)):
+                if self.storage.es_blob(nombre):
+                    continue
+                if nombre not in importados:
+                    if not self.storage.exists(nombre):
+                        self.stderr.write(f"{modelo.__name__}.{campo.name}: no existe {nombre}")
+                        continue
+                    with self.storage.open(nombre, 'rb') as archivo:
+                        if self.simular:
+                            importados[nombre] = self.storage.nombre_blob(
+                                self.storage.calcular_digesto(archivo), posixpath.splitext(nombre)[1])
+                        else:
+                            importados[nombre] = self.storage.save(nombre, archivo)
+                if not self.simular:
+                    modelo._base_manager.filter(**{campo.name: nombre}).update(**{campo.name: importados[nombre]})
+
+        blobs = set(importados.values())
+        liberados = 0
+        for nombre in importados:
+            # El original y las derivadas que tenía junto a él
+            for archivo in [nombre] + imagenes.archivos_derivados(nombre, self.storage):
+                liberados += self._tamano(archivo)
+                if not self.simular:
+                    self.storage.delete(archivo)
+        if not self.simular:
+            ImagenPendiente.objects.filter(nombre__in=list(importados)).delete()
+            for blob in blobs:
+                imagenes.encolar(blob)
+            if importados:
+                precios_efectivos.publicar_version()
+        self.stdout.write(
+            f"Importadas: {len(importados)} imágenes en {len(blobs)} blobs "
+            f"({liberados / 1024:.0f} KB en archivos anteriores{' a borrar' if self.simular else ' borrados'})"
+        )
+
+    def _limpiar(self, gracia):
+        usados = set()
+        for modelo, campo in self._campos():
+            usados.update(self.storage.digesto(n) for n in self._nombres(modelo, campo) if self.storage.es_blob(n))
+
+        limite = timezone.now() - timedelta(minutes=gracia)
+        prefijo = self.storage.prefijo
+        borrados = []
+        liberados = conservados = 0
+        directorios = self.storage.listdir(prefijo)[0] if self.storage.exists(prefijo) else []
+        for directorio in sorted(directorios):
+            for archivo in sorted(self.storage.listdir(f'{prefijo}/{directorio}')[1]):
+                nombre = f'{prefijo}/{directorio}/{archivo}'
+                if self.storage.digesto(nombre) in usados or self.storage.get_modified_time(nombre) > limite:
+                    conservados += 1
+                    continue
+                liberados += self._tamano(nombre)
+                borrados.append(nombre)
+                if not self.simular:
+                    self.storage.delete(nombre)
+
+        if borrados and not self.simular:
+            ImagenPendiente.objects.filter(nombre__in=borrados).delete()
+        self.stdout.write(
+            f"Blobs huérfanos{' a borrar' if self.simular else ' borrados'}: {len(borrados)} archivos, "
+            f"{liberados / 1024:.0f} KB; conservados: {conservados}"
+        )
@@ -0,0 +1,74 @@
+import time
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+
+
+MOTORES = [
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+    'django.contrib.sessions.backends.cache',
+]
+
+
+def carrito_antiguo(lineas):
+    """Formato anterior: un dict completo por línea, con los montos ya calculados."""
+    return {
+        str(pid): {
+            'id': pid,
+            'nombre': f'Torta de ejemplo número {pid}',
+            'precio': 18990.0,
+            'imagen': f'/media/productos/WhatsApp_Image_2025-11-16_at_09.02.{pid:02d}.jpeg',
+            'cantidad': 2,
+            'subtotal_base': 37980.0,
+            'subtotal': 18990.0,
+            'descuento': 18990.0,
+            'tiene_promo': True,
+            'etiqueta_promo': '2x1',
+        }
+        for pid in range(1, lineas + 1)
+    }
+
+
+def carrito_compacto(lineas):
+    return {str(pid): 2 for pid in range(1, lineas + 1)}
+
+
+class Command(BaseCommand):
+    help = "Mide tamaño de la sesión y latencia de escritura del carrito (formato antiguo vs compacto)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lineas', type=int, default=30)
+        parser.add_argument('--escrituras', type=int, default=200)
+
+    def handle(self, *args, **opts):
+        lineas = opts['lineas']
+        formatos = [
+            ('antiguo', carrito_antiguo(lineas)),
+            ('compacto', carrito_compacto(lineas)),
+        ]
+
+        self.stdout.write(f"Carrito de {lineas} líneas, {opts['escrituras']} escrituras por caso\n")
+        self.stdout.write(f"{'motor':<12} {'formato':<10} {'bytes':>8} {'ms/escritura':>14}")
+
+        for motor in MOTORES:
+            SessionStore = import_module(motor).SessionStore
+            for nombre, carrito in formatos:
+                store = SessionStore()
+                store['carrito'] = carrito
+                store.save()
+                tamano = len(store.encode(store._session))
+
+                inicio = time.perf_counter()
+                for i in range(opts['escrituras']):
+                    # Simula "agregar al carrito": una línea cambia y se guarda
+                    carrito = dict(carrito)
+                    carrito['1'] = carrito['1'] if nombre == 'antiguo' else i + 1
+                    store['carrito'] = carrito
+                    store.save()
+                duracion = (time.perf_counter() - inicio) / opts['escrituras']
+                store.delete()
+
+                self.stdout.write(
+                    f"{motor.rsplit('.', 1)[-1]:<12} {nombre:<10} {tamano:>8} {duracion * 1000:>14.3f}"
+                )
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tienda import imagenes
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera las versiones reducidas (WebP/JPEG) de las imágenes encoladas "
+        "en ImagenPendiente. Con --continuo queda corriendo como worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=20,
+                            help="Imágenes por lote.")
+        parser.add_argument('--max-intentos', type=int, default=3,
+                            help="Intentos antes de marcar una imagen como fallida.")
+        parser.add_argument('--continuo', action='store_true',
+                            help="No terminar: seguir revisando la cola.")
+        parser.add_argument('--pausa', type=float, default=5,
+                            help="Segundos de espera cuando la cola está vacía (modo continuo).")
+
+    def handle(self, *args, **opts):
+        total_listas = total_fallidas = 0
+        while True:
+            listas, fallidas = imagenes.procesar_pendientes(opts['lote'], opts['max_intentos'])
+            total_listas += listas
+            total_fallidas += fallidas
+            if listas or fallidas:
+                self.stdout.write(f"Lote: {listas} listas, {fallidas} con error")
+
+            if listas + fallidas < opts['lote']:
+                if not opts['continuo']:
+                    break
+                time.sleep(opts['pausa'])
+
+        self.stdout.write(f"Procesadas: {total_listas}, con error: {total_fallidas}")
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tienda import precios_efectivos
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula la tabla de precios efectivos (PrecioEfectivo). "
+        "Pensado para correr a medianoche por los cambios de activo_desde/activo_hasta."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=1,
+                            help="Cantidad de días a precalcular a partir de hoy.")
+        parser.add_argument('--conservar', action='store_true',
+                            help="No borrar las filas de días anteriores.")
+
+    def handle(self, *args, **opts):
+        hoy = timezone.localdate()
+        for i in range(opts['dias']):
+            fecha = hoy + timedelta(days=i)
+            n = precios_efectivos.refrescar(fecha)
+            self.stdout.write(f"{fecha}: {n} productos")
+
+        if not opts['conservar']:
+            borradas = precios_efectivos.eliminar_anteriores(hoy)
+            self.stdout.write(f"Filas antiguas eliminadas: {borradas}")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tienda import busqueda
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda de productos (tienda.busqueda)."
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            n = busqueda.reconstruir()
+        self.stdout.write(f"{type(busqueda.get_backend()).__name__}: {n} productos indexados")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from tienda.webpay_falso import ServidorWebpayFalso
+
+
+class Command(BaseCommand):
+    help = (
+        "Levanta un Webpay Plus falso (create/commit/status y formulario de pago) "
+        "para pruebas locales y de carga. Usar con WEBPAY_PLUS_HOST=http://<host>:<puerto>."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--puerto', type=int, default=8765)
+        parser.add_argument('--latencia', type=float, default=0.0,
+                            help="Segundos de espera por llamada a la API.")
+        parser.add_argument('--errores', type=float, default=0.0,
+                            help="Fracción de llamadas que responden 503 (0 a 1).")
+        parser.add_argument('--rechazar', action='store_true',
+                            help="Rechazar todos los pagos en el commit.")
+
+    def handle(self, *args, **opts):
+        servidor = ServidorWebpayFalso(
+            opts['host'], opts['puerto'],
+            latencia=opts['latencia'], errores=opts['errores'],
+            rechazar=opts['rechazar'], verboso=opts['verbosity'] > 1,
+        )
+        self.stdout.write(f"Webpay falso en {servidor.url} (Ctrl+C para salir)")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+            self.stdout.write(f"Llamadas atendidas: {servidor.contadores}")
@@ -0,0 +1,42 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from .context_processors import COOKIE_CARRITO, SAL_CARRITO
+
+
+@sync_and_async_middleware
+def cookie_carrito(get_response):
+    """
+    Deja en una cookie firmada el contador del carrito cuando cambió en el
+    request (request.carrito_count_nuevo), para que el badge no tenga que
+    cargar la sesión (tienda.context_processors.contar_carrito).
+
+    Va antes de SessionMiddleware: la respuesta pasa por aquí después de
+    guardar la sesión, cuando una sesión nueva ya tiene su clave.
+
+    Soporta async: un middleware solo síncrono obliga a Django a correr
+    cada request ASGI en el hilo compartido de sync_to_async, y las vistas
+    de tienda.views_async quedarían en fila una tras otra.
+    """
+    def poner_cookie(request, response):
+        valor = getattr(request, 'carrito_count_nuevo', None)
+        session = getattr(request, 'session', None)
+        if valor is not None and session is not None and session.session_key:
+            response.set_signed_cookie(
+                COOKIE_CARRITO, f'{session.session_key}:{valor}', salt=SAL_CARRITO,
+                max_age=settings.SESSION_COOKIE_AGE, httponly=True, samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return poner_cookie(request, await get_response(request))
+
+        markcoroutinefunction(middleware)
+    else:
+        def middleware(request):
+            return poner_cookie(request, get_response(request))
+
+    return middleware
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+TABLA_FTS = 'tienda_producto_fts'
+
+
+def crear_indice(apps, schema_editor):
+    # Solo SQLite tiene FTS5; otras bases usan tienda.busqueda.BusquedaORM
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Producto = apps.get_model('adminpanel', 'Producto')
+    categorias = dict(Producto._meta.get_field('categoria').choices)
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5("
+            "nombre, descripcion, categoria, tokenize='unicode61 remove_diacritics 2')"
+        )
+        cursor.executemany(
+            f'INSERT INTO {TABLA_FTS} (rowid, nombre, descripcion, categoria) VALUES (%s, %s, %s, %s)',
+            [
+                (p.id, p.nombre or '', p.descripcion or '', f"{p.categoria} {categorias.get(p.categoria, '')}")
+                for p in Producto.objects.only('id', 'nombre', 'descripcion', 'categoria')
+            ],
+        )
+
+
+def borrar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLA_FTS}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0002_correopendiente'),
+        ('adminpanel', '0015_pedido_huella_carrito'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:03
+
+from django.db import migrations, models
+
+
+def reencolar_listas(apps, schema_editor):
+    # Las ya procesadas no tienen sus anchos registrados: procesar_imagenes
+    # las vuelve a generar y los registra
+    ImagenPendiente = apps.get_model('tienda', 'ImagenPendiente')
+    ImagenPendiente.objects.filter(estado='lista').update(estado='pendiente')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0004_imagenpendiente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagenpendiente',
+            name='anchos',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(reencolar_listas, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 
 class Perfil(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -12,3 +13,64 @@ class Perfil(models.Model):
     def __str__(self):
         return self.user.username
 
+
+
+class CorreoPendiente(models.Model):
+    """
+    Bandeja de salida: las vistas solo encolan (tienda.correos.encolar) y
+    el comando `enviar_correos` los despacha en lotes, con reintentos.
+    """
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('enviado', 'Enviado'),
+        ('fallido', 'Fallido'),
+    ]
+
+    asunto = models.CharField(max_length=255)
+    cuerpo = models.TextField()
+    remitente = models.CharField(max_length=255, blank=True)
+    destinatarios = models.JSONField(default=list)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    enviado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento'], name='correo_estado_proximo'),
+        ]
+
+    def __str__(self):
+        return f"{self.asunto} -> {', '.join(self.destinatarios)}"
+
+
+class ImagenPendiente(models.Model):
+    """
+    Cola de imágenes subidas que aún no tienen sus versiones reducidas
+    (tienda.imagenes); las procesa el comando `procesar_imagenes`.
+    """
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('lista', 'Lista'),
+        ('fallida', 'Fallida'),
+    ]
+
+    nombre = models.CharField(max_length=255, unique=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    ultimo_error = models.TextField(blank=True)
+    creada = models.DateTimeField(auto_now_add=True)
+    procesada = models.DateTimeField(null=True, blank=True)
+    # Anchos de las derivadas generadas; el tag {% imagen %} los lee de
+    # aquí (vía caché) en vez de preguntar al almacenamiento por cada una
+    anchos = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado', 'id'], name='imagen_estado_id'),
+        ]
+
+    def __str__(self):
+        return f"{self.nombre}: {self.estado}"
@@ -0,0 +1,123 @@
+"""
+Paginación por cursor (keyset) para los listados de la tienda y del panel.
+
+En vez de OFFSET, cada página pide las filas que vienen después (o antes)
+de la última fila mostrada según el orden del listado:
+
+    WHERE (fecha < %s) OR (fecha = %s AND id < %s) ORDER BY fecha DESC, id DESC LIMIT n
+
+Con un índice que cubra el orden, cualquier página cuesta lo mismo que la
+primera. El orden debe terminar en un campo único (id) para que sea
+estable, y sus campos no pueden ser nulos.
+
+El cursor viaja en la URL (?desde=... / ?hasta=...) como los valores de
+esos campos en JSON + base64. Un cursor inválido muestra la primera página.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class Pagina:
+    def __init__(self, objetos, siguiente, anterior):
+        self.objetos = objetos
+        self.siguiente_url = siguiente
+        self.anterior_url = anterior
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+    @property
+    def paginada(self):
+        return bool(self.siguiente_url or self.anterior_url)
+
+
+def _valor_json(valor):
+    # isoformat completo: DjangoJSONEncoder recorta los microsegundos y el
+    # cursor dejaría de calzar con la fila
+    return valor.isoformat() if hasattr(valor, 'isoformat') else str(valor)
+
+
+def _codificar(valores):
+    return base64.urlsafe_b64encode(json.dumps(valores, default=_valor_json).encode()).decode().rstrip('=')
+
+
+def _decodificar(cursor, campos):
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(valores, list) or len(valores) != len(campos):
+            return None
+        return [campo.to_python(valor) for campo, valor in zip(campos, valores)]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        return None
+
+
+def _pasado(orden, valores, hacia_atras=False):
+    """Filas que vienen después de `valores` en `orden` (o antes, si hacia_atras)."""
+    condicion = Q()
+    iguales = {}
+    for campo, valor in zip(orden, valores):
+        nombre = campo.lstrip('-')
+        descendente = campo.startswith('-') != hacia_atras
+        condicion |= Q(**iguales, **{f'{nombre}__{"lt" if descendente else "gt"}': valor})
+        iguales[nombre] = valor
+    return condicion
+
+
+def _invertir(orden):
+    return [campo[1:] if campo.startswith('-') else '-' + campo for campo in orden]
+
+
+def paginar(request, queryset, orden, por_pagina, prefijo='', extra=None):
+    """
+    Página de `queryset` ordenado por `orden` (p. ej. ('-fecha', '-id')).
+    `prefijo` separa los parámetros cuando hay varios listados en una misma
+    página; `extra` son parámetros que se fijan en los enlaces (p. ej. la
+    pestaña activa). Devuelve una Pagina con objetos, siguiente_url y
+    anterior_url (querystrings o None).
+    """
+    modelo = queryset.model
+    campos = [modelo._meta.get_field(campo.lstrip('-')) for campo in orden]
+    nombres = [campo.attname for campo in campos]
+
+    desde = request.GET.get(prefijo + 'desde')
+    hasta = request.GET.get(prefijo + 'hasta')
+    valores_desde = _decodificar(desde, campos) if desde else None
+    valores_hasta = _decodificar(hasta, campos) if hasta and valores_desde is None else None
+
+    if valores_hasta is not None:
+        filas = list(
+            queryset.filter(_pasado(orden, valores_hasta, hacia_atras=True))
+            .order_by(*_invertir(orden))[:por_pagina + 1]
+        )
+        hay_anterior = len(filas) > por_pagina
+        objetos = filas[:por_pagina][::-1]
+        hay_siguiente = True
+    else:
+        if valores_desde is not None:
+            queryset = queryset.filter(_pasado(orden, valores_desde))
+        filas = list(queryset.order_by(*orden)[:por_pagina + 1])
+        hay_siguiente = len(filas) > por_pagina
+        objetos = filas[:por_pagina]
+        hay_anterior = valores_desde is not None
+
+    def enlace(parametro, objeto):
+        params = request.GET.copy()
+        params.pop(prefijo + 'desde', None)
+        params.pop(prefijo + 'hasta', None)
+        for clave, valor in (extra or {}).items():
+            params[clave] = valor
+        params[prefijo + parametro] = _codificar([getattr(objeto, nombre) for nombre in nombres])
+        return '?' + params.urlencode()
+
+    return Pagina(
+        objetos,
+        enlace('desde', objetos[-1]) if hay_siguiente and objetos else None,
+        enlace('hasta', objetos[0]) if hay_anterior and objetos else None,
+    )
@@ -0,0 +1,360 @@
+"""
+Stock y cierre de pedidos pagados con Webpay.
+
+  - webpay_iniciar abre el pedido (abrir_pedido) y reserva el stock
+    (reservar_stock): se descuenta con un UPDATE condicional y queda
+    registrado en ReservaStock con vencimiento. Si se repite con el mismo
+    carrito, libera la reserva del intento anterior (o lo rechaza si ese
+    intento aún espera su token).
+  - webpay_retorno confirma (finalizar_pago) o devuelve el stock
+    (cancelar_pago). El comando `expirar_pedidos` expira en bloque los
+    pendientes abandonados (expirar_vencidos) y devuelve su stock.
+
+Cada paso corre en una transacción y con un número fijo de consultas, sin
+importar cuántas líneas tenga el pedido. Como el stock se modifica con
+UPDATE no pasa por Producto.save(), así que los precios y promociones se
+invalidan explícitamente con signals.productos_modificados.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+
+from adminpanel.models import Producto, Pedido, DetallePedido, ReservaStock
+from . import correos, precios, signals
+
+
+class StockInsuficiente(Exception):
+    """
+    No alcanzó el stock para reservar. `faltantes` es una lista de dicts
+    con producto_id, nombre, solicitado y disponible.
+    """
+
+    def __init__(self, faltantes):
+        self.faltantes = faltantes
+        super().__init__(", ".join(
+            f"{f['nombre'] or f['producto_id']}: {f['disponible']}/{f['solicitado']}" for f in faltantes
+        ))
+
+
+class PagoEnCurso(Exception):
+    """Otra petición del mismo usuario está abriendo el pago de ese carrito."""
+
+
+def _sumar_stock(cantidades, signo):
+    return Case(
+        *[
+            When(id=producto_id, then=F('stock') + Value(signo * cantidad))
+            for producto_id, cantidad in cantidades.items()
+        ],
+        default=F('stock'),
+        output_field=IntegerField(),
+    )
+
+
+def descontar_stock(cantidades):
+    """
+    Descuenta {producto_id: cantidad} sobre el valor actual de la base (no
+    sobre objetos leídos antes). Como en reservar_stock, el UPDATE solo toca
+    los productos con stock suficiente; los demás quedan como están y se
+    devuelven como faltantes (dicts como en StockInsuficiente) para que
+    quien llama decida, en vez de dejar el stock en cero sin avisar.
+    """
+    if not cantidades:
+        return []
+    with transaction.atomic():
+        productos = (
+            Producto.objects.select_for_update().only('id', 'nombre', 'stock').in_bulk(list(cantidades))
+        )
+        alcanza = {
+            producto_id: cantidad for producto_id, cantidad in cantidades.items()
+            if producto_id in productos and productos[producto_id].stock >= cantidad
+        }
+        if alcanza:
+            condicion = Q()
+            for producto_id, cantidad in alcanza.items():
+                condicion |= Q(id=producto_id, stock__gte=cantidad)
+            Producto.objects.filter(condicion).update(stock=_sumar_stock(alcanza, -1))
+    return [
+        {
+            'producto_id': producto_id,
+            'nombre': productos[producto_id].nombre,
+            'solicitado': cantidad,
+            'disponible': productos[producto_id].stock,
+        }
+        for producto_id, cantidad in cantidades.items()
+        if producto_id in productos and producto_id not in alcanza
+    ]
+
+
+def revisar_stock(cantidades):
+    """
+    Revisa {producto_id: cantidad} contra el stock actual con una sola
+    consulta. Devuelve un dict con:
+      - ok: True si todo existe y alcanza
+      - faltantes: dicts con producto_id, nombre, solicitado y disponible
+        (como en StockInsuficiente) de los productos sin stock suficiente
+      - eliminados: ids de los productos que ya no existen
+    """
+    productos = Producto.objects.only('id', 'nombre', 'stock').in_bulk(list(cantidades))
+    faltantes = []
+    eliminados = []
+    for producto_id, cantidad in cantidades.items():
+        producto = productos.get(producto_id)
+        if producto is None:
+            eliminados.append(producto_id)
+        elif producto.stock < cantidad:
+            faltantes.append({
+                'producto_id': producto_id,
+                'nombre': producto.nombre,
+                'solicitado': cantidad,
+                'disponible': producto.stock,
+            })
+    return {
+        'ok': not faltantes and not eliminados,
+        'faltantes': faltantes,
+        'eliminados': eliminados,
+    }
+
+
+def _faltantes(cantidades):
+    revision = revisar_stock(cantidades)
+    return revision['faltantes'] + [
+        {'producto_id': producto_id, 'nombre': None, 'solicitado': cantidades[producto_id], 'disponible': 0}
+        for producto_id in revision['eliminados']
+    ]
+
+
+def reservar_stock(pedido, cantidades, minutos=None):
+    """
+    Aparta {producto_id: cantidad} para `pedido`.
+
+    El descuento es un único UPDATE que solo toca las filas con stock
+    suficiente (WHERE id = ... AND stock >= cantidad); la base evalúa la
+    condición y descuenta en la misma operación, así que dos compras
+    simultáneas del último producto no pueden pasar las dos. Si el número
+    de filas actualizadas no calza con el de productos, se revierte todo y
+    se lanza StockInsuficiente.
+    """
+    if not cantidades:
+        return
+    minutos = minutos or getattr(settings, 'TIENDA_RESERVA_MINUTOS', 15)
+
+    condicion = Q()
+    for producto_id, cantidad in cantidades.items():
+        condicion |= Q(id=producto_id, stock__gte=cantidad)
+
+    with transaction.atomic():
+        actualizados = Producto.objects.filter(condicion).update(stock=_sumar_stock(cantidades, -1))
+        completo = actualizados == len(cantidades)
+        if completo:
+            expira = timezone.now() + timedelta(minutes=minutos)
+            ReservaStock.objects.bulk_create([
+                ReservaStock(pedido=pedido, producto_id=producto_id, cantidad=cantidad, expira=expira)
+                for producto_id, cantidad in cantidades.items()
+            ])
+            signals.productos_modificados(cantidades)
+        else:
+            transaction.set_rollback(True)
+
+    if not completo:
+        raise StockInsuficiente(_faltantes(cantidades))
+
+
+def _consumir_reservas(pedido_id):
+    """Borra las reservas del pedido y devuelve {producto_id: cantidad} reservada."""
+    reservas = ReservaStock.objects.filter(pedido_id=pedido_id)
+    cantidades = dict(
+        reservas.values('producto_id').annotate(total=Sum('cantidad')).values_list('producto_id', 'total')
+    )
+    if cantidades:
+        reservas.delete()
+    return cantidades
+
+
+def cancelar_pago(pedido_id, estado='rechazado'):
+    """
+    Pasa un pedido pendiente a `estado` y devuelve al stock lo reservado.
+    El cambio de estado es condicional, así que si el rechazo y el comando
+    de reservas vencidas llegan a la vez, solo uno devuelve el stock.
+    Devuelve False si el pedido ya no estaba pendiente.
+    """
+    with transaction.atomic():
+        if not Pedido.objects.filter(id=pedido_id, estado='pendiente').update(estado=estado):
+            return False
+        cantidades = _consumir_reservas(pedido_id)
+        if cantidades:
+            Producto.objects.filter(id__in=cantidades).update(stock=_sumar_stock(cantidades, 1))
+            signals.productos_modificados(cantidades)
+    return True
+
+
+def expirar_vencidos(ahora=None, sin_reserva_antes=None):
+    """
+    Expira en bloque, con un número fijo de consultas:
+      - los pedidos pendientes con la reserva vencida (devolviendo el stock)
+      - si se indica `sin_reserva_antes`, los pendientes sin reserva creados
+        antes de esa fecha (p. ej. anteriores a las reservas)
+    Devuelve cuántos pedidos pasaron a 'expirado'.
+    """
+    ahora = ahora or timezone.now()
+    with transaction.atomic():
+        # Sin DISTINCT (PostgreSQL no lo acepta con FOR UPDATE): el join
+        # repite el pedido por cada reserva y se deduplica aquí
+        pedido_ids = list(dict.fromkeys(
+            Pedido.objects.select_for_update(of=('self',))
+            .filter(estado='pendiente', reservas__expira__lt=ahora)
+            .values_list('id', flat=True)
+        ))
+        expirados = 0
+        if pedido_ids:
+            expirados = Pedido.objects.filter(id__in=pedido_ids, estado='pendiente').update(estado='expirado')
+            reservas = ReservaStock.objects.filter(pedido_id__in=pedido_ids)
+            cantidades = dict(
+                reservas.values('producto_id').annotate(total=Sum('cantidad')).values_list('producto_id', 'total')
+            )
+            if cantidades:
+                Producto.objects.filter(id__in=cantidades).update(stock=_sumar_stock(cantidades, 1))
+                reservas.delete()
+                signals.productos_modificados(cantidades)
+
+        if sin_reserva_antes is not None:
+            expirados += Pedido.objects.filter(
+                estado='pendiente', fecha__lt=sin_reserva_antes, reservas__isnull=True
+            ).update(estado='expirado')
+
+    return expirados
+
+
+def purgar_expirados(antes):
+    """Borra los pedidos expirados (nunca pagados) creados antes de `antes`."""
+    borrados, _ = Pedido.objects.filter(estado='expirado', fecha__lt=antes).delete()
+    return borrados
+
+
+def abrir_pedido(usuario, total, cantidades, huella):
+    """
+    Pedido pendiente nuevo para pagar un carrito, con su stock reservado
+    (puede lanzar StockInsuficiente). Cada pedido recibe un solo token de
+    Webpay: dos transacciones con la misma orden de compra podrían cobrarse
+    dos veces.
+
+    Los intentos se serializan por usuario. Un pedido anterior del mismo
+    carrito (misma huella) con la reserva vigente:
+      - si ya tiene su token (botón atrás), se da por abandonado y su
+        reserva se libera antes de reservar de nuevo; si igual llega a
+        pagarse, finalizar_pago lo cierra sin reserva.
+      - si aún no tiene token y se creó hace menos que el timeout de
+        Webpay, otra petición está llamando a create() (doble clic) y se
+        lanza PagoEnCurso.
+    """
+    ahora = timezone.now()
+    minutos = getattr(settings, 'TIENDA_RESERVA_MINUTOS', 15)
+    en_curso = ahora - timedelta(seconds=(
+        getattr(settings, 'WEBPAY_TIMEOUT_CONEXION', 3.05) + getattr(settings, 'WEBPAY_TIMEOUT_LECTURA', 15)
+    ))
+
+    with transaction.atomic():
+        # Bloquea al usuario: dos clics no pueden revisar los pedidos a la vez
+        get_user_model().objects.select_for_update().filter(pk=usuario.pk).first()
+        anteriores = list(
+            Pedido.objects
+            .filter(usuario=usuario, estado='pendiente', huella_carrito=huella, reservas__expira__gt=ahora)
+            .annotate(
+                tokens=Count('transacciones_webpay', distinct=True),
+                tomados=Count('transacciones_webpay', filter=~Q(transacciones_webpay__estado='iniciada'),
+                              distinct=True),
+            )
+        )
+        for anterior in anteriores:
+            if not anterior.tokens and anterior.fecha >= en_curso:
+                raise PagoEnCurso(anterior.id)
+        for anterior in anteriores:
+            # Con un retorno en proceso el pedido se deja como está
+            if not anterior.tomados:
+                cancelar_pago(anterior.id, estado='expirado')
+
+        pedido = Pedido.objects.create(
+            usuario=usuario,
+            total=total,
+            estado='pendiente',
+            huella_carrito=huella,
+        )
+        reservar_stock(pedido, cantidades, minutos)
+    return pedido
+
+
+def marcar_revision(pedido, motivo):
+    """Deja `motivo` en Pedido.revision y avisa a la tienda por correo."""
+    pedido.revision = f"{pedido.revision}; {motivo}" if pedido.revision else motivo
+    pedido.revision = pedido.revision[:Pedido._meta.get_field('revision').max_length]
+    pedido.save(update_fields=['revision'])
+    correos.encolar(
+        f"Pedido #{pedido.id} requiere revisión",
+        f"{motivo}\n\nCliente: {pedido.usuario.username}\nTotal cobrado: ${pedido.total}",
+        [correos.EMAIL_EMPRESA],
+    )
+
+
+def finalizar_pago(pedido_id, lineas):
+    """
+    Marca el pedido como pagado, guarda su detalle y confirma su reserva
+    de stock (o descuenta el stock si la reserva ya no existe; si ya no
+    alcanza, deja el motivo en Pedido.revision y avisa a la tienda).
+    `lineas` son las líneas de _detalle_carrito guardadas al iniciar el pago.
+
+    Devuelve (pedido, lineas) con cada línea completada con su `producto`;
+    las de productos que ya no existen se omiten. Si el pedido ya estaba
+    pagado no modifica nada y `lineas` es None.
+    """
+    with transaction.atomic():
+        pedido = Pedido.objects.select_for_update().select_related('usuario').get(id=pedido_id)
+        if pedido.estado == 'pagado':
+            return pedido, None
+        reservadas = _consumir_reservas(pedido_id)
+        productos = Producto.objects.only('id', 'nombre').in_bulk(
+            [int(item['id']) for item in lineas]
+        )
+
+        detalles = []
+        cerradas = []
+        cantidades = {}
+        for item in lineas:
+            producto = productos.get(int(item['id']))
+            if producto is None:
+                continue
+            cantidad = int(item['cantidad'])
+
+            detalles.append(DetallePedido(
+                pedido=pedido,
+                producto=producto,
+                cantidad=cantidad,
+                precio_unitario=precios.precio_unitario_final(item['subtotal'], cantidad),
+            ))
+            cantidades[producto.id] = cantidades.get(producto.id, 0) + cantidad
+            cerradas.append(dict(item, producto=producto, cantidad=cantidad))
+
+        DetallePedido.objects.bulk_create(detalles)
+
+        # Lo reservado en webpay_iniciar ya salió del stock; solo se descuenta
+        # lo que no alcanzó a quedar reservado (p. ej. si la reserva venció).
+        sin_reserva = {
+            producto_id: cantidad - reservadas.get(producto_id, 0)
+            for producto_id, cantidad in cantidades.items()
+            if cantidad > reservadas.get(producto_id, 0)
+        }
+        faltantes = []
+        if sin_reserva:
+            faltantes = descontar_stock(sin_reserva)
+            signals.productos_modificados(sin_reserva)
+
+        pedido.estado = 'pagado'
+        pedido.save(update_fields=['estado'])
+        if faltantes:
+            # El pago ya se cobró: el pedido sigue, pero lo revisa el personal
+            marcar_revision(pedido, "Pagado sin stock suficiente: " + str(StockInsuficiente(faltantes)))
+
+    return pedido, cerradas
@@ -0,0 +1,119 @@
+"""
+Motor de precios del carrito en pesos enteros (CLP no tiene centavos).
+
+Es la única implementación de las reglas de promoción: la usan el
+carrito, el checkout, Webpay y los reportes. No toca la base de datos;
+recibe líneas y promos ya resueltas y devuelve una cotización.
+
+Reglas de redondeo (siempre al peso, mitad hacia arriba, una sola vez
+por línea):
+  - 2x1:            se pagan cantidad - cantidad // 2 unidades.
+  - porcentaje:     descuento = subtotal * pct / 100.
+  - segunda_unidad: descuento = precio * pct2 / 100 * pares.
+"""
+
+TIPOS_2X1 = ('2x1', '2 x 1', 'two_for_one')
+TIPOS_PORCENTAJE = ('porcentaje', 'percentage', 'descuento_porcentaje')
+TIPOS_SEGUNDA_UNIDAD = (
+    'segunda_unidad',
+    'segunda unidad',
+    'second_unit_pct',
+    'descuento_segunda_unidad',
+)
+
+
+def redondear(numerador, denominador):
+    """División entera redondeando la mitad hacia arriba (valores >= 0)."""
+    return (2 * numerador + denominador) // (2 * denominador)
+
+
+def normalizar_tipo(tipo):
+    tipo = (tipo or '').strip().lower()
+    if tipo in TIPOS_2X1:
+        return '2x1'
+    if tipo in TIPOS_PORCENTAJE:
+        return 'porcentaje'
+    if tipo in TIPOS_SEGUNDA_UNIDAD:
+        return 'segunda_unidad'
+    return tipo
+
+
+def calcular_descuento(tipo, porcentaje, porcentaje_segunda_unidad, precio, cantidad):
+    """Descuento en pesos de una línea de `cantidad` unidades a `precio`."""
+    tipo = normalizar_tipo(tipo)
+
+    if tipo == '2x1':
+        return precio * (cantidad // 2)
+
+    if tipo == 'porcentaje' and porcentaje:
+        return redondear(precio * cantidad * porcentaje, 100)
+
+    if tipo == 'segunda_unidad' and porcentaje_segunda_unidad:
+        return redondear(precio * porcentaje_segunda_unidad * (cantidad // 2), 100)
+
+    return 0
+
+
+def cotizar_linea(producto_id, precio, cantidad, promo=None):
+    """
+    Cotiza una línea. `promo` es cualquier objeto con los campos de
+    Promocion (tipo, porcentaje, porcentaje_segunda_unidad, etiqueta, titulo).
+    """
+    precio = int(precio)
+    cantidad = int(cantidad)
+    subtotal_base = precio * cantidad
+
+    descuento = 0
+    if promo is not None:
+        descuento = min(
+            subtotal_base,
+            calcular_descuento(
+                promo.tipo,
+                promo.porcentaje,
+                promo.porcentaje_segunda_unidad,
+                precio,
+                cantidad,
+            ),
+        )
+
+    return {
+        'producto_id': producto_id,
+        'precio': precio,
+        'cantidad': cantidad,
+        'subtotal_base': subtotal_base,
+        'descuento': descuento,
+        'subtotal': subtotal_base - descuento,
+        'promo_id': promo.id if descuento else None,
+        'etiqueta_promo': (promo.etiqueta or promo.titulo) if descuento else '',
+    }
+
+
+def cotizar_carrito(lineas, promos):
+    """
+    Cotiza un carrito completo.
+
+    `lineas`: iterable de (producto_id, precio, cantidad).
+    `promos`: dict producto_id -> promo aplicable (o sin la llave si no hay).
+
+    Devuelve {'lineas': [...], 'subtotal_base': int, 'descuento': int, 'total': int}.
+    """
+    cotizadas = [
+        cotizar_linea(producto_id, precio, cantidad, promos.get(producto_id))
+        for producto_id, precio, cantidad in lineas
+    ]
+    subtotal_base = sum(linea['subtotal_base'] for linea in cotizadas)
+    descuento = sum(linea['descuento'] for linea in cotizadas)
+
+    return {
+        'lineas': cotizadas,
+        'subtotal_base': subtotal_base,
+        'descuento': descuento,
+        'total': subtotal_base - descuento,
+    }
+
+
+def precio_unitario_final(subtotal, cantidad):
+    """Precio unitario que se guarda en DetallePedido (redondeado al peso)."""
+    if cantidad <= 0:
+        return subtotal
+    return redondear(subtotal, cantidad)
@@ -0,0 +1,185 @@
+"""
+Mantenimiento y lectura de la tabla materializada de precios efectivos
+(adminpanel.PrecioEfectivo): para cada (producto, fecha) guarda la mejor
+promo vigente y el precio unitario resultante.
+
+Se actualiza:
+  - al guardar/eliminar un Producto o una Promocion (tienda/signals.py)
+  - con `manage.py refrescar_precios` a medianoche, para los cambios de
+    activo_desde / activo_hasta
+  - en la lectura, para los productos a los que les falte la fila del día
+
+El carrito y los listados leen de aquí con una sola consulta por índice
+(fecha, producto) en vez de evaluar los filtros de promociones.
+"""
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from adminpanel.models import Producto, PrecioEfectivo
+from . import precios, promociones
+
+try:
+    # Cálculo en arreglos para el catálogo completo; sin NumPy, línea a línea
+    from . import precios_lote
+except ImportError:
+    precios_lote = None
+
+
+CLAVE_VERSION = 'tienda:precios_efectivos:version'
+CLAVE_MODIFICADO = 'tienda:precios_efectivos:modificado'
+
+
+def version():
+    """
+    Versión del catálogo con precios: cambia cada vez que se reescribe la
+    tabla, así que sirve para invalidar todo lo derivado de ella.
+    """
+    return cache.get(CLAVE_VERSION, 0)
+
+
+def publicar_version():
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.set(CLAVE_VERSION, 1, None)
+    cache.set(CLAVE_MODIFICADO, timezone.now().timestamp(), None)
+
+
+def modificado():
+    """
+    Momento en que se publicó la versión actual. Si la caché no lo tiene
+    (p. ej. se reinició), se toma ahora: es preferible invalidar de más.
+    """
+    marca = cache.get(CLAVE_MODIFICADO)
+    if marca is None:
+        marca = timezone.now().timestamp()
+        if not cache.add(CLAVE_MODIFICADO, marca, None):
+            marca = cache.get(CLAVE_MODIFICADO, marca)
+    return datetime.datetime.fromtimestamp(marca, datetime.timezone.utc)
+
+
+def _clave_fecha(fecha):
+    return f'tienda:precios_efectivos:{fecha.isoformat()}'
+
+
+def _precios_del_dia(indice, filas):
+    """[(producto_id, promo_id o None, precio unitario)] para (id, precio, categoria)."""
+    if precios_lote is not None:
+        return precios_lote.precios_catalogo(indice, filas)
+    resultado = []
+    for producto_id, precio, categoria in filas:
+        promo = indice.promo_para(producto_id, categoria)
+        linea = precios.cotizar_linea(producto_id, precio, 1, promo)
+        resultado.append((producto_id, promo.id if promo else None, linea['subtotal']))
+    return resultado
+
+
+def refrescar(fecha=None, producto_ids=None):
+    """
+    Recalcula las filas de `fecha` (hoy por defecto) para todos los
+    productos o solo para `producto_ids`. Devuelve cuántas filas escribió.
+    """
+    hoy = timezone.localdate()
+    fecha = fecha or hoy
+
+    if fecha == hoy:
+        indice = promociones.get_indice()
+    else:
+        indice = promociones.IndicePromociones(fecha, version=None)
+
+    productos = Producto.objects.all()
+    if producto_ids is not None:
+        productos = productos.filter(id__in=producto_ids)
+
+    filas = [
+        PrecioEfectivo(producto_id=producto_id, fecha=fecha, promocion_id=promo_id, precio_unitario=precio)
+        for producto_id, promo_id, precio in _precios_del_dia(
+            indice, productos.values_list('id', 'precio', 'categoria')
+        )
+    ]
+
+    PrecioEfectivo.objects.bulk_create(
+        filas,
+        update_conflicts=True,
+        unique_fields=['fecha', 'producto'],
+        update_fields=['promocion', 'precio_unitario'],
+        batch_size=500,
+    )
+
+    if producto_ids is None:
+        cache.set(_clave_fecha(fecha), True, getattr(settings, 'TIENDA_PRECIOS_REVISION_SEGUNDOS', 60))
+    publicar_version()
+    return len(filas)
+
+
+def eliminar_anteriores(fecha=None):
+    """Borra las filas de días anteriores a `fecha` (hoy por defecto)."""
+    fecha = fecha or timezone.localdate()
+    borradas, _ = PrecioEfectivo.objects.filter(fecha__lt=fecha).delete()
+    return borradas
+
+
+def faltantes(fecha):
+    """Ids de productos sin fila en `fecha` (anti-join por el índice (fecha, producto))."""
+    return list(
+        Producto.objects
+        .filter(~Exists(PrecioEfectivo.objects.filter(fecha=fecha, producto_id=OuterRef('pk'))))
+        .values_list('id', flat=True)
+    )
+
+
+def asegurar_fecha(fecha=None):
+    """
+    Genera las filas que le falten al día: todas si no corrió el comando, o
+    las de productos que no pasaron por los signals (bulk_create, fixtures)
+    o que se guardaron antes de la primera lectura del día. La revisión se
+    repite cada TIENDA_PRECIOS_REVISION_SEGUNDOS.
+    """
+    fecha = fecha or timezone.localdate()
+    if cache.get(_clave_fecha(fecha)):
+        return
+    ids = faltantes(fecha)
+    if ids:
+        refrescar(fecha, producto_ids=ids)
+    cache.set(_clave_fecha(fecha), True, getattr(settings, 'TIENDA_PRECIOS_REVISION_SEGUNDOS', 60))
+
+
+def vigentes():
+    """QuerySet de las filas de hoy con producto y promoción cargados."""
+    hoy = timezone.localdate()
+    asegurar_fecha(hoy)
+    return PrecioEfectivo.objects.filter(fecha=hoy).select_related('producto', 'promocion')
+
+
+def para_productos(producto_ids):
+    """producto_id -> PrecioEfectivo de hoy. Los productos que ya no existen no aparecen."""
+    producto_ids = set(producto_ids)
+    filas = {fila.producto_id: fila for fila in vigentes().filter(producto_id__in=producto_ids)}
+    if len(filas) < len(producto_ids):
+        # Un producto sin fila (creado hace segundos con bulk_create, p. ej.)
+        # no debe desaparecer del carrito: se calcula en el momento
+        sin_fila = list(Producto.objects.filter(id__in=producto_ids - set(filas)).values_list('id', flat=True))
+        if sin_fila:
+            refrescar(producto_ids=sin_fila)
+            filas.update(
+                (fila.producto_id, fila)
+                for fila in vigentes().filter(producto_id__in=producto_ids - set(filas))
+            )
+    return filas
+
+
+def productos_con_precio(filas):
+    """
+    Convierte filas de PrecioEfectivo en productos con `precio_promo`
+    (el precio efectivo de una unidad, solo si es menor al de lista).
+    """
+    productos = []
+    for fila in filas:
+        producto = fila.producto
+        producto.precio_promo = fila.precio_unitario if fila.precio_unitario < producto.precio else None
+        productos.append(producto)
+    return productos
@@ -0,0 +1,202 @@
+"""
+Cotización masiva con NumPy.
+
+Evalúa las mismas reglas que tienda.precios (2x1, porcentaje,
+segunda_unidad, con el mismo redondeo al peso) pero sobre arreglos,
+para cotizar el catálogo completo o pedidos de catering con cientos de
+líneas sin recorrer cada línea en Python.
+
+La tabla del catálogo (precio y promo vigente por producto) se arma a
+partir del índice de promociones y se reutiliza mientras el índice no
+cambie. precios_efectivos.refrescar la usa para recalcular de una vez el
+precio del día de todo el catálogo; `manage.py bench_precios` compara
+contra el cálculo línea a línea.
+"""
+import threading
+
+import numpy as np
+
+from adminpanel.models import Producto
+from . import precios, promociones
+
+
+SIN_PROMO = 0
+TIPO_CODIGO = {
+    '2x1': 1,
+    'porcentaje': 2,
+    'segunda_unidad': 3,
+}
+
+_lock = threading.Lock()
+_tabla = None
+_tabla_indice = None
+
+
+class TablaPrecios:
+    """Arreglos paralelos ordenados por id de producto."""
+
+    def __init__(self, ids, precios_unit, tipos, porcentajes, porcentajes_segunda, promo_ids):
+        orden = np.argsort(ids, kind='stable')
+        self.ids = np.asarray(ids, dtype=np.int64)[orden]
+        self.precios = np.asarray(precios_unit, dtype=np.int64)[orden]
+        self.tipos = np.asarray(tipos, dtype=np.int8)[orden]
+        self.porcentajes = np.asarray(porcentajes, dtype=np.int64)[orden]
+        self.porcentajes_segunda = np.asarray(porcentajes_segunda, dtype=np.int64)[orden]
+        self.promo_ids = np.asarray(promo_ids, dtype=np.int64)[orden]
+
+    @classmethod
+    def desde_indice(cls, indice):
+        return cls.desde_filas(indice, Producto.objects.values_list('id', 'precio', 'categoria'))
+
+    @classmethod
+    def desde_filas(cls, indice, filas):
+        """
+        `filas`: (id, precio, categoria) de los productos a incluir.
+
+        Sin promo propia, la promo de un producto depende solo de su
+        categoría: se resuelve una vez por categoría y se reparte con
+        índices. Solo los productos con promo propia pasan por promo_para.
+        """
+        filas = list(filas)
+        if not filas:
+            return cls([], [], [], [], [], [])
+        ids, precios_unit, categorias = zip(*filas)
+        nombres, por_fila = np.unique(np.array(categorias, dtype=str), return_inverse=True)
+
+        def atributos(promo):
+            if promo is None:
+                return SIN_PROMO, 0, 0, 0
+            return (
+                TIPO_CODIGO.get(precios.normalizar_tipo(promo.tipo), SIN_PROMO),
+                promo.porcentaje or 0,
+                promo.porcentaje_segunda_unidad or 0,
+                promo.id,
+            )
+
+        # Columnas: tipo, porcentaje, porcentaje_segunda, promo_id
+        por_categoria = np.array(
+            [atributos(indice.promo_para(None, categoria)) for categoria in nombres], dtype=np.int64
+        ).reshape(len(nombres), 4)
+        columnas = por_categoria[por_fila]
+
+        propias = np.flatnonzero(np.isin(np.asarray(ids, dtype=np.int64), list(indice.con_promo_propia())))
+        for fila in propias.tolist():
+            producto_id, _, categoria = filas[fila]
+            columnas[fila] = atributos(indice.promo_para(producto_id, categoria))
+
+        return cls(ids, precios_unit, columnas[:, 0], columnas[:, 1], columnas[:, 2], columnas[:, 3])
+
+
+def get_tabla():
+    """Tabla del catálogo para el índice de promociones vigente."""
+    global _tabla, _tabla_indice
+
+    indice = promociones.get_indice()
+    if _tabla is None or _tabla_indice is not indice:
+        with _lock:
+            if _tabla is None or _tabla_indice is not indice:
+                _tabla = TablaPrecios.desde_indice(indice)
+                _tabla_indice = indice
+    return _tabla
+
+
+def cotizar_arreglos(tabla, producto_ids, cantidades):
+    """
+    Cotiza líneas (producto_ids[i], cantidades[i]) contra `tabla`.
+
+    Devuelve un dict de arreglos: encontrado, precio, subtotal_base,
+    descuento, subtotal y promo_id. Las líneas cuyo producto no existe
+    quedan con encontrado=False y montos en cero.
+    """
+    producto_ids = np.asarray(producto_ids, dtype=np.int64)
+    cantidades = np.asarray(cantidades, dtype=np.int64)
+
+    if not len(tabla.ids):
+        ceros = np.zeros(len(producto_ids), dtype=np.int64)
+        return {
+            'encontrado': np.zeros(len(producto_ids), dtype=bool),
+            'precio': ceros,
+            'subtotal_base': ceros,
+            'descuento': ceros,
+            'subtotal': ceros,
+            'promo_id': ceros,
+        }
+
+    pos = np.minimum(np.searchsorted(tabla.ids, producto_ids), len(tabla.ids) - 1)
+    encontrado = tabla.ids[pos] == producto_ids
+
+    precio = np.where(encontrado, tabla.precios[pos], 0)
+    tipo = np.where(encontrado, tabla.tipos[pos], SIN_PROMO)
+    pct = tabla.porcentajes[pos]
+    pct2 = tabla.porcentajes_segunda[pos]
+
+    subtotal_base = precio * cantidades
+    pares = cantidades // 2
+
+    # Mismo redondeo que precios.redondear: (2n + d) // 2d
+    descuento = np.select(
+        [
+            tipo == TIPO_CODIGO['2x1'],
+            tipo == TIPO_CODIGO['porcentaje'],
+            tipo == TIPO_CODIGO['segunda_unidad'],
+        ],
+        [
+            precio * pares,
+            (2 * subtotal_base * pct + 100) // 200,
+            (2 * precio * pct2 * pares + 100) // 200,
+        ],
+        default=0,
+    )
+    descuento = np.minimum(descuento, subtotal_base)
+
+    promo_id = np.where(descuento > 0, tabla.promo_ids[pos], 0)
+
+    return {
+        'encontrado': encontrado,
+        'precio': precio,
+        'subtotal_base': subtotal_base,
+        'descuento': descuento,
+        'subtotal': subtotal_base - descuento,
+        'promo_id': promo_id,
+    }
+
+
+def cotizar_lote(producto_ids, cantidades):
+    """Cotiza contra el catálogo y las promociones vigentes."""
+    return cotizar_arreglos(get_tabla(), producto_ids, cantidades)
+
+
+def precios_catalogo(indice, filas):
+    """
+    Promo vigente y precio efectivo de una unidad para cada producto de
+    `filas` ((id, precio, categoria)), como las filas de PrecioEfectivo
+    (tienda.precios_efectivos.refrescar). La promo se informa aunque no
+    alcance a descontar. Devuelve [(producto_id, promo_id o None, precio)].
+    """
+    tabla = TablaPrecios.desde_filas(indice, filas)
+    montos = cotizar_arreglos(tabla, tabla.ids, np.ones(len(tabla.ids), dtype=np.int64))
+    return [
+        (producto_id, promo_id or None, precio)
+        for producto_id, promo_id, precio in zip(
+            tabla.ids.tolist(), tabla.promo_ids.tolist(), montos['subtotal'].tolist()
+        )
+    ]
+
+
+def precios_unitarios(productos):
+    """
+    Precio efectivo de una unidad para cada producto de `productos`.
+    Devuelve dict producto_id -> precio con promo (solo si es menor al de lista).
+    """
+    ids = [p.id for p in productos]
+    if not ids:
+        return {}
+
+    cotizacion = cotizar_lote(ids, np.ones(len(ids), dtype=np.int64))
+    efectivos = {}
+    for producto_id, subtotal, descuento in zip(
+        ids, cotizacion['subtotal'].tolist(), cotizacion['descuento'].tolist()
+    ):
+        if descuento > 0:
+            efectivos[producto_id] = subtotal
+    return efectivos
@@ -0,0 +1,124 @@
+"""
+Índice en memoria de las promociones vigentes.
+
+Se construye una vez por proceso y se reconstruye cuando:
+  - se guarda o elimina un Producto o una Promocion (ver tienda/signals.py)
+  - cambia el día local (activo_desde / activo_hasta)
+
+La versión también se publica en la caché de Django, así que con un
+backend compartido (redis, memcached) la invalidación llega a todos
+los procesos.
+"""
+import threading
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from adminpanel.models import Promocion
+
+
+CLAVE_VERSION = 'tienda:promociones:version'
+
+_lock = threading.Lock()
+_indice = None
+
+
+class IndicePromociones:
+    """Promos vigentes para una fecha, agrupadas por producto y categoría."""
+
+    def __init__(self, fecha, version):
+        self.fecha = fecha
+        self.version = version
+
+        self.activas = list(
+            Promocion.objects.filter(activa=True)
+            .filter(
+                Q(activo_desde__isnull=True) | Q(activo_desde__lte=fecha),
+                Q(activo_hasta__isnull=True) | Q(activo_hasta__gte=fecha),
+            )
+            .select_related('producto')
+            .order_by('id')
+        )
+
+        self._por_producto = defaultdict(list)
+        self._por_categoria = defaultdict(list)
+        self._por_enlace = defaultdict(list)
+        self._globales = []
+        self._resueltas = {}
+
+        for promo in self.activas:
+            if promo.producto_id:
+                self._por_producto[promo.producto_id].append(promo)
+            if promo.categoria_objetivo == 'all':
+                self._globales.append(promo)
+            elif promo.categoria_objetivo:
+                self._por_categoria[promo.categoria_objetivo].append(promo)
+            if promo.enlace_categoria:
+                self._por_enlace[promo.enlace_categoria].append(promo)
+
+    def candidatas(self, producto_id, categoria):
+        """Promos que podrían aplicar al producto, en orden de prioridad (id)."""
+        encontradas = {}
+        for grupo in (
+            self._por_producto.get(producto_id, ()),
+            self._por_categoria.get(categoria, ()),
+            self._por_enlace.get(categoria, ()),
+            self._globales,
+        ):
+            for promo in grupo:
+                encontradas[promo.id] = promo
+        return [encontradas[pid] for pid in sorted(encontradas)]
+
+    def con_promo_propia(self):
+        """Ids de los productos con alguna promo propia (promo.producto)."""
+        return set(self._por_producto)
+
+    def promo_para(self, producto_id, categoria):
+        """
+        Primera promo aplicable al producto, o None.
+        Las promos 'hasta agotar stock' se saltan si su producto no tiene stock.
+        """
+        clave = (producto_id, categoria)
+        if clave not in self._resueltas:
+            elegida = None
+            for promo in self.candidatas(producto_id, categoria):
+                if promo.hasta_agotar_stock and promo.producto and promo.producto.stock <= 0:
+                    continue
+                elegida = promo
+                break
+            self._resueltas[clave] = elegida
+        return self._resueltas[clave]
+
+    def por_enlace(self, categoria):
+        """Promos cuyo botón apunta a la categoría (para la página de la categoría)."""
+        return list(self._por_enlace.get(categoria, ()))
+
+
+def get_indice():
+    """Devuelve el índice vigente, reconstruyéndolo si cambió la versión o el día."""
+    global _indice
+
+    hoy = timezone.localdate()
+    version = cache.get(CLAVE_VERSION, 0)
+    indice = _indice
+
+    if indice is None or indice.fecha != hoy or indice.version != version:
+        with _lock:
+            indice = _indice
+            if indice is None or indice.fecha != hoy or indice.version != version:
+                indice = IndicePromociones(hoy, version)
+                _indice = indice
+    return indice
+
+
+def invalidar():
+    """Marca el índice como obsoleto en este proceso y en la caché compartida."""
+    global _indice
+
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.set(CLAVE_VERSION, 1, None)
+    _indice = None
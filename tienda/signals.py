@@ -0,0 +1,76 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from adminpanel.models import Producto, Promocion
+from . import autocompletar, busqueda, imagenes, precios_efectivos, promociones
+
+
+def productos_modificados(producto_ids):
+    """
+    Invalida promociones y precios después de cambiar productos sin pasar
+    por save() (p. ej. un .update() con F()), que no dispara post_save.
+
+    El índice de promociones se invalida al confirmar: antes, otra petición
+    podría reconstruirlo con las filas previas bajo la versión nueva y el
+    refresco de precios lo reutilizaría. on_commit respeta el orden de
+    registro, así que refrescar ya ve el índice nuevo.
+    """
+    transaction.on_commit(promociones.invalidar)
+
+    # Si un producto sostiene una promo "hasta agotar stock", su stock
+    # puede cambiar el precio de toda una categoría.
+    ids = set(producto_ids)
+    afecta_otros = any(
+        promo.hasta_agotar_stock and promo.producto_id in ids
+        for promo in promociones.get_indice().activas
+    )
+    producto_ids = None if afecta_otros else list(ids)
+    # robust: si el refresco falla, el cambio ya confirmado no debe
+    # reportarse como error (se registra en el log y se corrige en el
+    # siguiente refresco)
+    transaction.on_commit(lambda: precios_efectivos.refrescar(producto_ids=producto_ids), robust=True)
+
+
+def _encolar_imagen(instance, raw, update_fields):
+    # Las derivadas se generan fuera del request (comando procesar_imagenes)
+    if raw or not instance.imagen:
+        return
+    if update_fields is None or 'imagen' in update_fields:
+        nombre = instance.imagen.name
+        transaction.on_commit(lambda: imagenes.encolar(nombre))
+
+
+@receiver(post_save, sender=Producto)
+def producto_guardado(sender, instance, raw=False, update_fields=None, **kwargs):
+    # El índice de búsqueda solo depende de nombre, descripción y categoría
+    if update_fields is None or set(update_fields) & set(busqueda.CAMPOS):
+        busqueda.indexar([instance])
+        transaction.on_commit(autocompletar.invalidar)
+    _encolar_imagen(instance, raw, update_fields)
+    if raw:
+        transaction.on_commit(promociones.invalidar)
+        return
+    productos_modificados([instance.id])
+
+
+@receiver(post_delete, sender=Producto)
+def producto_eliminado(sender, instance, **kwargs):
+    busqueda.eliminar([instance.id])
+    transaction.on_commit(autocompletar.invalidar)
+    transaction.on_commit(promociones.invalidar)
+    transaction.on_commit(precios_efectivos.publicar_version)
+
+
+@receiver(post_save, sender=Promocion)
+def promocion_guardada(sender, instance, raw=False, update_fields=None, **kwargs):
+    _encolar_imagen(instance, raw, update_fields)
+    promocion_modificada(sender, raw=raw)
+
+
+@receiver(post_delete, sender=Promocion)
+def promocion_modificada(sender, raw=False, **kwargs):
+    transaction.on_commit(promociones.invalidar)
+    if raw:
+        return
+    transaction.on_commit(precios_efectivos.refrescar)
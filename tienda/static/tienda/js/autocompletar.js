@@ -0,0 +1,104 @@
+// Sugerencias mientras se escribe en el buscador.
+// Los inputs con data-autocompletar consultan esa URL (api_buscar_sugerencias
+// en tienda/views.py) y muestran los productos bajo el input. Enter sin
+// elegir una sugerencia envía el formulario a buscar como siempre.
+(function () {
+  var ESPERA_MS = 120;
+
+  function iniciar(input) {
+    var lista = document.createElement('div');
+    lista.className = 'list-group position-absolute shadow-sm d-none';
+    lista.style.zIndex = 1050;
+    lista.style.minWidth = '100%';
+    lista.style.top = '100%';
+    lista.style.left = 0;
+
+    var form = input.form || input.parentNode;
+    form.classList.add('position-relative');
+    form.appendChild(lista);
+
+    var temporizador = null;
+    var ultima = '';
+    var activa = -1;
+
+    function cerrar() {
+      lista.classList.add('d-none');
+      lista.replaceChildren();
+      activa = -1;
+      ultima = '';
+    }
+
+    function marcar(indice) {
+      var items = lista.children;
+      if (!items.length) {
+        return;
+      }
+      activa = (indice + items.length) % items.length;
+      for (var i = 0; i < items.length; i++) {
+        items[i].classList.toggle('active', i === activa);
+      }
+    }
+
+    function mostrar(datos) {
+      if (datos.q !== input.value) {
+        return; // respuesta de una consulta anterior
+      }
+      lista.replaceChildren();
+      activa = -1;
+      datos.resultados.forEach(function (producto) {
+        var item = document.createElement('a');
+        item.className = 'list-group-item list-group-item-action';
+        item.href = producto.url;
+        item.textContent = producto.nombre;
+        lista.appendChild(item);
+      });
+      lista.classList.toggle('d-none', !datos.resultados.length);
+    }
+
+    function consultar() {
+      var q = input.value;
+      if (q === ultima) {
+        return;
+      }
+      ultima = q;
+      if (!q.trim()) {
+        cerrar();
+        return;
+      }
+      fetch(input.dataset.autocompletar + '?' + new URLSearchParams({ q: q }), {
+        headers: { 'X-Requested-With': 'XMLHttpRequest' },
+        credentials: 'same-origin'
+      })
+        .then(function (resp) { return resp.json(); })
+        .then(mostrar)
+        .catch(cerrar);
+    }
+
+    input.addEventListener('input', function () {
+      clearTimeout(temporizador);
+      temporizador = setTimeout(consultar, ESPERA_MS);
+    });
+
+    input.addEventListener('keydown', function (evento) {
+      if (evento.key === 'ArrowDown') {
+        evento.preventDefault();
+        marcar(activa + 1);
+      } else if (evento.key === 'ArrowUp') {
+        evento.preventDefault();
+        marcar(activa - 1);
+      } else if (evento.key === 'Enter' && activa >= 0) {
+        evento.preventDefault();
+        window.location = lista.children[activa].href;
+      } else if (evento.key === 'Escape') {
+        cerrar();
+      }
+    });
+
+    input.addEventListener('blur', function () {
+      // Deja pasar el clic sobre una sugerencia antes de cerrar
+      setTimeout(cerrar, 150);
+    });
+  }
+
+  document.querySelectorAll('input[data-autocompletar]').forEach(iniciar);
+})();
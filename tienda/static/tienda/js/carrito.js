@@ -0,0 +1,109 @@
+// Carrito sin recargar la página.
+// Los enlaces con data-carrito-api y los inputs con data-carrito-cantidad
+// llaman a la API JSON del carrito (tienda/views.py). Si el navegador no
+// tiene JS o la llamada falla, los enlaces siguen funcionando como antes.
+(function () {
+  var meta = document.querySelector('meta[name="csrf-token"]');
+  var csrf = meta ? meta.content : '';
+
+  function enviar(url, datos) {
+    var cuerpo = new URLSearchParams(datos || {});
+    return fetch(url, {
+      method: 'POST',
+      headers: { 'X-CSRFToken': csrf, 'X-Requested-With': 'XMLHttpRequest' },
+      body: cuerpo,
+      credentials: 'same-origin'
+    }).then(function (resp) {
+      if (resp.status >= 500) {
+        throw new Error('HTTP ' + resp.status);
+      }
+      return resp.json();
+    });
+  }
+
+  function avisar(datos) {
+    var contenedor = document.getElementById('carrito-avisos');
+    if (!contenedor || !datos.mensaje) {
+      return;
+    }
+    var alerta = document.createElement('div');
+    alerta.className = 'alert alert-' + (datos.ok ? 'success' : 'warning') + ' mb-3';
+    alerta.textContent = datos.mensaje;
+    contenedor.replaceChildren(alerta);
+  }
+
+  function actualizarBadge(cuenta) {
+    var badge = document.getElementById('carrito-badge');
+    if (!badge) {
+      return;
+    }
+    badge.textContent = cuenta;
+    badge.classList.toggle('d-none', !cuenta);
+  }
+
+  function pintarSubtotal(celda, linea) {
+    if (linea.descuento > 0) {
+      celda.innerHTML =
+        '<span class="text-muted text-decoration-line-through d-block"></span>' +
+        '<strong class="d-block"></strong>' +
+        '<small class="text-success"></small>';
+      celda.children[0].textContent = '$' + linea.subtotal_base;
+      celda.children[1].textContent = '$' + linea.subtotal;
+      celda.children[2].textContent = '(Ahorro: $' + linea.descuento + ')';
+    } else {
+      celda.textContent = '$' + linea.subtotal;
+    }
+  }
+
+  // Solo existe en la página del carrito
+  function actualizarFila(pid, datos) {
+    var fila = document.querySelector('[data-carrito-linea="' + pid + '"]');
+    if (!fila) {
+      return;
+    }
+    if (!datos.carrito_count) {
+      window.location.reload();
+      return;
+    }
+    if (!datos.linea) {
+      fila.remove();
+    } else {
+      fila.querySelector('[data-carrito-cantidad]').value = datos.linea.cantidad;
+      pintarSubtotal(fila.querySelector('[data-carrito-subtotal]'), datos.linea);
+    }
+    var total = document.querySelector('[data-carrito-total]');
+    if (total) {
+      total.textContent = '$' + datos.total;
+    }
+  }
+
+  function aplicar(elemento, datos) {
+    avisar(datos);
+    actualizarBadge(datos.carrito_count);
+    var fila = elemento.closest('[data-carrito-linea]');
+    if (fila) {
+      actualizarFila(fila.dataset.carritoLinea, datos);
+    }
+  }
+
+  document.addEventListener('click', function (evento) {
+    var enlace = evento.target.closest('a[data-carrito-api]');
+    if (!enlace) {
+      return;
+    }
+    evento.preventDefault();
+    enviar(enlace.dataset.carritoApi)
+      .then(function (datos) { aplicar(enlace, datos); })
+      .catch(function () { window.location.href = enlace.href; });
+  });
+
+  document.addEventListener('change', function (evento) {
+    var input = evento.target.closest('input[data-carrito-cantidad]');
+    if (!input) {
+      return;
+    }
+    enviar(input.dataset.carritoCantidad, { cantidad: input.value })
+      .then(function (datos) { aplicar(input, datos); })
+      .catch(function () { window.location.reload(); });
+  });
+})();
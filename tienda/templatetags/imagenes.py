@@ -0,0 +1,36 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from tienda import imagenes
+
+register = template.Library()
+
+
+def _srcset(storage, lista):
+    return ', '.join(f'{storage.url(nombre)} {ancho}w' for ancho, nombre in lista)
+
+
+@register.simple_tag
+def imagen(archivo, alt='', sizes='100vw', **atributos):
+    """
+    <picture> con las derivadas de `archivo` (un ImageField) en WebP y JPEG:
+
+        {% imagen p.imagen p.nombre sizes="(min-width: 768px) 25vw, 50vw" class="card-img-top" %}
+
+    El src es el original, que el navegador usa si aún no hay derivadas.
+    """
+    storage = archivo.storage
+    webp = imagenes.derivadas(archivo.name, 'webp')
+    jpg = imagenes.derivadas(archivo.name, 'jpg')
+
+    atributos.setdefault('loading', 'lazy')
+    atributos.update({'src': archivo.url, 'alt': alt})
+    if jpg:
+        atributos.update({'srcset': _srcset(storage, jpg), 'sizes': sizes})
+    if not webp:
+        return format_html('<img{}>', flatatt(atributos))
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}"><img{}></picture>',
+        _srcset(storage, webp), sizes, flatatt(atributos),
+    )
@@ -1 +1,194 @@
-from django.test import TestCase
\ No newline at end of file
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, close_old_connections
+from django.test import SimpleTestCase, TransactionTestCase
+from transbank.error.transaction_commit_error import TransactionCommitError
+from transbank.error.transaction_create_error import TransactionCreateError
+
+from adminpanel.models import Producto, Pedido, ReservaStock
+from tienda import pedidos
+from tienda.webpay import Circuito, CircuitoAbierto, ClienteWebpay, _interpretar
+from tienda.webpay_falso import ServidorWebpayFalso
+
+
+class ReservaStockConcurrenteTests(TransactionTestCase):
+    """
+    Varios hilos intentan reservar el mismo producto a la vez (cada uno con
+    su propia conexión). Nunca debe reservarse más de lo que hay en stock.
+    """
+
+    HILOS = 16
+    STOCK = 5
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('cliente', 'cliente@example.com', 'clave')
+        self.producto = Producto.objects.create(
+            nombre='Torta tres leches', precio=15000, categoria='tortas', stock=self.STOCK
+        )
+        self.pedidos = [
+            Pedido.objects.create(usuario=self.usuario, total=15000, estado='pendiente')
+            for _ in range(self.HILOS)
+        ]
+
+    def _martillar(self, cantidad):
+        barrera = threading.Barrier(self.HILOS)
+        resultados = []
+        lock = threading.Lock()
+
+        def comprar(pedido):
+            try:
+                barrera.wait()
+                while True:
+                    try:
+                        pedidos.reservar_stock(pedido, {self.producto.id: cantidad})
+                        resultado = True
+                        break
+                    except pedidos.StockInsuficiente:
+                        resultado = False
+                        break
+                    except OperationalError:
+                        # SQLite bloquea la tabla completa: reintentar
+                        time.sleep(0.001)
+                with lock:
+                    resultados.append(resultado)
+            finally:
+                close_old_connections()
+
+        hilos = [threading.Thread(target=comprar, args=(pedido,)) for pedido in self.pedidos]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return resultados
+
+    def test_no_se_vende_mas_que_el_stock(self):
+        resultados = self._martillar(1)
+
+        self.producto.refresh_from_db()
+        self.assertEqual(len(resultados), self.HILOS)
+        self.assertEqual(resultados.count(True), self.STOCK)
+        self.assertEqual(self.producto.stock, 0)
+        self.assertEqual(ReservaStock.objects.count(), self.STOCK)
+
+    def test_reserva_mayor_al_stock_no_descuenta(self):
+        resultados = self._martillar(2)
+
+        self.producto.refresh_from_db()
+        exitos = resultados.count(True)
+        self.assertEqual(exitos, self.STOCK // 2)
+        self.assertEqual(self.producto.stock, self.STOCK - 2 * exitos)
+        self.assertGreaterEqual(self.producto.stock, 0)
+
+    def test_cancelar_devuelve_el_stock_una_sola_vez(self):
+        pedido = self.pedidos[0]
+        pedidos.reservar_stock(pedido, {self.producto.id: 3})
+
+        self.assertTrue(pedidos.cancelar_pago(pedido.id))
+        self.assertFalse(pedidos.cancelar_pago(pedido.id, estado='expirado'))
+
+        self.producto.refresh_from_db()
+        pedido.refresh_from_db()
+        self.assertEqual(self.producto.stock, self.STOCK)
+        self.assertEqual(pedido.estado, 'rechazado')
+        self.assertFalse(ReservaStock.objects.exists())
+
+    def test_finalizar_confirma_la_reserva_sin_descontar_dos_veces(self):
+        pedido = self.pedidos[0]
+        pedidos.reservar_stock(pedido, {self.producto.id: 2})
+        lineas = [{'id': self.producto.id, 'cantidad': 2, 'precio': 15000, 'subtotal': 30000}]
+
+        pedidos.finalizar_pago(pedido.id, lineas)
+
+        self.producto.refresh_from_db()
+        pedido.refresh_from_db()
+        self.assertEqual(self.producto.stock, self.STOCK - 2)
+        self.assertEqual(pedido.estado, 'pagado')
+        self.assertFalse(ReservaStock.objects.exists())
+
+
+class CircuitoWebpayTests(SimpleTestCase):
+    """
+    ClienteWebpay contra el Webpay falso: errores 5xx y timeouts abren el
+    circuito, los 4xx no, y tras la espera pasa una sola llamada de prueba.
+    """
+
+    FALLOS = 3
+    ESPERA = 0.2
+
+    def setUp(self):
+        self.servidor = ServidorWebpayFalso()
+        host = self.servidor.iniciar()
+        self.addCleanup(self.servidor.detener)
+        self.cliente = ClienteWebpay('597055555532', 'clave', host, timeout=(1, 0.1),
+                                     fallos_max=self.FALLOS, espera=self.ESPERA)
+        self.addCleanup(self.cliente.session.close)
+
+    def _crear(self):
+        return self.cliente.create('orden1', 'sesion1', 1000, 'http://localhost/retorno/')
+
+    def _abrir(self):
+        self.servidor.errores = 1.0
+        for _ in range(self.FALLOS):
+            with self.assertRaises(TransactionCreateError) as error:
+                self._crear()
+            self.assertEqual(error.exception.code, 503)
+
+    def test_errores_5xx_abren_el_circuito(self):
+        self._abrir()
+        self.assertTrue(self.cliente.circuito.abierto)
+        with self.assertRaises(CircuitoAbierto):
+            self._crear()
+
+    def test_errores_4xx_no_abren_el_circuito(self):
+        for _ in range(self.FALLOS + 1):
+            with self.assertRaises(TransactionCommitError) as error:
+                self.cliente.commit('token-inexistente')
+            self.assertEqual(error.exception.code, 422)
+        self.assertFalse(self.cliente.circuito.abierto)
+        self.assertIn('token', self._crear())
+
+    def test_timeout_cuenta_como_fallo(self):
+        self.servidor.latencia = 0.3
+        for _ in range(self.FALLOS):
+            with self.assertRaises(TransactionCreateError) as error:
+                self._crear()
+            self.assertEqual(error.exception.code, 0)
+        self.assertTrue(self.cliente.circuito.abierto)
+
+    def test_se_recupera_tras_la_espera(self):
+        self._abrir()
+        self.servidor.errores = 0.0
+        time.sleep(self.ESPERA)
+        self.assertIn('token', self._crear())
+        self.assertFalse(self.cliente.circuito.abierto)
+        self.assertIn('token', self._crear())
+
+    def test_prueba_fallida_vuelve_a_abrir(self):
+        self._abrir()
+        time.sleep(self.ESPERA)
+        with self.assertRaises(TransactionCreateError):
+            self._crear()
+        with self.assertRaises(CircuitoAbierto):
+            self._crear()
+
+    def test_una_sola_llamada_de_prueba(self):
+        circuito = Circuito(fallos_max=1, espera=self.ESPERA)
+        circuito.fallo()
+        self.assertFalse(circuito.permitir())
+        time.sleep(self.ESPERA)
+        self.assertTrue(circuito.permitir())
+        self.assertFalse(circuito.permitir())
+        circuito.exito()
+        self.assertTrue(circuito.permitir())
+        self.assertTrue(circuito.permitir())
+
+    def test_respuesta_que_no_es_json(self):
+        # Página de error de un proxy delante de Transbank
+        circuito = Circuito(fallos_max=1)
+        with self.assertRaises(TransactionCreateError) as error:
+            _interpretar(circuito, 200, '<html>Bad gateway</html>', TransactionCreateError)
+        self.assertEqual(error.exception.code, 200)
+        self.assertIn('<html>Bad gateway</html>', error.exception.message)
+        self.assertTrue(circuito.abierto)
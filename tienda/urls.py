@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, views_async
 from django.contrib.auth import views as auth_views
 from django.urls import path, include
 from django.urls import path, include, reverse_lazy
@@ -16,17 +16,24 @@ urlpatterns = [
     path('productos/categoria/<str:slug>/', views.productos_categoria, name='productos_categoria'),
     path('producto/<int:pk>/', views.producto_detalle, name='producto_detalle'),
     path('buscar/', views.buscar, name='buscar'),
+    path('buscar/sugerencias/', views.api_buscar_sugerencias, name='buscar_sugerencias'),
 
     # Carrito
     path('carrito/', views.carrito_ver, name='carrito'),
     path('carrito/agregar/<int:pid>/', views.carrito_agregar, name='carrito_agregar'),
     path('carrito/eliminar/<int:pid>/', views.carrito_eliminar, name='carrito_eliminar'),
     path('carrito/vaciar/', views.carrito_vaciar, name='carrito_vaciar'),
+    path('carrito/api/agregar/<int:pid>/', views.api_carrito_agregar, name='api_carrito_agregar'),
+    path('carrito/api/cantidad/<int:pid>/', views.api_carrito_cantidad, name='api_carrito_cantidad'),
+    path('carrito/api/eliminar/<int:pid>/', views.api_carrito_eliminar, name='api_carrito_eliminar'),
+    path('carrito/api/validar/', views.api_carrito_validar, name='api_carrito_validar'),
     path('checkout/', views.checkout, name='checkout'),
 
     # Webpay
     path('webpay/iniciar/', views.webpay_iniciar, name='webpay_iniciar'),
     path('webpay/retorno/', views.webpay_retorno, name='webpay_retorno'),
+    path('webpay/async/iniciar/', views_async.webpay_iniciar, name='webpay_iniciar_async'),
+    path('webpay/async/retorno/', views_async.webpay_retorno, name='webpay_retorno_async'),
     
     # Cuenta
     path('cuenta/login/', views.login_view, name='login'),
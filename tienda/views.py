@@ -1,116 +1,69 @@
 import random
-from decimal import Decimal, ROUND_HALF_UP
+import time
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.urls import reverse, reverse_lazy
 from django.contrib.auth.views import PasswordResetView
-from django.utils import timezone
-from django.db.models import Q
+from django.db import IntegrityError, transaction
 
 from .forms import RegistroForm, EmailAuthenticationForm
-from adminpanel.models import Producto, Promocion, Pedido, DetallePedido
+from . import autocompletar, busqueda, catalogo, correos, cotizaciones, paginacion, pedidos, precios, precios_efectivos, promociones, webpay
+from adminpanel.models import Producto, TransaccionWebpay
 
-# TRANSBANK SDK 6.1.0
-from transbank.common.options import WebpayOptions
-from transbank.webpay.webpay_plus.transaction import Transaction
+# TRANSBANK SDK 6.1.0 (el cliente HTTP está en tienda.webpay)
+from transbank.error.transaction_commit_error import TransactionCommitError
 
 
 # ============================================================
 # FUNCIONES DE CARRITO
 # ============================================================
 def _get_carrito(request):
-    return request.session.get('carrito', {})
+    """
+    Carrito compacto en sesión: {'<producto_id>': cantidad}.
+    Nombre, precio, imagen y montos se recalculan con _detalle_carrito.
+    """
+    carrito = request.session.get('carrito', {})
+    # Sesiones antiguas guardaban un dict completo por línea
+    return {
+        pid: int(valor['cantidad']) if isinstance(valor, dict) else int(valor)
+        for pid, valor in carrito.items()
+    }
 
 
-def _save_carrito(request, carrito):
+def _save_carrito(request, carrito, cuenta=None):
+    """
+    Guarda el carrito. `cuenta` es el nuevo total de unidades para el badge
+    (ver tienda.context_processors); si no se indica, se recalcula.
+    """
     request.session['carrito'] = carrito
+    request.session['carrito_count'] = sum(carrito.values()) if cuenta is None else cuenta
     request.session.modified = True
+    # tienda.middleware.cookie_carrito copia el contador a la cookie del badge
+    request.carrito_count_nuevo = request.session['carrito_count']
 
 
-def _carrito_cuenta_items(request):
-    return sum(int(item['cantidad']) for item in _get_carrito(request).values())
+def _carrito_cuenta(request):
+    """Contador de unidades mantenido por las vistas del carrito."""
+    cuenta = request.session.get('carrito_count')
+    if cuenta is None:
+        cuenta = sum(_get_carrito(request).values())
+    return cuenta
 
 
 # ------------ PROMOCIONES (ÚNICA LÓGICA VÁLIDA) -------------
-def _aplicar_promocion_a_item(item):
-    """
-    Calcula subtotal con y sin promo para un item del carrito.
-    Soporta distintos valores en promo.tipo:
-      - 2x1 / two_for_one / 2 x 1
-      - porcentaje / percentage / descuento_porcentaje
-      - segunda_unidad / second_unit_pct / descuento_segunda_unidad
-    """
-    producto = Producto.objects.get(pk=item['id'])
-    cantidad = int(item['cantidad'])
-    precio_unitario = Decimal(str(item['precio']))
-    subtotal_base = precio_unitario * cantidad  
-
-    hoy = timezone.now().date()
-
-    promo = (
-        Promocion.objects.filter(activa=True, producto=producto)
-        .filter(
-            Q(activo_desde__lte=hoy) | Q(activo_desde__isnull=True),
-            Q(activo_hasta__gte=hoy) | Q(activo_hasta__isnull=True),
-        )
-        .first()
-    )
-
-    subtotal_desc = subtotal_base
-    descuento = Decimal('0')
-
-    if promo:
-        tipo_norm = (promo.tipo or "").strip().lower()
-
-        # -------- 2x1 --------
-        if tipo_norm in ["2x1", "2 x 1", "two_for_one"] and cantidad >= 2:
-            pares = cantidad // 2
-            resto = cantidad % 2
-            pagar_por = pares + resto    
-            subtotal_desc = precio_unitario * pagar_por
-            descuento = subtotal_base - subtotal_desc
-
-        # -------- % sobre todo --------
-        elif tipo_norm in ["porcentaje", "percentage", "descuento_porcentaje"] and promo.porcentaje:
-            pct = Decimal(str(promo.porcentaje))
-            subtotal_desc = subtotal_base * (Decimal("1") - pct / Decimal("100"))
-            descuento = subtotal_base - subtotal_desc
-
-        # -------- % en segunda unidad --------
-        elif tipo_norm in [
-            "segunda_unidad",
-            "second_unit_pct",
-            "descuento_segunda_unidad",
-            "segunda unidad",
-        ] and promo.porcentaje_segunda_unidad and cantidad >= 2:
-            pct2 = Decimal(str(promo.porcentaje_segunda_unidad))
-            pares = cantidad // 2
-            resto = cantidad % 2
-
-            precio_par = precio_unitario + (
-                precio_unitario * (Decimal("1") - pct2 / Decimal("100"))
-            )
-
-            subtotal_desc = precio_par * pares + precio_unitario * resto
-            descuento = subtotal_base - subtotal_desc
-
-    return {
-        "promo": promo,
-        "subtotal_base": subtotal_base,
-        "subtotal_desc": subtotal_desc,
-        "descuento": descuento,
-    }
-
-def _aplicar_promos_a_carrito(carrito):
+def _cotizar_carrito(carrito):
     """
-    Recalcula subtotales y total del carrito aplicando las promociones activas.
+    Cotiza el carrito aplicando las promociones activas.
+    Producto y promo de cada línea salen de la tabla de precios efectivos
+    (tienda.precios_efectivos) en una sola consulta, y los montos los
+    calcula tienda.precios, siempre en pesos enteros.
 
     Soporta:
       - promos por producto (promo.producto)
@@ -118,117 +71,109 @@ def _aplicar_promos_a_carrito(carrito):
       - promos por categoría usando enlace_categoria
       - promos globales (categoria_objetivo = 'all')
     """
-    hoy = timezone.localdate()
-    total = Decimal('0')
+    filas = precios_efectivos.para_productos({int(pid) for pid in carrito})
+
+    lineas = []
+    promos = {}
+    productos = {}
+    for pid, cantidad in carrito.items():
+        fila = filas.get(int(pid))
+        if fila is None:
+            continue
 
-    for key, item in list(carrito.items()):
-        producto_id = int(item['id'])
-        cantidad = int(item['cantidad'])
-        precio_unit = Decimal(str(item['precio'])) 
+        producto = fila.producto
+        if fila.promocion is not None:
+            promos[producto.id] = fila.promocion
+        lineas.append((producto.id, producto.precio, cantidad))
+        productos[producto.id] = {
+            'nombre': producto.nombre,
+            'imagen': producto.imagen.url if producto.imagen else '',
+        }
 
-        try:
-            producto = Producto.objects.get(pk=producto_id)
-        except Producto.DoesNotExist:
-            del carrito[key]
-            continue
+    cotizacion = precios.cotizar_carrito(lineas, promos)
+    cotizacion['productos'] = productos
+    return cotizacion
+
+
+def _detalle_carrito(carrito):
+    """
+    Arma las líneas que muestran las plantillas (nombre, precio, subtotales,
+    promo) y devuelve (detalle, total). La cotización se reutiliza desde
+    tienda.cotizaciones si el carrito y el catálogo no cambiaron.
+    Los productos que ya no existen no aparecen en el detalle.
+    """
+    cotizacion = cotizaciones.cotizar(carrito, _cotizar_carrito)
+
+    detalle = {}
+    for linea in cotizacion['lineas']:
+        producto_id = linea['producto_id']
+        detalle[str(producto_id)] = {
+            'id': producto_id,
+            'nombre': cotizacion['productos'][producto_id]['nombre'],
+            'imagen': cotizacion['productos'][producto_id]['imagen'],
+            'precio': linea['precio'],
+            'cantidad': linea['cantidad'],
+            'subtotal_base': linea['subtotal_base'],
+            'subtotal': linea['subtotal'],
+            'descuento': linea['descuento'],
+            'tiene_promo': linea['descuento'] > 0,
+            'etiqueta_promo': linea['etiqueta_promo'],
+        }
 
-        categoria = producto.categoria
+    return detalle, cotizacion['total']
 
-        subtotal_base = precio_unit * cantidad
-        item['subtotal_base'] = float(subtotal_base)
 
-        item['tiene_promo'] = False
-        item['etiqueta_promo'] = ''
-        item['descuento'] = 0
-        subtotal_final = subtotal_base
+def _podar_carrito(request, carrito, detalle):
+    """Quita de la sesión los productos que ya no existen (no están en el detalle)."""
+    if len(detalle) < len(carrito):
+        _save_carrito(request, {pid: carrito[pid] for pid in detalle})
 
-        # ------ BUSCAR PROMOS CANDIDATAS ------
-        candidatos = (
-            Promocion.objects.filter(activa=True)
-            .filter(
-                Q(producto=producto)
-                | Q(categoria_objetivo=categoria)
-                | Q(enlace_categoria=categoria)
-                | Q(categoria_objetivo='all')
-            )
-            .filter(
-                Q(activo_desde__isnull=True) | Q(activo_desde__lte=hoy),
-                Q(activo_hasta__isnull=True) | Q(activo_hasta__gte=hoy),
-            )
-        )
 
-        promo_aplicable = None
-        for promo in candidatos:
-            if promo.hasta_agotar_stock and promo.producto:
-                if promo.producto.stock <= 0:
-                    continue
-
-            promo_aplicable = promo
-            break
-
-        # ------ APLICAR LA PROMO SI EXISTE ------
-        if promo_aplicable:
-            tipo = (promo_aplicable.tipo or '').lower()
-            descuento = Decimal('0')
-
-            # 2x1
-            if tipo == '2x1':
-                if cantidad >= 2:
-                    pares = cantidad // 2
-                    unidades_pagadas = cantidad - pares   
-                    subtotal_final = precio_unit * unidades_pagadas
-                    descuento = subtotal_base - subtotal_final
-
-            # % a todo
-            elif tipo == 'porcentaje' and promo_aplicable.porcentaje:
-                porc = Decimal(str(promo_aplicable.porcentaje)) / Decimal('100')
-                descuento = subtotal_base * porc
-                subtotal_final = subtotal_base - descuento
-
-            # % en la segunda unidad
-            elif (
-                tipo == 'segunda_unidad'
-                and promo_aplicable.porcentaje_segunda_unidad
-                and cantidad >= 2
-            ):
-                pares = cantidad // 2
-                resto = cantidad % 2
-                porc2 = Decimal(str(promo_aplicable.porcentaje_segunda_unidad)) / Decimal('100')
-
-                descuento_por_par = precio_unit * porc2
-                descuento = descuento_por_par * pares
-                subtotal_final = subtotal_base - descuento
-
-            if descuento > 0:
-                item['tiene_promo'] = True
-                item['etiqueta_promo'] = promo_aplicable.etiqueta or promo_aplicable.titulo
-                item['descuento'] = float(descuento)
-
-        # Guardar subtotal final
-        item['subtotal'] = float(subtotal_final)
-        total += subtotal_final
-
-    return float(total)
+def _revisar_carrito(request, carrito):
+    """
+    Stock de todo el carrito en una consulta (pedidos.revisar_stock). Quita
+    de la sesión (y de `carrito`) los productos eliminados; `faltantes`
+    queda indexado por id de producto en texto, como las líneas del detalle.
+    """
+    revision = pedidos.revisar_stock({int(pid): cantidad for pid, cantidad in carrito.items()})
+    if revision['eliminados']:
+        for producto_id in revision['eliminados']:
+            carrito.pop(str(producto_id), None)
+        _save_carrito(request, carrito)
+    revision['faltantes'] = {str(f['producto_id']): f for f in revision['faltantes']}
+    return revision
+
+
+def _avisar_faltantes(request, faltantes):
+    for faltante in faltantes:
+        if faltante['disponible'] > 0:
+            messages.error(
+                request,
+                f"Solo quedan {faltante['disponible']} unidades de '{faltante['nombre']}' "
+                f"(solicitaste {faltante['solicitado']})."
+            )
+        else:
+            messages.error(request, f"'{faltante['nombre'] or 'Un producto'}' está agotado.")
 
 # ============================================================
 # PÁGINAS PRINCIPALES
 # ============================================================
+@catalogo.condicional
 def home(request):
-    destacados = Producto.objects.filter(destacado=True)[:6]
-    promos_bd = Promocion.objects.filter(activa=True)
-    return render(request, 'tienda/home.html', {
-        'promos': promos_bd,
-        'destacados': destacados,
-        'carrito_count': _carrito_cuenta_items(request)
-    })
+    # Los datos se cargan solo si el fragmento no está en caché (tienda.catalogo)
+    return render(request, 'tienda/home.html', catalogo.contexto(
+        promos=lambda: promociones.get_indice().activas,
+        destacados=lambda: precios_efectivos.productos_con_precio(
+            precios_efectivos.vigentes().filter(producto__destacado=True).order_by('producto_id')[:6]
+        ),
+    ))
 
 
 def nosotros(request):
-    return render(request, 'tienda/nosotros.html', {
-        'carrito_count': _carrito_cuenta_items(request)
-    })
+    return render(request, 'tienda/nosotros.html')
 
 
+@catalogo.condicional
 def productos_index(request):
     categorias = {
         'vitrina': 'Repostería de vitrina',
@@ -236,51 +181,84 @@ def productos_index(request):
         'tortas': 'Tortas'
     }
 
-    promociones = Promocion.objects.filter(activa=True)
-
-    return render(request, 'tienda/productos/index.html', {
-        'categorias': categorias,
-        'promociones': promociones,
-        'carrito_count': _carrito_cuenta_items(request),
-    })
+    contexto = catalogo.contexto(promociones=lambda: promociones.get_indice().activas)
+    contexto['categorias'] = categorias
+    return render(request, 'tienda/productos/index.html', contexto)
 
 
+@catalogo.condicional
 def productos_categoria(request, slug):
-    productos = Producto.objects.filter(categoria=slug)
     nombres_cat = {
         'vitrina': 'Repostería de vitrina',
         'tortas': 'Tortas',
         'postres': 'Postres'
     }
-    promociones_cat = Promocion.objects.filter(activa=True, enlace_categoria=slug)
-
-    return render(request, 'tienda/productos/categoria.html', {
-        'categoria_slug': slug,
-        'categoria_nombre': nombres_cat.get(slug, slug.capitalize()),
-        'productos': productos,
-        'promociones': promociones_cat,
-        'carrito_count': _carrito_cuenta_items(request),
-    })
+
+    def pagina_productos():
+        pagina = paginacion.paginar(
+            request,
+            precios_efectivos.vigentes().filter(producto__categoria=slug),
+            ('producto_id',),
+            getattr(settings, 'TIENDA_POR_PAGINA', 24),
+        )
+        pagina.objetos = precios_efectivos.productos_con_precio(pagina.objetos)
+        return pagina
+
+    contexto = catalogo.contexto(
+        productos=pagina_productos,
+        promociones=lambda: promociones.get_indice().por_enlace(slug),
+    )
+    contexto['categoria_slug'] = slug
+    contexto['categoria_nombre'] = nombres_cat.get(slug, slug.capitalize())
+    # El cursor es parte de la clave del fragmento en caché
+    contexto['cursor'] = f"{request.GET.get('desde', '')}:{request.GET.get('hasta', '')}"
+    return render(request, 'tienda/productos/categoria.html', contexto)
 
 
+@catalogo.condicional
 def producto_detalle(request, pk):
     producto = get_object_or_404(Producto, pk=pk)
     return render(request, 'tienda/producto_detalle.html', {
         'producto': producto,
-        'carrito_count': _carrito_cuenta_items(request)
     })
 
 
 def buscar(request):
     q = request.GET.get('q', '').strip()
-    resultados = Producto.objects.filter(nombre__icontains=q) if q else []
+    resultados = []
+    if q:
+        # Ids ordenados por relevancia (tienda.busqueda)
+        ids = busqueda.buscar(q)
+        productos = Producto.objects.in_bulk(ids)
+        resultados = [productos[producto_id] for producto_id in ids if producto_id in productos]
     return render(request, 'tienda/buscar.html', {
         'query': q,
         'resultados': resultados,
-        'carrito_count': _carrito_cuenta_items(request)
     })
 
 
+def api_buscar_sugerencias(request):
+    """Autocompletar del buscador: productos más vendidos cuyo nombre calza con el prefijo."""
+    q = request.GET.get('q', '')[:100]
+    inicio = time.perf_counter()
+    sugerencias = autocompletar.sugerir(q)
+    duracion = time.perf_counter() - inicio
+
+    respuesta = JsonResponse({
+        'q': q,
+        'resultados': [
+            {
+                'id': s['id'],
+                'nombre': s['nombre'],
+                'url': reverse('tienda:producto_detalle', args=[s['id']]),
+            }
+            for s in sugerencias
+        ],
+    })
+    respuesta['Server-Timing'] = f'trie;dur={duracion * 1000:.3f}'
+    return respuesta
+
+
 # ============================================================
 # CARRITO
 # ============================================================
@@ -291,50 +269,48 @@ def carrito_ver(request):
         return render(request, 'tienda/carrito/ver.html', {
             'carrito': carrito,
             'total': 0,
-            'carrito_count': _carrito_cuenta_items(request)
         })
 
-    total = _aplicar_promos_a_carrito(carrito)
-    _save_carrito(request, carrito)
+    revision = _revisar_carrito(request, carrito)
+    detalle, total = _detalle_carrito(carrito)
+    for pid, faltante in revision['faltantes'].items():
+        if pid in detalle:
+            detalle[pid]['disponible'] = faltante['disponible']
 
     return render(request, 'tienda/carrito/ver.html', {
-        'carrito': carrito,
+        'carrito': detalle,
         'total': total,
-        'carrito_count': _carrito_cuenta_items(request)
     })
 
 
+def _validar_stock(producto, cantidad_actual, cantidad):
+    """Mensaje de error si no se puede dejar `cantidad` unidades en el carrito, o None."""
+    if producto.stock <= 0:
+        return f"'{producto.nombre}' está agotado."
+    if cantidad > producto.stock:
+        if cantidad_actual >= producto.stock:
+            return f"Ya agregaste el máximo disponible de '{producto.nombre}' (stock: {producto.stock})."
+        return f"Solo quedan {producto.stock} unidades de '{producto.nombre}'."
+    return None
+
+
 def carrito_agregar(request, pid):
     producto = get_object_or_404(Producto, pk=pid)
     carrito = _get_carrito(request)
     str_id = str(pid)
 
-    if producto.stock <= 0:
-        messages.error(request, f"'{producto.nombre}' está agotado.")
-        return redirect(request.META.get('HTTP_REFERER', 'tienda:productos'))
-
-    cantidad_actual = carrito.get(str_id, {}).get('cantidad', 0)
-
-    if cantidad_actual >= producto.stock:
-        messages.warning(
-            request,
-            f"Ya agregaste el máximo disponible de '{producto.nombre}' (stock: {producto.stock})."
-        )
+    cantidad_actual = carrito.get(str_id, 0)
+    error = _validar_stock(producto, cantidad_actual, cantidad_actual + 1)
+    if error:
+        if producto.stock <= 0:
+            messages.error(request, error)
+        else:
+            messages.warning(request, error)
         return redirect(request.META.get('HTTP_REFERER', 'tienda:productos'))
 
-    if str_id in carrito:
-        carrito[str_id]['cantidad'] += 1
-    else:
-        img_url = producto.imagen.url if producto.imagen else ''
-        carrito[str_id] = {
-            'id': producto.id,
-            'nombre': producto.nombre,
-            'precio': float(producto.precio), 
-            'imagen': img_url,
-            'cantidad': 1,
-        }
+    carrito[str_id] = cantidad_actual + 1
 
-    _save_carrito(request, carrito)
+    _save_carrito(request, carrito, _carrito_cuenta(request) + 1)
     messages.success(request, f"{producto.nombre} agregado al carrito.")
     return redirect(request.META.get('HTTP_REFERER', 'tienda:productos'))
 
@@ -344,19 +320,122 @@ def carrito_eliminar(request, pid):
     str_id = str(pid)
 
     if str_id in carrito:
-        del carrito[str_id]
-        _save_carrito(request, carrito)
+        cantidad = carrito.pop(str_id)
+        _save_carrito(request, carrito, max(0, _carrito_cuenta(request) - cantidad))
         messages.warning(request, "Producto eliminado del carrito.")
 
     return redirect('tienda:carrito')
 
 
 def carrito_vaciar(request):
-    _save_carrito(request, {})
+    _save_carrito(request, {}, 0)
     messages.info(request, "Carrito vaciado.")
     return redirect('tienda:carrito')
 
 
+# ============================================================
+# API JSON DEL CARRITO
+# ============================================================
+# Las usa tienda/js/carrito.js para actualizar la página sin recargarla.
+# Responden con la línea del producto (o null si ya no está en el carrito),
+# el contador del badge y el total cotizado.
+
+def _respuesta_carrito(request, carrito, pid, mensaje, status=200):
+    if carrito:
+        detalle, total = _detalle_carrito(carrito)
+    else:
+        detalle, total = {}, 0
+    return JsonResponse({
+        'ok': status == 200,
+        'mensaje': mensaje,
+        'linea': detalle.get(str(pid)),
+        'carrito_count': _carrito_cuenta(request),
+        'total': total,
+    }, status=status)
+
+
+def _cantidad_post(request, defecto=None):
+    try:
+        return int(request.POST.get('cantidad', defecto))
+    except (TypeError, ValueError):
+        return None
+
+
+@require_POST
+def api_carrito_agregar(request, pid):
+    producto = Producto.objects.only('id', 'nombre', 'stock').filter(pk=pid).first()
+    if producto is None:
+        return JsonResponse({'ok': False, 'mensaje': "El producto no existe."}, status=404)
+
+    cantidad = _cantidad_post(request, 1)
+    if cantidad is None or cantidad < 1:
+        return JsonResponse({'ok': False, 'mensaje': "Cantidad inválida."}, status=400)
+
+    carrito = _get_carrito(request)
+    str_id = str(pid)
+    cantidad_actual = carrito.get(str_id, 0)
+
+    error = _validar_stock(producto, cantidad_actual, cantidad_actual + cantidad)
+    if error:
+        return _respuesta_carrito(request, carrito, pid, error, status=409)
+
+    carrito[str_id] = cantidad_actual + cantidad
+    _save_carrito(request, carrito, _carrito_cuenta(request) + cantidad)
+    return _respuesta_carrito(request, carrito, pid, f"{producto.nombre} agregado al carrito.")
+
+
+@require_POST
+def api_carrito_cantidad(request, pid):
+    """Fija la cantidad de un producto; 0 lo quita del carrito."""
+    cantidad = _cantidad_post(request)
+    if cantidad is None or cantidad < 0:
+        return JsonResponse({'ok': False, 'mensaje': "Cantidad inválida."}, status=400)
+
+    if cantidad == 0:
+        return api_carrito_eliminar(request, pid)
+
+    carrito = _get_carrito(request)
+    str_id = str(pid)
+    cantidad_actual = carrito.get(str_id, 0)
+
+    producto = Producto.objects.only('id', 'nombre', 'stock').filter(pk=pid).first()
+    if producto is None:
+        return JsonResponse({'ok': False, 'mensaje': "El producto no existe."}, status=404)
+
+    error = _validar_stock(producto, cantidad_actual, cantidad)
+    if error:
+        return _respuesta_carrito(request, carrito, pid, error, status=409)
+
+    carrito[str_id] = cantidad
+    _save_carrito(request, carrito, _carrito_cuenta(request) + cantidad - cantidad_actual)
+    return _respuesta_carrito(request, carrito, pid, "Cantidad actualizada.")
+
+
+@require_POST
+def api_carrito_eliminar(request, pid):
+    carrito = _get_carrito(request)
+    str_id = str(pid)
+
+    if str_id in carrito:
+        cantidad = carrito.pop(str_id)
+        _save_carrito(request, carrito, max(0, _carrito_cuenta(request) - cantidad))
+
+    return _respuesta_carrito(request, carrito, pid, "Producto eliminado del carrito.")
+
+
+def api_carrito_validar(request):
+    """Stock de todo el carrito (lo mismo que revisa checkout). 409 si algo no alcanza."""
+    carrito = _get_carrito(request)
+    revision = _revisar_carrito(request, carrito) if carrito else {'faltantes': {}, 'eliminados': []}
+    faltantes = list(revision['faltantes'].values())
+    return JsonResponse({
+        'ok': not faltantes,
+        'faltantes': faltantes,
+        'eliminados': revision['eliminados'],
+        'carrito_count': _carrito_cuenta(request),
+    }, status=409 if faltantes else 200)
+
+
 # ============================================================
 # CHECKOUT
 # ============================================================
@@ -368,27 +447,28 @@ def checkout(request):
         messages.info(request, "El carrito está vacío.")
         return redirect('tienda:productos')
 
-    # Validación de stock antes del pago
-    for item in carrito.values():
-        producto = Producto.objects.get(id=int(item['id']))
-        cantidad = int(item['cantidad'])
-
-        if producto.stock < cantidad:
-            messages.error(
-                request,
-                f"No hay suficiente stock para '{producto.nombre}'. "
-                f"Stock disponible: {producto.stock}, solicitado: {cantidad}."
-            )
-            return redirect('tienda:carrito')
+    # Validación de stock antes del pago: una consulta para todo el carrito,
+    # avisando todos los faltantes a la vez
+    revision = _revisar_carrito(request, carrito)
+    if revision['eliminados']:
+        messages.warning(request, "Se quitaron del carrito productos que ya no están disponibles.")
+        if not carrito:
+            return redirect('tienda:productos')
+    if revision['faltantes']:
+        _avisar_faltantes(request, revision['faltantes'].values())
+        return redirect('tienda:carrito')
 
     # Recalcular con promociones 
-    total = _aplicar_promos_a_carrito(carrito)
-    _save_carrito(request, carrito)
+    detalle, total = _detalle_carrito(carrito)
+    _podar_carrito(request, carrito, detalle)
+
+    # WEBPAY_ASYNC: el pago pasa por las vistas async (tienda.views_async)
+    iniciar = 'tienda:webpay_iniciar_async' if settings.WEBPAY_ASYNC else 'tienda:webpay_iniciar'
 
     return render(request, 'tienda/checkout.html', {
-        'carrito': carrito,
+        'carrito': detalle,
         'total': total,
-        'carrito_count': _carrito_cuenta_items(request)
+        'webpay_iniciar_url': reverse(iniciar),
     })
 
 
@@ -435,17 +515,12 @@ def registro_view(request):
         else:
             login(request, user, backend='django.contrib.auth.backends.ModelBackend')
 
-        # Enviar correo de bienvenida
-        try:
-            send_mail(
-                subject='¡Bienvenido a Sweet Blessing!',
-                message=f'Hola {user.first_name}, gracias por registrarte en Sweet Blessing.',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=True
-            )
-        except Exception as e:
-            print("Error enviando correo:", e)
+        # Correo de bienvenida (lo envía el comando enviar_correos)
+        correos.encolar(
+            '¡Bienvenido a Sweet Blessing!',
+            f'Hola {user.first_name}, gracias por registrarte en Sweet Blessing.',
+            [user.email],
+        )
 
         messages.success(request, 'Cuenta creada con éxito.')
         return redirect('tienda:home')
@@ -462,230 +537,333 @@ def salir_view(request):
 # ============================================================
 #  WEBPAY — SDK 6.1.0
 # ============================================================
-@login_required
-def webpay_iniciar(request):
+def _abrir_pago(request):
+    """
+    Parte de webpay_iniciar que no habla con Transbank (la comparten la
+    vista sync y la async de tienda.views_async). Devuelve
+    (pedido, total, None) o (None, None, respuesta) si no se puede pagar.
+    """
     carrito = _get_carrito(request)
 
     if not carrito:
         messages.info(request, "El carrito está vacío.")
-        return redirect('tienda:productos')
+        return None, None, redirect('tienda:productos')
 
     # Aplicar promociones antes de calcular el total
-    total = _aplicar_promos_a_carrito(carrito)
-    _save_carrito(request, carrito)
+    detalle, total = _detalle_carrito(carrito)
+    _podar_carrito(request, carrito, detalle)
 
     if total <= 0:
         messages.error(request, "Total inválido.")
-        return redirect('tienda:carrito')
+        return None, None, redirect('tienda:carrito')
 
-    pedido = Pedido.objects.create(
-        usuario=request.user,
-        total=Decimal(str(total)),
-        estado='pendiente'
-    )
+    # El pedido y la reserva de stock se crean juntos (si no alcanza el
+    # stock no queda un pedido huérfano). Volver atrás con el mismo carrito
+    # libera la reserva del intento anterior (ver pedidos.abrir_pedido).
+    cantidades = {item['id']: item['cantidad'] for item in detalle.values()}
+    try:
+        pedido = pedidos.abrir_pedido(
+            request.user, total, cantidades, cotizaciones.huella_carrito(cantidades)
+        )
+    except pedidos.StockInsuficiente as e:
+        _avisar_faltantes(request, e.faltantes)
+        return None, None, redirect('tienda:carrito')
+    except pedidos.PagoEnCurso:
+        messages.info(request, "Tu pago ya se está abriendo en Webpay. Espera unos segundos.")
+        return None, None, redirect('tienda:checkout')
 
     request.session['pedido_webpay_id'] = pedido.id
+    # Líneas tal como se cobraron; webpay_retorno las usa para el detalle
+    request.session['pedido_webpay_detalle'] = list(detalle.values())
 
     if not request.session.session_key:
         request.session.create()
 
+    return pedido, total, None
+
+
+def _redirigir_a_webpay(request, pedido, response):
+    # Desde aquí el pedido tiene un token que el cliente puede pagar:
+    # abrir_pedido ya no lo reutiliza para otra transacción
+    TransaccionWebpay.objects.create(token=response["token"], pedido=pedido, estado='iniciada')
+    return render(request, "tienda/webpay/redireccion.html", {
+        'url': response["url"],
+        'token': response["token"]
+    })
+
+
+def _error_inicio(request, pedido, e):
+    print("ERROR WEBPAY:", e)
+    pedidos.cancelar_pago(pedido.id)
+    messages.error(request, f"Error al iniciar Webpay: {e}")
+    return redirect('tienda:checkout')
+
+
+@login_required
+def webpay_iniciar(request):
+    pedido, total, respuesta = _abrir_pago(request)
+    if respuesta is not None:
+        return respuesta
+
     session_id = request.session.session_key
     buy_order = str(pedido.id)
     return_url = request.build_absolute_uri(reverse('tienda:webpay_retorno'))
 
     try:
-        options = WebpayOptions(
-            commerce_code=settings.WEBPAY_PLUS_COMMERCE_CODE,
-            api_key=settings.WEBPAY_PLUS_API_KEY,
-            integration_type="INTEGRATION"
-        )
-        tx = Transaction(options)
-        amount_int = int(round(total))
-
+        # Cliente compartido: pool de conexiones, timeouts y circuit breaker
+        tx = webpay.get_cliente()
         response = tx.create(
             buy_order=buy_order,
             session_id=session_id,
-            amount=amount_int,
+            amount=total,
             return_url=return_url
         )
 
-        return render(request, "tienda/webpay/redireccion.html", {
-            'url': response["url"],
-            'token': response["token"]
-        })
+        return _redirigir_a_webpay(request, pedido, response)
 
     except Exception as e:
-        print("ERROR WEBPAY:", e)
-        messages.error(request, f"Error al iniciar Webpay: {e}")
-        return redirect('tienda:checkout')
+        return _error_inicio(request, pedido, e)
+
+
+def _encolar_correos_pago(pedido, lineas):
+    """Comprobante para el cliente y aviso para la empresa (se envían con enviar_correos)."""
+    detalles_cliente_lines = []
+    detalles_empresa_lines = []
+
+    # Arma líneas de correo usando DESCUENTOS
+    for item in lineas:
+        producto = item['producto']
+        cantidad = item['cantidad']
+
+        # Datos calculados por _detalle_carrito (pesos enteros)
+        precio_base = round(item['precio'])
+        subtotal_base = precio_base * cantidad
+        subtotal_final = round(item.get('subtotal', subtotal_base))
+        descuento_total = round(item.get('descuento', 0))
+        etiqueta = item.get('etiqueta_promo') or ''
+
+        # ----- texto para correo cliente -----
+        if descuento_total > 0:
+            linea_cliente = (
+                f"- {producto.nombre} (x{cantidad}) → "
+                f"${subtotal_final:.0f} "
+                f"(antes: ${subtotal_base:.0f}, ahorro: ${descuento_total:.0f}"
+                f"{' - ' + etiqueta if etiqueta else ''})"
+            )
+        else:
+            linea_cliente = f"- {producto.nombre} (x{cantidad}) → ${subtotal_final:.0f}"
 
+        detalles_cliente_lines.append(linea_cliente)
 
-def webpay_retorno(request):
-    token = request.POST.get("token_ws") or request.GET.get("token_ws")
-    pedido_id = request.session.get('pedido_webpay_id')
+        # ----- texto para correo empresa -----
+        linea_empresa = (
+            f"- {producto.nombre} | Cant: {cantidad} | "
+            f"P. base: ${precio_base:.0f} | Subtotal base: ${subtotal_base:.0f} | "
+            f"Descuento: ${descuento_total:.0f} | Subtotal final: ${subtotal_final:.0f}"
+            f"{' | Promo: ' + etiqueta if etiqueta else ''}"
+        )
+        detalles_empresa_lines.append(linea_empresa)
+
+    # ============================================================
+    # CORREOS DIFERENTES A CLIENTE Y EMPRESA (se encolan; ver tienda.correos)
+    # ============================================================
+    detalles_cliente = "\n".join(detalles_cliente_lines)
+    detalles_empresa = "\n".join(detalles_empresa_lines)
+
+    total = pedido.total
+    nombre_cliente = pedido.usuario.first_name or pedido.usuario.username
+
+    # 1. CORREO PARA EL CLIENTE
+    email_cliente_subject = "Comprobante de tu compra en Sweet Blessing 🎂"
+    email_cliente_body = (
+        f"¡Hola {nombre_cliente}!\n\n"
+        f"Tu pago del pedido #{pedido.id} ha sido recibido exitosamente 🎉\n\n"
+        f"🧁 Detalle de tu compra:\n{detalles_cliente}\n\n"
+        f"💵 Total pagado: ${total}\n\n"
+        "Tu pedido está siendo preparado con cariño ❤️\n\n"
+        "Sweet Blessing"
+    )
 
-    # Caso: falta token o id de pedido
-    if not token or not pedido_id:
-        motivo = "La transacción fue anulada o faltan datos (token/pedido)."
-        return render(request, "tienda/webpay/error_pago.html", {
+    correos.encolar(email_cliente_subject, email_cliente_body, [pedido.usuario.email])
+
+    # 2. CORREO PARA LA EMPRESA
+    email_empresa_subject = f"Nuevo pedido pagado #{pedido.id}"
+    email_empresa_body = (
+        f"El cliente {nombre_cliente} ha realizado la siguiente compra:\n\n"
+        f"{detalles_empresa}\n\n"
+        f"Total cobrado: ${total}\n\n"
+        "Revisar sistema para gestionar el pedido."
+    )
+
+    correos.encolar(email_empresa_subject, email_empresa_body, [correos.EMAIL_EMPRESA])
+
+
+def _resultado_webpay(request, transaccion):
+    """Respuesta para un retorno ya registrado (recarga o reintento del navegador)."""
+    if transaccion.estado == 'aprobado':
+        return render(request, "tienda/webpay/exito.html", {
+            "pedido": transaccion.pedido,
+            "response": transaccion.respuesta,
+        })
+    if transaccion.estado == 'rechazado':
+        motivo = "El pago fue rechazado por Webpay. Por favor verifica los datos de tu tarjeta o intenta nuevamente."
+        return render(request, "tienda/webpay/rechazado.html", {
             "motivo": motivo,
-            "carrito_count": _carrito_cuenta_items(request),
         })
+    motivo = "Tu pago se está procesando. Recarga esta página en unos segundos."
+    return render(request, "tienda/webpay/error_pago.html", {
+        "motivo": motivo,
+    })
 
-    try:
-        options = WebpayOptions(
-            commerce_code=settings.WEBPAY_PLUS_COMMERCE_CODE,
-            api_key=settings.WEBPAY_PLUS_API_KEY,
-            integration_type="INTEGRATION"
-        )
-        tx = Transaction(options)
-        response = tx.commit(token)
-
-        pedido = Pedido.objects.get(id=pedido_id)
-
-        status = response.get("status")
-        response_code = response.get("response_code") or response.get("responseCode") or 1
-
-        # Pago autorizado
-        if status == "AUTHORIZED" or str(response_code) == "0":
-            pedido.estado = "pagado"
-            pedido.save()
-            carrito = request.session.get('carrito', {})
-
-            detalles_cliente_lines = []
-            detalles_empresa_lines = []
-
-            # Guarda el detalle del pedido y arma líneas de correo usando DESCUENTOS
-            for item in carrito.values():
-                producto = Producto.objects.get(id=int(item['id']))
-                cantidad = int(item['cantidad'])
-
-                # Datos base
-                precio_base = Decimal(str(item['precio']))  
-                subtotal_base = precio_base * cantidad
-
-                # Datos calculados por _aplicar_promos_a_carrito
-                subtotal_final = Decimal(str(item.get('subtotal', subtotal_base)))
-                descuento_total = Decimal(str(item.get('descuento', 0)))
-                etiqueta = item.get('etiqueta_promo') or ''
-
-                # Precio unitario final que se guardará en DetallePedido
-                if cantidad > 0:
-                    precio_unit_final = (subtotal_final / cantidad).quantize(
-                        Decimal('1.'), rounding=ROUND_HALF_UP
-                    )
-                else:
-                    precio_unit_final = precio_base
-
-                # Crear detalle de pedido con PRECIO FINAL
-                DetallePedido.objects.create(
-                    pedido=pedido,
-                    producto=producto,
-                    cantidad=cantidad,
-                    precio_unitario=precio_unit_final
-                )
 
-                # Actualizar stock
-                producto.stock = max(0, producto.stock - cantidad)
-                producto.save()
-
-                # ----- texto para correo cliente -----
-                if descuento_total > 0:
-                    linea_cliente = (
-                        f"- {producto.nombre} (x{cantidad}) → "
-                        f"${subtotal_final:.0f} "
-                        f"(antes: ${subtotal_base:.0f}, ahorro: ${descuento_total:.0f}"
-                        f"{' - ' + etiqueta if etiqueta else ''})"
-                    )
-                else:
-                    linea_cliente = f"- {producto.nombre} (x{cantidad}) → ${subtotal_final:.0f}"
-
-                detalles_cliente_lines.append(linea_cliente)
-
-                # ----- texto para correo empresa -----
-                linea_empresa = (
-                    f"- {producto.nombre} | Cant: {cantidad} | "
-                    f"P. base: ${precio_base:.0f} | Subtotal base: ${subtotal_base:.0f} | "
-                    f"Descuento: ${descuento_total:.0f} | Subtotal final: ${subtotal_final:.0f}"
-                    f"{' | Promo: ' + etiqueta if etiqueta else ''}"
-                )
-                detalles_empresa_lines.append(linea_empresa)
-
-            # Limpia sesión (carrito + id de pedido)
-            request.session['carrito'] = {}
-            if 'pedido_webpay_id' in request.session:
-                del request.session['pedido_webpay_id']
-
-            # ============================================================
-            # ENVÍO DE CORREOS DIFERENTES A CLIENTE Y EMPRESA
-            # ============================================================
-            EMAIL_EMPRESA = "sweetblessingchile@gmail.com"
-
-            detalles_cliente = "\n".join(detalles_cliente_lines)
-            detalles_empresa = "\n".join(detalles_empresa_lines)
-
-            total = pedido.total
-            nombre_cliente = pedido.usuario.first_name or pedido.usuario.username
-
-            # 1. CORREO PARA EL CLIENTE
-            email_cliente_subject = "Comprobante de tu compra en Sweet Blessing 🎂"
-            email_cliente_body = (
-                f"¡Hola {nombre_cliente}!\n\n"
-                f"Tu pago del pedido #{pedido.id} ha sido recibido exitosamente 🎉\n\n"
-                f"🧁 Detalle de tu compra:\n{detalles_cliente}\n\n"
-                f"💵 Total pagado: ${total}\n\n"
-                "Tu pedido está siendo preparado con cariño ❤️\n\n"
-                "Sweet Blessing"
-            )
+def _retorno_repetido(request, transaccion):
+    """Retorno de un token ya registrado: solo lo ve el dueño del pedido."""
+    if transaccion.pedido.usuario_id != request.user.id:
+        return render(request, "tienda/webpay/error_pago.html", {
+            "motivo": "La transacción no corresponde a tu cuenta.",
+        })
+    return _resultado_webpay(request, transaccion)
 
-            send_mail(
-                email_cliente_subject,
-                email_cliente_body,
-                settings.DEFAULT_FROM_EMAIL,
-                [pedido.usuario.email],
-                fail_silently=False,
-            )
 
-            # 2. CORREO PARA LA EMPRESA
-            email_empresa_subject = f"Nuevo pedido pagado #{pedido.id}"
-            email_empresa_body = (
-                f"El cliente {nombre_cliente} ha realizado la siguiente compra:\n\n"
-                f"{detalles_empresa}\n\n"
-                f"Total cobrado: ${total}\n\n"
-                "Revisar sistema para gestionar el pedido."
-            )
+def _retorno_sin_datos(request, pedido_id):
+    if pedido_id:
+        # El cliente anuló el pago: se devuelve el stock reservado
+        pedidos.cancelar_pago(pedido_id)
+    motivo = "La transacción fue anulada o faltan datos (token/pedido)."
+    return render(request, "tienda/webpay/error_pago.html", {
+        "motivo": motivo,
+    })
+
+
+def _error_retorno(request, e):
+    print("ERROR WEBPAY RETORNO:", str(e))
+    motivo = "Ocurrió un error inesperado al procesar el pago. Si el problema continúa, contáctanos."
+    return render(request, "tienda/webpay/error_pago.html", {
+        "motivo": motivo,
+    })
+
 
-            send_mail(
-                email_empresa_subject,
-                email_empresa_body,
-                settings.DEFAULT_FROM_EMAIL,
-                [EMAIL_EMPRESA],
-                fail_silently=False,
+def _cerrar_pago(request, transaccion, pedido_id, response):
+    """
+    Cierra el pedido según la respuesta de commit/status de Transbank (la
+    comparten la vista sync y la async de tienda.views_async).
+    """
+    status = response.get("status")
+    response_code = response.get("response_code") or response.get("responseCode") or 1
+
+    # Pago autorizado
+    if status == "AUTHORIZED" or str(response_code) == "0":
+        # Detalle, stock, correos y registro del retorno en una sola
+        # transacción (ver tienda.pedidos y tienda.correos)
+        with transaction.atomic():
+            pedido, lineas = pedidos.finalizar_pago(
+                pedido_id, request.session.get('pedido_webpay_detalle', [])
             )
+            if lineas is not None:
+                _encolar_correos_pago(pedido, lineas)
+            elif pedido.transacciones_webpay.filter(estado='aprobado').exclude(id=transaccion.id).exists():
+                # Otro token del mismo pedido ya se había cobrado
+                pedidos.marcar_revision(
+                    pedido, f"Segundo pago aprobado (token {transaccion.token}): anular en Transbank"
+                )
+            transaccion.estado = 'aprobado'
+            transaccion.respuesta = response
+            transaccion.save(update_fields=['estado', 'respuesta', 'actualizado'])
+
+        # Limpia sesión (carrito + id de pedido)
+        _save_carrito(request, {}, 0)
+        request.session.pop('pedido_webpay_id', None)
+        request.session.pop('pedido_webpay_detalle', None)
+
+        return render(request, "tienda/webpay/exito.html", {
+            "pedido": pedido,
+            "response": response,
+        })
 
-            return render(request, "tienda/webpay/exito.html", {
-                "pedido": pedido,
-                "response": response,
-                "carrito_count": _carrito_cuenta_items(request),  
-            })
+    # Pago rechazado por Webpay
+    with transaction.atomic():
+        pedidos.cancelar_pago(pedido_id)
+        transaccion.estado = 'rechazado'
+        transaccion.respuesta = response
+        transaccion.save(update_fields=['estado', 'respuesta', 'actualizado'])
+    motivo = "El pago fue rechazado por Webpay. Por favor verifica los datos de tu tarjeta o intenta nuevamente."
+    return render(request, "tienda/webpay/rechazado.html", {
+        "motivo": motivo,
+    })
 
-        # Pago rechazado por Webpay
-        else:
-            pedido.estado = "rechazado"
-            pedido.save()
-            motivo = "El pago fue rechazado por Webpay. Por favor verifica los datos de tu tarjeta o intenta nuevamente."
-            return render(request, "tienda/webpay/rechazado.html", {
-                "motivo": motivo,
-                "carrito_count": _carrito_cuenta_items(request),
-            })
+
+def _tomar_token(request, token, pedido_id):
+    """
+    Deja la transacción de `token` en 'procesando' para que solo esta
+    petición hable con Transbank (la comparten la vista sync y la async).
+    Devuelve (transaccion, None), o (None, respuesta) si el retorno ya se
+    procesó, se está procesando o no corresponde al usuario.
+    """
+    transaccion = TransaccionWebpay.objects.select_related('pedido').filter(token=token).first()
+
+    if transaccion is None:
+        # Token sin registrar al iniciar (pagos abiertos antes de registrarlos)
+        if not pedido_id:
+            return None, _retorno_sin_datos(request, pedido_id)
+        try:
+            return TransaccionWebpay.objects.create(token=token, pedido_id=pedido_id), None
+        except IntegrityError:
+            transaccion = TransaccionWebpay.objects.select_related('pedido').get(token=token)
+            return None, _resultado_webpay(request, transaccion)
+
+    # Retorno repetido: se responde con lo registrado la primera vez, sin
+    # volver a confirmar en Transbank ni cerrar el pedido de nuevo.
+    if transaccion.estado != 'iniciada' or transaccion.pedido.usuario_id != request.user.id:
+        return None, _retorno_repetido(request, transaccion)
+
+    # Las peticiones que lleguen en paralelo pierden el UPDATE condicional
+    # y ven "procesando".
+    if not TransaccionWebpay.objects.filter(id=transaccion.id, estado='iniciada').update(estado='procesando'):
+        transaccion.refresh_from_db()
+        return None, _resultado_webpay(request, transaccion)
+    transaccion.estado = 'procesando'
+    return transaccion, None
+
+
+def _soltar_token(transaccion):
+    """
+    Sin resultado de Transbank: el token vuelve a 'iniciada' para que un
+    reintento vuelva a consultar (y el pedido sigue sin reutilizarse).
+    Solo si sigue 'procesando': un error posterior al cierre (ya aprobado
+    o rechazado) no debe reabrirlo.
+    """
+    TransaccionWebpay.objects.filter(id=transaccion.id, estado='procesando').update(estado='iniciada')
+
+
+def webpay_retorno(request):
+    token = request.POST.get("token_ws") or request.GET.get("token_ws")
+    pedido_id = request.session.get('pedido_webpay_id')
+
+    # Caso: falta token (el cliente anuló el pago)
+    if not token:
+        return _retorno_sin_datos(request, pedido_id)
+
+    transaccion, respuesta = _tomar_token(request, token, pedido_id)
+    if respuesta is not None:
+        return respuesta
+
+    try:
+        # Cliente compartido: pool de conexiones, timeouts y circuit breaker
+        tx = webpay.get_cliente()
+        try:
+            response = tx.commit(token)
+        except TransactionCommitError as e:
+            # 422: ya se había confirmado (p. ej. se perdió la respuesta);
+            # el resultado se recupera con status
+            if e.code != 422:
+                raise
+            response = tx.status(token)
+
+        return _cerrar_pago(request, transaccion, transaccion.pedido_id, response)
 
     except Exception as e:
-        print("ERROR WEBPAY RETORNO:", str(e))
-        motivo = "Ocurrió un error inesperado al procesar el pago. Si el problema continúa, contáctanos."
-        return render(request, "tienda/webpay/error_pago.html", {
-            "motivo": motivo,
-            "carrito_count": _carrito_cuenta_items(request),
-        })
+        _soltar_token(transaccion)
+        return _error_retorno(request, e)
 
 # ============================================================
 # Cuentas  (restablecer contraseña)
@@ -0,0 +1,98 @@
+"""
+Flujo Webpay async (servir con ASGI: pasteleria.asgi).
+
+Las vistas de tienda.views bloquean un hilo durante todo el viaje de ida
+y vuelta a Transbank. Estas hacen lo mismo, pero esperan create/commit/
+status con ClienteWebpayAsync (aiohttp), así que un solo worker ASGI
+atiende muchos pagos en curso a la vez.
+
+La lógica del pedido (reserva de stock, cierre, correos, sesión) es la
+misma de tienda.views: esos pasos usan transaction.atomic(), que el ORM
+async no soporta, así que cada uno corre entero (con su atomic adentro)
+en un hilo del pool con _en_hilo. No se usa el sync_to_async por defecto
+(thread_sensitive=True): manda todos los pasos de todos los requests al
+mismo hilo y los pagos vuelven a quedar en fila.
+
+Se activan con WEBPAY_ASYNC=1 (el checkout apunta a estas URLs).
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.db import close_old_connections
+from django.urls import reverse
+
+from transbank.error.transaction_commit_error import TransactionCommitError
+
+from . import views, webpay
+
+
+def _en_hilo(funcion):
+    """
+    sync_to_async(thread_sensitive=False): el paso corre en cualquier hilo
+    del pool. Como en un request síncrono, se cierran las conexiones
+    vencidas o rotas antes y después (CONN_MAX_AGE), porque las señales
+    request_started/request_finished no pasan por esos hilos.
+    """
+    @wraps(funcion)
+    def paso(*args, **kwargs):
+        close_old_connections()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(paso, thread_sensitive=False)
+
+
+@login_required
+async def webpay_iniciar(request):
+    pedido, total, respuesta = await _en_hilo(views._abrir_pago)(request)
+    if respuesta is not None:
+        return respuesta
+
+    session_id = request.session.session_key
+    buy_order = str(pedido.id)
+    return_url = request.build_absolute_uri(reverse('tienda:webpay_retorno_async'))
+
+    try:
+        response = await webpay.get_cliente_async().create(
+            buy_order=buy_order,
+            session_id=session_id,
+            amount=total,
+            return_url=return_url
+        )
+    except Exception as e:
+        return await _en_hilo(views._error_inicio)(request, pedido, e)
+
+    return await _en_hilo(views._redirigir_a_webpay)(request, pedido, response)
+
+
+async def webpay_retorno(request):
+    token = request.POST.get("token_ws") or request.GET.get("token_ws")
+    pedido_id = await request.session.aget('pedido_webpay_id')
+
+    if not token:
+        return await _en_hilo(views._retorno_sin_datos)(request, pedido_id)
+
+    # Solo una petición por token llega a Transbank (ver views._tomar_token)
+    transaccion, respuesta = await _en_hilo(views._tomar_token)(request, token, pedido_id)
+    if respuesta is not None:
+        return respuesta
+
+    try:
+        tx = webpay.get_cliente_async()
+        try:
+            response = await tx.commit(token)
+        except TransactionCommitError as e:
+            # 422: ya se había confirmado; el resultado se recupera con status
+            if e.code != 422:
+                raise
+            response = await tx.status(token)
+
+        return await _en_hilo(views._cerrar_pago)(request, transaccion, transaccion.pedido_id, response)
+
+    except Exception as e:
+        # Sin resultado: un reintento vuelve a consultar
+        await _en_hilo(views._soltar_token)(transaccion)
+        return await _en_hilo(views._error_retorno)(request, e)
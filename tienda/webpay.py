@@ -0,0 +1,296 @@
+"""
+Cliente Webpay Plus compartido por todo el proceso.
+
+El SDK de Transbank (6.1.0) crea una conexión HTTP nueva en cada llamada,
+con un timeout de 600 s y el host fijo según el ambiente. Este cliente
+usa los mismos endpoints, esquemas y errores del SDK, pero con:
+
+  - una requests.Session con pool de conexiones (keep-alive) reutilizada
+    entre requests, creada una sola vez por get_cliente()
+  - timeouts de conexión y lectura (WEBPAY_TIMEOUT_CONEXION / _LECTURA)
+  - un circuit breaker: tras WEBPAY_CIRCUITO_FALLOS fallos seguidos
+    (timeouts, errores de red o 5xx) deja de llamar a Transbank durante
+    WEBPAY_CIRCUITO_ESPERA segundos y falla de inmediato con CircuitoAbierto
+  - host configurable (WEBPAY_PLUS_HOST), para apuntar al servidor falso
+    de tienda.webpay_falso en pruebas y pruebas de carga
+
+create/commit/status devuelven el mismo dict que Transaction del SDK.
+ClienteWebpayAsync (get_cliente_async) hace lo mismo con aiohttp para las
+vistas async de tienda.views_async; ambos comparten la construcción de las
+peticiones y la interpretación de las respuestas.
+"""
+import asyncio
+import json
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from requests.adapters import HTTPAdapter
+from transbank.common.api_constants import ApiConstants
+from transbank.common.headers_builder import HeadersBuilder
+from transbank.common.integration_type import IntegrationType, webpay_host
+from transbank.common.options import WebpayOptions
+from transbank.common.validation_util import ValidationUtil
+from transbank.error.transaction_commit_error import TransactionCommitError
+from transbank.error.transaction_create_error import TransactionCreateError
+from transbank.error.transaction_status_error import TransactionStatusError
+from transbank.error.transbank_error import TransbankError
+from transbank.webpay.webpay_plus.request import TransactionCreateRequest
+from transbank.webpay.webpay_plus.schema import TransactionCreateRequestSchema
+
+
+TRANSACCIONES = ApiConstants.WEBPAY_ENDPOINT + '/transactions/'
+
+
+class CircuitoAbierto(TransbankError):
+    pass
+
+
+class Circuito:
+    """Circuit breaker simple por proceso (cerrado -> abierto -> prueba)."""
+
+    def __init__(self, fallos_max=5, espera=30):
+        self.fallos_max = fallos_max
+        self.espera = espera
+        self.fallos = 0
+        self.abierto_hasta = None
+        # Mientras la llamada de prueba no termina, las demás se rechazan.
+        # Vence igual que el circuito, por si la prueba nunca informa.
+        self.prueba_hasta = None
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        with self._lock:
+            ahora = time.monotonic()
+            if self.prueba_hasta is not None and ahora < self.prueba_hasta:
+                return False
+            if self.abierto_hasta is None and self.prueba_hasta is None:
+                return True
+            if self.abierto_hasta is None or ahora >= self.abierto_hasta:
+                # Pasado el plazo se deja pasar una sola llamada de prueba;
+                # si falla, fallo() vuelve a abrir el circuito.
+                self.abierto_hasta = None
+                self.prueba_hasta = ahora + self.espera
+                self.fallos = self.fallos_max - 1
+                return True
+            return False
+
+    def exito(self):
+        with self._lock:
+            self.fallos = 0
+            self.abierto_hasta = None
+            self.prueba_hasta = None
+
+    def fallo(self):
+        with self._lock:
+            self.fallos += 1
+            self.prueba_hasta = None
+            if self.fallos >= self.fallos_max:
+                self.abierto_hasta = time.monotonic() + self.espera
+
+    @property
+    def abierto(self):
+        with self._lock:
+            return self.abierto_hasta is not None and time.monotonic() < self.abierto_hasta
+
+
+def _peticion_create(buy_order, session_id, amount, return_url):
+    ValidationUtil.has_text_with_max_length(buy_order, ApiConstants.BUY_ORDER_LENGTH, "buy_order")
+    ValidationUtil.has_text_with_max_length(session_id, ApiConstants.SESSION_ID_LENGTH, "session_id")
+    ValidationUtil.has_text_with_max_length(return_url, ApiConstants.RETURN_URL_LENGTH, "return_url")
+    cuerpo = TransactionCreateRequestSchema().dumps(
+        TransactionCreateRequest(buy_order, session_id, amount, return_url)
+    )
+    return 'POST', TRANSACCIONES, cuerpo, TransactionCreateError
+
+
+def _peticion_commit(token):
+    ValidationUtil.has_text_with_max_length(token, ApiConstants.TOKEN_LENGTH, "token")
+    return 'PUT', TRANSACCIONES + token, '{}', TransactionCommitError
+
+
+def _peticion_status(token):
+    ValidationUtil.has_text_with_max_length(token, ApiConstants.TOKEN_LENGTH, "token")
+    return 'GET', TRANSACCIONES + token, None, TransactionStatusError
+
+
+def _interpretar(circuito, codigo, texto, error):
+    """Misma interpretación que transbank.common.request_service."""
+    try:
+        datos = json.loads(texto) if texto else None
+    except ValueError:
+        # Una página de error de un proxy o balanceador, no una respuesta
+        # de Transbank: cuenta como caída aunque venga con 2xx/4xx
+        circuito.fallo()
+        raise error(f"Respuesta inválida de Webpay ({codigo}): {texto}", codigo)
+
+    # Los 4xx son errores de la transacción, no de disponibilidad
+    if codigo >= 500:
+        circuito.fallo()
+    else:
+        circuito.exito()
+
+    if datos is None:
+        return codigo
+    if codigo not in (200, 299):
+        mensaje = datos.get('error_message') or datos.get('description') or texto
+        raise error(mensaje, codigo)
+    return datos
+
+
+def _verificar_circuito(circuito):
+    if not circuito.permitir():
+        raise CircuitoAbierto("Webpay no está respondiendo; intenta nuevamente en unos minutos.", 503)
+
+
+class ClienteWebpay:
+    def __init__(self, commerce_code, api_key, host, timeout=(3.05, 15), pool=10,
+                 fallos_max=5, espera=30):
+        self.options = WebpayOptions(commerce_code, api_key, IntegrationType.TEST, timeout)
+        self.host = host.rstrip('/')
+        self.circuito = Circuito(fallos_max, espera)
+
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=pool)
+        self.session.mount('https://', adaptador)
+        self.session.mount('http://', adaptador)
+        self.session.headers.update(HeadersBuilder.build(self.options))
+
+    def _pedir(self, metodo, endpoint, cuerpo, error):
+        _verificar_circuito(self.circuito)
+        try:
+            respuesta = self.session.request(
+                metodo, self.host + endpoint, data=cuerpo, timeout=self.options.timeout
+            )
+        except requests.RequestException as e:
+            self.circuito.fallo()
+            raise error(f"Sin respuesta de Webpay: {e}", 0)
+        return _interpretar(self.circuito, respuesta.status_code, respuesta.text, error)
+
+    def create(self, buy_order, session_id, amount, return_url):
+        return self._pedir(*_peticion_create(buy_order, session_id, amount, return_url))
+
+    def commit(self, token):
+        return self._pedir(*_peticion_commit(token))
+
+    def status(self, token):
+        return self._pedir(*_peticion_status(token))
+
+
+class ClienteWebpayAsync:
+    """
+    Igual que ClienteWebpay, pero con aiohttp para las vistas async
+    (tienda.views_async): mientras espera a Transbank no ocupa un hilo.
+    La sesión HTTP pertenece al event loop en que se creó, así que se
+    vuelve a crear si cambia el loop (p. ej. entre asyncio.run de tests).
+    Requiere aiohttp, que solo se importa al crear el cliente: sin
+    WEBPAY_ASYNC=1 no hace falta instalarlo.
+    """
+
+    def __init__(self, commerce_code, api_key, host, timeout=(3.05, 15), pool=100,
+                 fallos_max=5, espera=30):
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImproperlyConfigured(
+                "WEBPAY_ASYNC=1 usa el cliente Webpay async, que requiere aiohttp "
+                "(pip install aiohttp). Instálalo o desactiva WEBPAY_ASYNC."
+            )
+        self._aiohttp = aiohttp
+        self.options = WebpayOptions(commerce_code, api_key, IntegrationType.TEST, timeout)
+        self.host = host.rstrip('/')
+        self.pool = pool
+        self.circuito = Circuito(fallos_max, espera)
+        self._session = None
+        self._loop = None
+
+    def _sesion(self):
+        aiohttp = self._aiohttp
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            conexion, lectura = self.options.timeout
+            self._session = aiohttp.ClientSession(
+                headers=HeadersBuilder.build(self.options),
+                timeout=aiohttp.ClientTimeout(sock_connect=conexion, sock_read=lectura),
+                connector=aiohttp.TCPConnector(limit=self.pool),
+            )
+            self._loop = loop
+        return self._session
+
+    async def _pedir(self, metodo, endpoint, cuerpo, error):
+        _verificar_circuito(self.circuito)
+        try:
+            async with self._sesion().request(metodo, self.host + endpoint, data=cuerpo) as respuesta:
+                codigo = respuesta.status
+                texto = await respuesta.text()
+        except (self._aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.circuito.fallo()
+            raise error(f"Sin respuesta de Webpay: {e}", 0)
+        return _interpretar(self.circuito, codigo, texto, error)
+
+    async def create(self, buy_order, session_id, amount, return_url):
+        return await self._pedir(*_peticion_create(buy_order, session_id, amount, return_url))
+
+    async def commit(self, token):
+        return await self._pedir(*_peticion_commit(token))
+
+    async def status(self, token):
+        return await self._pedir(*_peticion_status(token))
+
+    async def cerrar(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+_clientes = {}
+_lock = threading.Lock()
+
+
+def _host_configurado():
+    host = getattr(settings, 'WEBPAY_PLUS_HOST', '')
+    if host:
+        return host
+    if getattr(settings, 'WEBPAY_PLUS_ENVIRONMENT', 'INTEGRATION') in ('LIVE', 'PRODUCCION'):
+        return webpay_host(IntegrationType.LIVE)
+    return webpay_host(IntegrationType.TEST)
+
+
+def _crear(clase):
+    return clase(
+        settings.WEBPAY_PLUS_COMMERCE_CODE,
+        settings.WEBPAY_PLUS_API_KEY,
+        _host_configurado(),
+        timeout=(
+            getattr(settings, 'WEBPAY_TIMEOUT_CONEXION', 3.05),
+            getattr(settings, 'WEBPAY_TIMEOUT_LECTURA', 15),
+        ),
+        pool=getattr(settings, 'WEBPAY_POOL', 10 if clase is ClienteWebpay else 100),
+        fallos_max=getattr(settings, 'WEBPAY_CIRCUITO_FALLOS', 5),
+        espera=getattr(settings, 'WEBPAY_CIRCUITO_ESPERA', 30),
+    )
+
+
+def _obtener(clase):
+    cliente = _clientes.get(clase)
+    if cliente is None:
+        with _lock:
+            cliente = _clientes.get(clase)
+            if cliente is None:
+                cliente = _clientes[clase] = _crear(clase)
+    return cliente
+
+
+def get_cliente():
+    return _obtener(ClienteWebpay)
+
+
+def get_cliente_async():
+    return _obtener(ClienteWebpayAsync)
+
+
+def reiniciar_cliente():
+    """Descarta los clientes (p. ej. en tests, después de cambiar settings)."""
+    with _lock:
+        _clientes.clear()
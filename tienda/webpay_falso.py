@@ -0,0 +1,191 @@
+"""
+Servidor Webpay Plus falso para pruebas y pruebas de carga.
+
+Implementa lo que usa la tienda de la API REST de Transbank:
+
+  POST {WEBPAY_ENDPOINT}/transactions/          crear transacción
+  PUT  {WEBPAY_ENDPOINT}/transactions/<token>   confirmar (commit)
+  GET  {WEBPAY_ENDPOINT}/transactions/<token>   estado
+
+y el formulario de pago (/webpayserver/initTransaction), que en vez de
+pedir la tarjeta redirige de inmediato al return_url con token_ws.
+
+Solo usa la biblioteca estándar, así que también sirve fuera de Django
+(test_webpay.py). Con Django: `manage.py webpay_falso` y
+WEBPAY_PLUS_HOST=http://127.0.0.1:8765.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode
+
+
+WEBPAY_ENDPOINT = '/rswebpaytransaction/api/webpay/v1.2'
+RUTA_TRANSACCION = re.compile(re.escape(WEBPAY_ENDPOINT) + r'/transactions/(?P<token>[^/]*)$')
+RUTA_FORMULARIO = '/webpayserver/initTransaction'
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive, como el Webpay real
+
+    def log_message(self, formato, *args):
+        if self.server.verboso:
+            super().log_message(formato, *args)
+
+    def _json(self, status, datos):
+        cuerpo = json.dumps(datos).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _leer(self):
+        largo = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(largo) if largo else b''
+
+    def _simular_red(self):
+        """Latencia y errores 5xx configurables. Devuelve True si respondió con error."""
+        if self.server.latencia:
+            time.sleep(self.server.latencia)
+        if self.server.errores and random.random() < self.server.errores:
+            self._json(503, {'error_message': 'Servicio no disponible (simulado)'})
+            return True
+        return False
+
+    def do_POST(self):
+        if self.path == RUTA_FORMULARIO:
+            return self._formulario(self._leer())
+        if self.path != WEBPAY_ENDPOINT + '/transactions/':
+            return self._json(404, {'error_message': 'Not found'})
+
+        datos = json.loads(self._leer() or b'{}')
+        if self._simular_red():
+            return
+        if not self.headers.get('Tbk-Api-Key-Id') or not self.headers.get('Tbk-Api-Key-Secret'):
+            return self._json(401, {'error_message': 'Not Authorized'})
+
+        token = uuid.uuid4().hex + uuid.uuid4().hex[:32]
+        with self.server.lock:
+            self.server.transacciones[token] = {
+                'buy_order': datos.get('buy_order'),
+                'session_id': datos.get('session_id'),
+                'amount': int(float(datos.get('amount') or 0)),
+                'return_url': datos.get('return_url'),
+                'status': 'INITIALIZED',
+            }
+            self.server.contadores['create'] += 1
+        self._json(200, {
+            'token': token,
+            'url': f'http://{self.headers.get("Host")}{RUTA_FORMULARIO}',
+        })
+
+    def do_PUT(self):
+        ruta = RUTA_TRANSACCION.match(self.path)
+        if not ruta:
+            return self._json(404, {'error_message': 'Not found'})
+        self._leer()
+        if self._simular_red():
+            return
+
+        token = ruta.group('token')
+        with self.server.lock:
+            self.server.contadores['commit'] += 1
+            tx = self.server.transacciones.get(token)
+            if tx is None:
+                return self._json(422, {'error_message': 'Transaction not found'})
+            if tx['status'] != 'INITIALIZED':
+                return self._json(422, {
+                    'error_message': f"Invalid status '{tx['status']}' for transaction while authorizing",
+                })
+            aprobado = not self.server.rechazar
+            tx.update({
+                'status': 'AUTHORIZED' if aprobado else 'FAILED',
+                'response_code': 0 if aprobado else -1,
+                'authorization_code': f'{random.randint(0, 999999):06d}' if aprobado else '000000',
+                'transaction_date': datetime.now(timezone.utc).isoformat(),
+            })
+            respuesta = self._detalle(tx)
+        self._json(200, respuesta)
+
+    def do_GET(self):
+        ruta = RUTA_TRANSACCION.match(self.path)
+        if not ruta:
+            return self._json(404, {'error_message': 'Not found'})
+        if self._simular_red():
+            return
+        with self.server.lock:
+            self.server.contadores['status'] += 1
+            tx = self.server.transacciones.get(ruta.group('token'))
+            if tx is None:
+                return self._json(422, {'error_message': 'Transaction not found'})
+            respuesta = self._detalle(tx)
+        self._json(200, respuesta)
+
+    def _detalle(self, tx):
+        return {
+            'vci': 'TSY' if tx['status'] == 'AUTHORIZED' else '',
+            'amount': tx['amount'],
+            'status': tx['status'],
+            'buy_order': tx['buy_order'],
+            'session_id': tx['session_id'],
+            'card_detail': {'card_number': '6623'},
+            'accounting_date': datetime.now().strftime('%m%d'),
+            'transaction_date': tx.get('transaction_date'),
+            'authorization_code': tx.get('authorization_code'),
+            'payment_type_code': 'VD',
+            'response_code': tx.get('response_code'),
+            'installments_number': 0,
+        }
+
+    def _formulario(self, cuerpo):
+        """El "pago": devuelve al comercio con token_ws, como Webpay."""
+        token = parse_qs(cuerpo.decode()).get('token_ws', [''])[0]
+        with self.server.lock:
+            tx = self.server.transacciones.get(token)
+        if tx is None:
+            return self._json(422, {'error_message': 'Transaction not found'})
+
+        separador = '&' if '?' in tx['return_url'] else '?'
+        self.send_response(302)
+        self.send_header('Location', f"{tx['return_url']}{separador}{urlencode({'token_ws': token})}")
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class ServidorWebpayFalso(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', puerto=0, latencia=0.0, errores=0.0,
+                 rechazar=False, verboso=False):
+        super().__init__((host, puerto), _Manejador)
+        self.latencia = latencia
+        self.errores = errores
+        self.rechazar = rechazar
+        self.verboso = verboso
+        self.transacciones = {}
+        self.contadores = {'create': 0, 'commit': 0, 'status': 0}
+        self.lock = threading.Lock()
+        self._hilo = None
+
+    @property
+    def url(self):
+        host, puerto = self.server_address[:2]
+        return f'http://{host}:{puerto}'
+
+    def iniciar(self):
+        """Atiende en un hilo de fondo (tests). Devuelve la URL base."""
+        self._hilo = threading.Thread(target=self.serve_forever, daemon=True)
+        self._hilo.start()
+        return self.url
+
+    def detener(self):
+        self.shutdown()
+        self.server_close()
+        if self._hilo is not None:
+            self._hilo.join()